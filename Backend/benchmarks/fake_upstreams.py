@@ -0,0 +1,265 @@
+"""
+Local stand-ins for Nominatim, Overpass, Open-Meteo and Google Translate,
+served from one aiohttp app under a path prefix per upstream:
+
+    http://127.0.0.1:<port>/nominatim   -> NOMINATIM_URL
+    http://127.0.0.1:<port>/overpass    -> OVERPASS_URL
+    http://127.0.0.1:<port>/open-meteo  -> OPEN_METEO_URL
+    http://127.0.0.1:<port>/translate   -> TRANSLATE_URL
+
+Responses are deterministic for a given request (seeded from it), so caches
+behave as they would against the real services. Latency, error rate and
+payload sizes are configurable, globally or per upstream:
+
+    python benchmarks/fake_upstreams.py --port 8901 --latency 0.05 \
+        --latency overpass=0.8 --error-rate translate=0.02 --overpass-elements 20000
+"""
+import re
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from aiohttp import web
+
+UPSTREAMS = ("nominatim", "overpass", "open_meteo", "translate")
+PREFIXES = {"nominatim": "/nominatim", "overpass": "/overpass", "open_meteo": "/open-meteo", "translate": "/translate"}
+
+TOURISM_VALUES = ("museum", "attraction", "viewpoint", "gallery", "artwork", "zoo", "theme_park", "hotel")
+NON_ASCII_NAMES = ("東京タワー", "Musée d'Orsay", "Кремль", "Schloß Charlottenburg", "Café Größe", "博物館", "Πλάκα")
+
+BBOX_RE = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+AROUND_RE = re.compile(r"around:(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)")
+
+
+def env_for(base_url):
+    """The environment variables that point the backend at a fake server."""
+    base_url = base_url.rstrip("/")
+    return {
+        "NOMINATIM_URL": base_url + PREFIXES["nominatim"],
+        "OVERPASS_URL": base_url + PREFIXES["overpass"],
+        "OPEN_METEO_URL": base_url + PREFIXES["open_meteo"],
+        "TRANSLATE_URL": base_url + PREFIXES["translate"],
+    }
+
+
+def _rng(*parts):
+    return random.Random(hashlib.sha1(repr(parts).encode("utf-8")).digest())
+
+
+def _per_upstream(values, default):
+    """Parse repeated `--opt 0.1` / `--opt overpass=0.5` values into {upstream: value}."""
+    values = [value.rpartition("=") for value in values or []]
+    result = dict.fromkeys(UPSTREAMS, default)
+    for name, _, number in values:  # global values first, so per-upstream ones win
+        if not name:
+            result = dict.fromkeys(UPSTREAMS, float(number))
+    for name, _, number in values:
+        if name:
+            name = name.replace("-", "_")
+            if name not in result:
+                raise SystemExit(f"unknown upstream {name!r}; expected one of {', '.join(UPSTREAMS)}")
+            result[name] = float(number)
+    return result
+
+
+class FakeUpstreams:
+    def __init__(self, latency, jitter, error_rate, overpass_elements=2000, cities_per_query=25,
+                 non_ascii_ratio=0.2, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.overpass_elements = overpass_elements
+        self.cities_per_query = cities_per_query
+        self.non_ascii_ratio = non_ascii_ratio
+        self.random = random.Random(seed)
+        self.counts = dict.fromkeys(UPSTREAMS, 0)
+        self._bodies = OrderedDict()  # generated payloads, so the fake itself stays cheap
+
+    def app(self):
+        app = web.Application(middlewares=[self._conditions])
+        app.router.add_get(PREFIXES["nominatim"] + "/search", self.nominatim)
+        app.router.add_post(PREFIXES["overpass"] + "/api/interpreter", self.overpass)
+        app.router.add_get(PREFIXES["open_meteo"] + "/v1/forecast", self.open_meteo)
+        app.router.add_get(PREFIXES["translate"] + "/translate_a/single", self.translate)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    @web.middleware
+    async def _conditions(self, request, handler):
+        upstream = next((name for name, prefix in PREFIXES.items() if request.path.startswith(prefix)), None)
+        if upstream is None:
+            return await handler(request)
+        self.counts[upstream] += 1
+        delay = self.latency[upstream] + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate[upstream]:
+            return web.json_response({"reason": "fake upstream error"}, status=503)
+        return await handler(request)
+
+    def _cached(self, key, build):
+        body = self._bodies.get(key)
+        if body is None:
+            body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._bodies[key] = body
+            while len(self._bodies) > 512:
+                self._bodies.popitem(last=False)
+        return web.Response(body=body, content_type="application/json")
+
+    async def stats(self, request):
+        return web.json_response(self.counts)
+
+    async def nominatim(self, request):
+        query = request.query.get("q", "")
+
+        def build():
+            rng = _rng("nominatim", query)
+            lat, lon = rng.uniform(-60, 70), rng.uniform(-170, 170)
+            return [{
+                "lat": f"{lat:.6f}", "lon": f"{lon:.6f}",
+                "boundingbox": [f"{lat - 0.05:.6f}", f"{lat + 0.05:.6f}", f"{lon - 0.07:.6f}", f"{lon + 0.07:.6f}"],
+                "display_name": query,
+                "address": {"city": query.split(",")[0].title(), "state": "Bench State", "country": "Benchland"},
+            }]
+        return self._cached(("nominatim", query), build)
+
+    async def overpass(self, request):
+        query = (await request.read()).decode("utf-8")
+        around = AROUND_RE.search(query)
+        if "place=city" in query and around:
+            radius_m, lat, lon = (float(value) for value in around.groups())
+            return self._cached(("cities", radius_m, lat, lon), lambda: {"elements": self._cities(radius_m, lat, lon)})
+        bbox = BBOX_RE.search(query)
+        if not bbox:
+            return web.json_response({"remark": "unsupported query"}, status=400)
+        south, west, north, east = (float(value) for value in bbox.groups())
+        return self._cached(("pois", south, west, north, east),
+                            lambda: {"elements": self._pois(south, west, north, east)})
+
+    def _pois(self, south, west, north, east):
+        rng = _rng("pois", south, west, north, east)
+        elements = []
+        for i in range(self.overpass_elements):
+            lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+            tags = {"name": f"Bench Place {i}"}
+            if rng.random() < self.non_ascii_ratio:
+                tags["name"] = f"{rng.choice(NON_ASCII_NAMES)} {i}"
+            if rng.random() < 0.3:
+                tags["amenity"] = "restaurant"
+                tags["cuisine"] = rng.choice(("french", "japanese", "italian", "local"))
+            else:
+                tags["tourism"] = rng.choice(TOURISM_VALUES)
+            tags["opening_hours"] = "Mo-Su 09:00-18:00"
+            tags["website"] = f"https://example.org/place/{i}"
+            osm_id = rng.randrange(1, 10**10)
+            if rng.random() < 0.7:
+                elements.append({"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": tags})
+            else:
+                elements.append({"type": "way", "id": osm_id, "center": {"lat": lat, "lon": lon}, "tags": tags})
+        return elements
+
+    def _cities(self, radius_m, lat, lon):
+        rng = _rng("cities", lat, lon)
+        spread = radius_m / 111_000
+        return [
+            {"type": "node", "id": 9 * 10**9 + i, "lat": lat + rng.uniform(-spread, spread) * 0.7,
+             "lon": lon + rng.uniform(-spread, spread) * 0.7,
+             "tags": {"name": f"Bench City {i}", "place": "city"}}
+            for i in range(self.cities_per_query)
+        ]
+
+    async def open_meteo(self, request):
+        params = request.query
+        lats = params.get("latitude", "0").split(",")
+        lons = params.get("longitude", "0").split(",")
+        days = int(params.get("forecast_days", 10))
+        hours = int(params.get("forecast_hours", days * 24))
+        hourly = [name for name in params.get("hourly", "").split(",") if name]
+        daily = [name for name in params.get("daily", "").split(",") if name]
+        key = ("meteo", tuple(lats), tuple(lons), days, hours, tuple(hourly), tuple(daily))
+
+        def one(lat, lon):
+            rng = _rng("meteo", lat, lon)
+            start = date.today()
+            forecast = {"latitude": float(lat), "longitude": float(lon), "timezone": "GMT", "elevation": 10.0}
+            if hourly:
+                times = [f"{start + timedelta(days=h // 24)}T{h % 24:02d}:00" for h in range(hours)]
+                forecast["hourly"] = {"time": times,
+                                      **{name: [round(rng.uniform(0, 30), 1) for _ in times] for name in hourly}}
+            if daily:
+                times = [str(start + timedelta(days=d)) for d in range(days)]
+                forecast["daily"] = {
+                    "time": times,
+                    **{name: ([f"{t}T07:00" for t in times] if name in ("sunrise", "sunset")
+                              else [round(rng.uniform(0, 30), 1) for _ in times]) for name in daily},
+                }
+            return forecast
+
+        def build():
+            forecasts = [one(lat, lon) for lat, lon in zip(lats, lons)]
+            return forecasts if len(forecasts) > 1 else forecasts[0]
+        return self._cached(key, build)
+
+    async def translate(self, request):
+        lines = request.query.get("q", "").split("\n")
+        segments = [[f"EN {line}" + ("\n" if i < len(lines) - 1 else ""), line] for i, line in enumerate(lines)]
+        return web.json_response([segments, None, "auto"])
+
+
+def add_arguments(parser):
+    """The fake's options (everything but host/port), shared with benchmarks/run.py."""
+    parser.add_argument("--latency", action="append", metavar="[UPSTREAM=]SECONDS",
+                        help="added latency, for all upstreams or one (repeatable)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency, seconds")
+    parser.add_argument("--error-rate", action="append", metavar="[UPSTREAM=]FRACTION",
+                        help="share of requests answered with 503 (repeatable)")
+    parser.add_argument("--overpass-elements", type=int, default=2000, help="elements per attractions tile query")
+    parser.add_argument("--cities-per-query", type=int, default=25)
+    parser.add_argument("--non-ascii-ratio", type=float, default=0.2, help="share of names that need translating")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def fake_argv(args):
+    """Command-line arguments reproducing the fake options in `args`."""
+    argv = []
+    for value in args.latency or []:
+        argv += ["--latency", value]
+    for value in args.error_rate or []:
+        argv += ["--error-rate", value]
+    argv += ["--jitter", str(args.jitter), "--overpass-elements", str(args.overpass_elements),
+             "--cities-per-query", str(args.cities_per_query), "--non-ascii-ratio", str(args.non_ascii_ratio),
+             "--seed", str(args.seed)]
+    return argv
+
+
+def from_args(args):
+    return FakeUpstreams(
+        latency=_per_upstream(args.latency, 0.0),
+        jitter=args.jitter,
+        error_rate=_per_upstream(args.error_rate, 0.0),
+        overpass_elements=args.overpass_elements,
+        cities_per_query=args.cities_per_query,
+        non_ascii_ratio=args.non_ascii_ratio,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Nominatim, Overpass, Open-Meteo and Translate.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    args = add_arguments(parser).parse_args()
+    fakes = from_args(args)
+    base_url = f"http://{args.host}:{args.port}"
+    for name, value in env_for(base_url).items():
+        print(f"{name}={value}", flush=True)
+    web.run_app(fakes.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
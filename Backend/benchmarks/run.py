@@ -0,0 +1,305 @@
+"""
+Load benchmark for the external-data endpoints and itinerary CRUD.
+
+Starts the fake upstreams (benchmarks/fake_upstreams.py) and the backend
+pointed at them, registers a throwaway user, drives each endpoint at the
+given concurrency and reports throughput and p50/p95/p99 latency:
+
+    cd Backend
+    python benchmarks/run.py --concurrency 50 --duration 20 --overpass-elements 20000
+
+The backend uses the configured database and cache, so point it at a
+scratch database (--settings, migrated beforehand). --target benchmarks a
+server you started yourself; it must already use the fake upstreams (run
+fake_upstreams.py, which prints the environment to set).
+
+--save writes the results as JSON; --compare checks them against such a
+file and exits with status 1 if any endpoint's p95 regressed by more than
+--tolerance.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+import aiohttp
+
+import fake_upstreams
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("weather", "attractions", "nearby-cities", "itineraries")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Latencies and error counts per request label."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.elapsed = {}
+
+    def record(self, label, seconds, ok):
+        self.latencies.setdefault(label, []).append(seconds)
+        self.errors[label] = self.errors.get(label, 0) + (not ok)
+
+    def summary(self):
+        results = {}
+        for label, values in self.latencies.items():
+            values = sorted(values)
+            elapsed = self.elapsed.get(label.split(":")[0]) or 1
+            results[label] = {
+                "requests": len(values),
+                "errors": self.errors[label],
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+            }
+        return results
+
+
+class Client:
+    def __init__(self, session, base_url, token, recorder):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.recorder = recorder
+
+    async def call(self, label, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with self.session.request(method, self.base_url + path, headers=self.headers, **kwargs) as resp:
+                body = await resp.read()
+                ok = resp.status < 400
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            body, ok = b"", False
+        self.recorder.record(label, time.perf_counter() - started, ok)
+        return json.loads(body) if ok and body else None
+
+
+async def weather(client, n, cities):
+    await client.call("weather", "GET", "/api/itineraries/weather/", params={"city": cities[n % len(cities)]})
+
+
+async def attractions(client, n, cities):
+    await client.call("attractions", "GET", "/api/itineraries/attractions/",
+                      params={"city": cities[n % len(cities)]})
+
+
+async def nearby_cities(client, n, cities):
+    await client.call("nearby-cities", "GET", "/api/itineraries/nearby-cities/",
+                      params={"city": cities[n % len(cities)], "radius": "50"})
+
+
+async def itineraries(client, n, cities):
+    """One CRUD round trip; each request is reported under its own label."""
+    created = await client.call("itineraries:create", "POST", "/api/itineraries/", json={
+        "title": f"Bench trip {n}", "city": cities[n % len(cities)], "country": "Benchland",
+        "start_date": "2030-05-01", "end_date": "2030-05-07", "reason": "benchmark",
+        "planning_details": {f"planned_{i}": {"date": "2030-05-02", "time": "10:00", "durationHours": 1,
+                                              "attractionName": f"Bench Place {i}"} for i in range(10)},
+    })
+    if not created:
+        return
+    path = f"/api/itineraries/{created['id']}/"
+    await client.call("itineraries:retrieve", "GET", path)
+    await client.call("itineraries:update", "PATCH", path, json={"reason": "benchmark (edited)"})
+    await client.call("itineraries:list", "GET", "/api/itineraries/", params={"limit": "20"})
+    await client.call("itineraries:delete", "DELETE", path)
+
+
+SCENARIOS = {"weather": weather, "attractions": attractions, "nearby-cities": nearby_cities,
+             "itineraries": itineraries}
+
+
+async def drive(client, scenario, concurrency, duration, cities):
+    """Run `scenario` from `concurrency` workers until `duration` seconds have passed."""
+    deadline = time.perf_counter() + duration
+    counter = iter(range(sys.maxsize))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            await scenario(client, next(counter), cities)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - started
+
+
+async def login(session, base_url):
+    username = f"bench-{uuid.uuid4().hex[:12]}"
+    password = uuid.uuid4().hex
+    async with session.post(f"{base_url}/api/users/register/",
+                            json={"username": username, "email": f"{username}@example.org", "password": password}) as resp:
+        if resp.status >= 400:
+            raise SystemExit(f"Could not register a benchmark user: {resp.status} {await resp.text()}")
+    async with session.post(f"{base_url}/api/users/login/", json={"username": username, "password": password}) as resp:
+        if resp.status >= 400:
+            raise SystemExit(f"Could not log in: {resp.status} {await resp.text()}")
+        return (await resp.json())["access"]
+
+
+async def upstream_counts(session, fake_url):
+    if not fake_url:
+        return None
+    async with session.get(f"{fake_url}/stats") as resp:
+        return await resp.json()
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as resp:
+                    await resp.read()
+                    return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.2)
+
+
+async def benchmark(args, base_url, fake_url):
+    recorder = Recorder()
+    upstream_calls = {}
+    connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        token = await login(session, base_url)
+        client = Client(session, base_url, token, recorder)
+        cities = [f"Bench City {i}" for i in range(args.cities)]
+        for endpoint in args.endpoints:
+            before = await upstream_counts(session, fake_url)
+            recorder.elapsed[endpoint] = await drive(client, SCENARIOS[endpoint], args.concurrency,
+                                                     args.duration, cities)
+            after = await upstream_counts(session, fake_url)
+            if before is not None:
+                upstream_calls[endpoint] = {name: after[name] - before[name] for name in after
+                                            if after[name] != before[name]}
+    return recorder.summary(), upstream_calls
+
+
+def print_table(results, upstream_calls):
+    columns = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    width = max(len(label) for label in results) if results else 10
+    print(f"{'endpoint':<{width}}  " + "  ".join(f"{column:>9}" for column in columns))
+    for label, row in results.items():
+        print(f"{label:<{width}}  " + "  ".join(f"{row[column]:>9}" for column in columns))
+    for endpoint, calls in upstream_calls.items():
+        print(f"upstream calls during {endpoint}: {calls or 'none'}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Labels whose p95 grew by more than `tolerance` (a fraction) over the baseline."""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    regressions = []
+    for label, row in results.items():
+        before = baseline.get(label)
+        if before and before["p95_ms"] > 0 and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']}ms -> {row['p95_ms']}ms")
+    return regressions
+
+
+def start_processes(args):
+    """Start the fake upstreams and the backend; returns (processes, backend URL, fake URL)."""
+    fake_url = f"http://127.0.0.1:{args.upstream_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name("fake_upstreams.py")),
+         "--port", str(args.upstream_port), *fake_upstreams.fake_argv(args)],
+        stdout=subprocess.DEVNULL,
+    )
+    env = {**os.environ, **fake_upstreams.env_for(fake_url)}
+    if args.settings:
+        env["DJANGO_SETTINGS_MODULE"] = args.settings
+    if not args.keep_rate_limits:
+        # The fakes have no usage policy; measure our code, not the upstreams' limits.
+        for name in ("NOMINATIM", "OVERPASS", "OPEN_METEO", "TRANSLATE"):
+            env[f"{name}_RATE"] = "100000"
+            env[f"{name}_MAX_CONNECTIONS"] = str(args.upstream_connections)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        import uvicorn  # noqa: F401  (only checking it is installed)
+        command = [sys.executable, "-m", "uvicorn", "travelcompanion.asgi:application", "--port", str(args.port),
+                   "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    except ImportError:
+        command = [sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{args.port}"]
+    log = open(args.server_log, "ab") if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=log)
+    return [server, fakes], base_url, fake_url
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the backend against local fake upstreams.")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda value: [name.strip() for name in value.split(",") if name.strip()],
+                        help=f"comma-separated, from: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight")
+    parser.add_argument("--duration", type=float, default=15, help="seconds per endpoint")
+    parser.add_argument("--cities", type=int, default=20,
+                        help="distinct cities requested; fewer means more cache hits")
+    parser.add_argument("--target", help="benchmark this already running server instead of starting one")
+    parser.add_argument("--fake-url", help="with --target: the fake upstreams' URL, to count upstream calls")
+    parser.add_argument("--port", type=int, default=8900, help="port for the backend started here")
+    parser.add_argument("--upstream-port", type=int, default=8901, help="port for the fake upstreams")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the backend")
+    parser.add_argument("--server-log", help="append the backend's output to this file")
+    parser.add_argument("--settings", help="DJANGO_SETTINGS_MODULE for the backend (use a scratch database)")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="keep the configured upstream rate limits instead of lifting them")
+    parser.add_argument("--upstream-connections", type=int, default=50)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON (from --save) to check p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth, as a fraction")
+    fake_upstreams.add_arguments(parser.add_argument_group("fake upstreams"))
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    unknown = [name for name in args.endpoints if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoint(s): {', '.join(unknown)}")
+
+    processes = []
+    if args.target:
+        base_url, fake_url = args.target.rstrip("/"), args.fake_url
+    else:
+        processes, base_url, fake_url = start_processes(args)
+    try:
+        if fake_url:
+            asyncio.run(wait_until_up(f"{fake_url}/stats"))
+        asyncio.run(wait_until_up(f"{base_url}/api/users/login/"))
+        results, upstream_calls = asyncio.run(benchmark(args, base_url, fake_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    print_table(results, upstream_calls)
+    if args.save:
+        Path(args.save).write_text(json.dumps({"args": sys.argv[1:], "results": results}, indent=2))
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,35 @@
 # main/admin.py
 
 from django.contrib import admin
-from .models import Itinerary
+from .models import Itinerary, ItineraryEvent, GeocodeCache, TranslationCache, PointOfInterest, IngestedRegion
 
 @admin.register(Itinerary)
 class ItineraryAdmin(admin.ModelAdmin):
     list_display = ('title', 'city', 'state', 'country', 'start_date', 'end_date')
     list_filter = ('city', 'state', 'country', 'start_date')
+
+@admin.register(ItineraryEvent)
+class ItineraryEventAdmin(admin.ModelAdmin):
+    list_display = ('title', 'itinerary', 'category', 'date', 'start_time', 'end_time')
+    list_filter = ('category', 'date')
+    search_fields = ('title',)
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ('query', 'updated_at')
+    search_fields = ('query',)
+
+@admin.register(TranslationCache)
+class TranslationCacheAdmin(admin.ModelAdmin):
+    list_display = ('source_text', 'translated_text', 'target_lang', 'updated_at')
+    search_fields = ('source_text', 'translated_text')
+
+@admin.register(PointOfInterest)
+class PointOfInterestAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'osm_type', 'osm_id', 'lat', 'lon')
+    list_filter = ('kind',)
+    search_fields = ('name',)
+
+@admin.register(IngestedRegion)
+class IngestedRegionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'south', 'west', 'north', 'east', 'ingested_at')
@@ -0,0 +1,102 @@
+import json
+import math
+import base64
+import hashlib
+
+EARTH_RADIUS_MILES = 3958.8
+METERS_PER_MILE = 1609.34
+
+# Overpass regex for the tourism values we search. Note the trailing "|":
+# the empty alternative makes the filter match every tourism=* value.
+TOURISM_TAGS = (
+    "museum|gallery|zoo|theme_park|viewpoint|attraction|aquarium|information|"
+    "artwork|camp_site|caravan_site|guest_house|hostel|motel|picnic_site|hotel|"
+)
+
+ATTRACTION_FIELDS = (
+    "osm_id", "type", "name", "tourism", "city", "state", "country",
+    "lat", "lon", "tags", "distance",
+)
+SORT_KEYS = ("name", "-name", "distance", "-distance")
+
+
+class InvalidQuery(ValueError):
+    """Raised for malformed filter, sort, field or cursor parameters."""
+
+
+def element_coords(element):
+    """Nodes carry lat/lon; ways and relations carry a computed centre."""
+    if element.get("type") == "node":
+        return element.get("lat"), element.get("lon")
+    center = element.get("center", {})
+    return center.get("lat"), center.get("lon")
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def parse_categories(value):
+    """
+    Categories are comma-separated. "tourism" / "amenity" select a whole tag
+    group; anything else matches the tag value (e.g. "museum", "restaurant").
+    """
+    return {part.strip().lower() for part in (value or "").split(",") if part.strip()}
+
+
+def matches_category(tags, categories):
+    if not categories:
+        return True
+    for group in ("tourism", "amenity"):
+        value = tags.get(group)
+        if value and (group in categories or value.lower() in categories):
+            return True
+    return False
+
+
+def parse_sort(value):
+    value = (value or "").strip().lower()
+    if value and value not in SORT_KEYS:
+        raise InvalidQuery(f"'sort' must be one of: {', '.join(SORT_KEYS)}.")
+    return value
+
+
+def parse_fields(value):
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in ATTRACTION_FIELDS]
+    if unknown:
+        raise InvalidQuery(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def query_fingerprint(*parts):
+    """Ties a cursor to the query that produced it."""
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(offset, fingerprint):
+    raw = json.dumps({"o": offset, "q": fingerprint}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, fingerprint):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidQuery("Invalid cursor.")
+    if data.get("q") != fingerprint or offset < 0:
+        raise InvalidQuery("Cursor does not match this query.")
+    return offset
+
+
+def project(record, fields):
+    if fields is None:
+        return record
+    return {field: record.get(field) for field in fields}
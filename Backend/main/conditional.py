@@ -0,0 +1,48 @@
+import json
+import hashlib
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(*parts, weak=False):
+    """
+    ETag from a version stamp (ids, updated_at, cache-entry fetched_at, query
+    parameters, ...), so it can be computed without rendering the body.
+    """
+    digest = hashlib.sha1(json.dumps(parts, default=str, sort_keys=True).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def _etag_matches(header, etag):
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored.
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == opaque for tag in parse_etags(header))
+
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag / Last-Modified (a Unix timestamp) and ask clients to revalidate."""
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    A 304 response if the client's cached copy is still current, else None.
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110).
+    """
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    else:
+        since = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+        fresh = since is not None and last_modified is not None and int(last_modified) <= since
+    if not fresh:
+        return None
+    return with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
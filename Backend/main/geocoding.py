@@ -0,0 +1,121 @@
+import hashlib
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import singleflight
+from .caching import TTLCache
+from .models import GeocodeCache
+from .upstream import UpstreamError, arequest_json
+
+# In-process LRU in front of the shared GeocodeCache table. Queries Nominatim
+# found nothing for are kept too, as NOT_FOUND, for GEOCODE_NEGATIVE_TTL.
+_memory = TTLCache(maxsize=settings.GEOCODE_CACHE_SIZE, ttl=settings.GEOCODE_CACHE_TTL)
+_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+NOT_FOUND = {}
+
+
+class GeocodingError(Exception):
+    """Raised when Nominatim cannot be reached or answers with an error."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def normalize_query(city, state="", country=""):
+    """
+    Build the cache key / Nominatim query for a place, e.g.
+    ("  Los   Angeles", "CA", "USA") -> "los angeles, ca, usa".
+    """
+    parts = []
+    for part in (city, state, country):
+        part = unicodedata.normalize("NFKC", part or "")
+        part = " ".join(part.split()).casefold()
+        if part:
+            parts.append(part)
+    return ", ".join(parts)
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def _search_params(query):
+    return {
+        "q": query,
+        "format": "json",
+        "addressdetails": 1,
+        "limit": 1
+    }
+
+
+def _remember(query, result):
+    _memory.set(query, result, ttl=None if result else settings.GEOCODE_NEGATIVE_TTL)
+    return result
+
+
+async def ageocode(city, state="", country=""):
+    """
+    Return the first Nominatim result for the place (a dict with lat, lon,
+    boundingbox and address), or None when nothing matches.
+    Looks in memory first, then the database, then asks Nominatim.
+    Concurrent misses for the same query share one database lookup and
+    Nominatim request (see main/singleflight.py).
+    """
+    query = normalize_query(city, state, country)
+    if not query:
+        return None
+
+    result = _memory.get(query)
+    if result is None:
+        result = await singleflight.ado(f"geocode:{query}", lambda: _alookup(query),
+                                        shared=lambda: _ashared_result(query))
+    else:
+        _counters["memory_hits"] += 1
+    return result or None
+
+
+async def _adb_result(query):
+    """The stored result (NOT_FOUND for a remembered miss), or None if absent or stale."""
+    cached = await GeocodeCache.objects.filter(query_hash=query_hash(query)).afirst()
+    if cached is None:
+        return None
+    ttl = settings.GEOCODE_DB_TTL if cached.result else settings.GEOCODE_NEGATIVE_TTL
+    if cached.updated_at < timezone.now() - timedelta(seconds=ttl):
+        return None
+    return cached.result
+
+
+async def _ashared_result(query):
+    """What another process's lookup left in the database, if anything yet."""
+    result = await _adb_result(query)
+    return _remember(query, result) if result is not None else None
+
+
+async def _alookup(query):
+    result = await _adb_result(query)
+    if result is not None:
+        _counters["db_hits"] += 1
+        return _remember(query, result)
+
+    _counters["misses"] += 1
+    try:
+        status_code, results = await arequest_json("nominatim", "GET", "/search", params=_search_params(query))
+    except UpstreamError as e:
+        raise GeocodingError(f"Nominatim request error: {e}", e.status_code)
+    if status_code != 200:
+        raise GeocodingError("Error fetching location from Nominatim", status_code)
+    result = results[0] if results else NOT_FOUND
+
+    await GeocodeCache.objects.aupdate_or_create(query_hash=query_hash(query),
+                                                 defaults={"query": query, "result": result})
+    return _remember(query, result)
+
+
+def stats():
+    """Hit/miss counters for the geocoding layer."""
+    return {**_counters, "memory": _memory.stats()}
@@ -0,0 +1,65 @@
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(lat, lon, precision=9):
+    """Standard geohash of a point, `precision` characters long."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given precision."""
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def cover(south, west, north, east, max_cells=32, max_precision=9):
+    """
+    Geohash prefixes whose cells cover a bounding box. Uses the finest
+    precision that needs at most `max_cells` cells, so an index scan on
+    `geohash LIKE 'prefix%'` touches little beyond the box itself.
+    """
+    best = None
+    for precision in range(1, max_precision + 1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+        cols = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+        if rows * cols > max_cells:
+            break
+        best = precision
+    if best is None:
+        return [""]  # box too large for any prefix: scan everything
+
+    height, width = cell_size(best)
+    prefixes = set()
+    first_row, last_row = math.floor((south + 90) / height), math.floor((north + 90) / height)
+    first_col, last_col = math.floor((west + 180) / width), math.floor((east + 180) / width)
+    for row in range(first_row, last_row + 1):
+        lat = min(-90 + (row + 0.5) * height, 90.0)
+        for col in range(first_col, last_col + 1):
+            lon = min(-180 + (col + 0.5) * width, 180.0)
+            prefixes.add(encode(lat, lon, best))
+    return sorted(prefixes)
@@ -0,0 +1,123 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main import poi_store
+from main.models import IngestedRegion
+from main.translation import aindex_names, alearn_tokens, name_pairs
+
+
+def parse_bbox(value):
+    try:
+        south, west, north, east = (float(part) for part in value.split(","))
+    except ValueError:
+        raise CommandError("--bbox must be 'south,west,north,east'.")
+    if south > north or west > east:
+        raise CommandError("--bbox must have south <= north and west <= east.")
+    return south, west, north, east
+
+
+def json_elements(path):
+    """
+    Elements of an Overpass JSON dump. Ways and relations need a centre, so
+    dump with `out center;` or `out geom;` (the geometry is averaged).
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for element in data.get("elements", []):
+        if element.get("type") != "node" and "center" not in element:
+            points = element.get("geometry") or []
+            if points:
+                element["center"] = {
+                    "lat": sum(point["lat"] for point in points) / len(points),
+                    "lon": sum(point["lon"] for point in points) / len(points),
+                }
+        yield element
+
+
+def _centre(points):
+    points = [(point.lat, point.lon) for point in points]
+    if not points:
+        return None
+    return {"lat": sum(lat for lat, _ in points) / len(points),
+            "lon": sum(lon for _, lon in points) / len(points)}
+
+
+def pbf_elements(path):
+    """
+    Elements of an .osm.pbf / .osm extract, read with pyosmium one object at
+    a time. Ways and multipolygon relations get the average of their (outer)
+    nodes as centre; other relations have no area and are skipped.
+    """
+    try:
+        import osmium
+        osmium.FileProcessor
+    except (ImportError, AttributeError):
+        raise CommandError("Reading PBF extracts requires pyosmium 3.7 or later (pip install -U osmium).")
+
+    for obj in osmium.FileProcessor(path).with_locations().with_areas():
+        if obj.is_node():
+            if obj.tags and poi_store.poi_kind(obj.tags) is not None and obj.location.valid():
+                yield {"type": "node", "id": obj.id, "lat": obj.location.lat,
+                       "lon": obj.location.lon, "tags": dict(obj.tags)}
+        elif obj.is_way():
+            if obj.tags and poi_store.poi_kind(obj.tags) is not None:
+                centre = _centre(node.location for node in obj.nodes if node.location.valid())
+                if centre:
+                    yield {"type": "way", "id": obj.id, "tags": dict(obj.tags), "center": centre}
+        elif obj.is_area() and not obj.from_way():  # closed ways were handled as ways
+            if obj.tags and poi_store.poi_kind(obj.tags) is not None:
+                centre = _centre(node for ring in obj.outer_rings() for node in ring)
+                if centre:
+                    yield {"type": "relation", "id": obj.orig_id(), "tags": dict(obj.tags), "center": centre}
+
+
+def with_name_pairs(elements, pairs):
+    """Pass elements through, collecting their name:* translations into `pairs`."""
+    for element in elements:
+        for text, translated in name_pairs([element]).items():
+            pairs.setdefault(text, translated)
+        yield element
+
+
+class Command(BaseCommand):
+    help = (
+        "Load attractions and cities from an OSM extract (Overpass JSON dump or "
+        ".osm.pbf) into the local POI store. Searches inside the ingested region "
+        "are then answered locally instead of querying Overpass. Names with name:en "
+        "tags are added to the local translation index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Overpass JSON dump (.json) or OSM extract (.osm.pbf).")
+        parser.add_argument("--name", default="", help="Label for the ingested region.")
+        parser.add_argument("--bbox", help="Region covered by the extract: south,west,north,east. "
+                                           "Defaults to the extent of the ingested data.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        bbox = parse_bbox(options["bbox"]) if options["bbox"] else None
+        elements = json_elements(path) if path.endswith(".json") else pbf_elements(path)
+        pairs = {}
+
+        # Elements are streamed and written --batch-size at a time.
+        with transaction.atomic():
+            count, extent = poi_store.ingest(with_name_pairs(elements, pairs), batch_size=options["batch_size"])
+            region = bbox or extent
+            if region is None:
+                raise CommandError("No matching POIs found and no --bbox given.")
+            south, west, north, east = region
+            IngestedRegion.objects.create(
+                name=options["name"] or path, south=south, west=west, north=north, east=east)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {count} POIs covering {south},{west},{north},{east}."))
+        async_to_sync(self.aindex)(pairs)  # database calls stay on this thread's connection
+
+    async def aindex(self, pairs):
+        names = await aindex_names(pairs)
+        words = await alearn_tokens()
+        self.stdout.write(f"Indexed {names} new name translations; {words} words learned.")
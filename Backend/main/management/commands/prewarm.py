@@ -0,0 +1,136 @@
+import time
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import upstream
+from main.caching import shared_cache
+from main.geocoding import GeocodingError, ageocode
+from main.models import Itinerary
+from main.overpass import OverpassError, aget_attraction_elements
+from main.translation import aindex_names, alearn_tokens, name_pairs, translate_many
+from main.weather import ForecastError, aget_entries
+
+
+def upcoming_destinations(days):
+    """Distinct (city, state, country) of itineraries starting within the next `days` days."""
+    today = timezone.localdate()
+    rows = (Itinerary.objects
+            .filter(start_date__gte=today, start_date__lte=today + timedelta(days=days))
+            .values_list("city", "state", "country")
+            .distinct())
+    # Normalise like the views do, so "Paris " and "Paris" are warmed once.
+    return sorted({tuple((part or "").strip() for part in row) for row in rows if (row[0] or "").strip()})
+
+
+def untranslated_names(elements):
+    """Names the attractions view would send for translation (no name:en, not ASCII)."""
+    names = set()
+    for element in elements:
+        tags = element.get("tags", {})
+        name = tags.get("name", "").strip()
+        if name and "name:en" not in tags and not name.isascii() and name.lower() != "unnamed":
+            names.add(name)
+    return names
+
+
+async def warm(destination, translate, shared=True):
+    """
+    Fill the caches the weather and attractions views read for one
+    destination. Forecasts and attraction tiles live in the Django cache, so
+    they are only fetched when it is `shared` with the web processes; the
+    geocodes are stored in the database either way. Returns the list of
+    steps that failed.
+    """
+    city, state, country = destination
+    failed = []
+    try:
+        # The weather view geocodes the city alone, attractions the full place.
+        weather_location, location = await asyncio.gather(ageocode(city), ageocode(city, state, country))
+    except GeocodingError:
+        return ["geocode"]
+
+    if not shared:
+        return failed
+
+    if weather_location:
+        try:
+            await aget_entries([(weather_location["lat"], weather_location["lon"])])
+        except ForecastError:
+            failed.append("forecast")
+
+    bounding_box = (location or {}).get("boundingbox", [])
+    if len(bounding_box) >= 4:
+        south, north, west, east = bounding_box[:4]
+        try:
+            elements, _ = await aget_attraction_elements(south, west, north, east)
+        except OverpassError:
+            failed.append("attractions")
+        else:
+            await aindex_names(name_pairs(elements))  # name:* tags feed the local translation index
+            names = untranslated_names(elements) if translate else set()
+            if names:
+                await translate_many(names)  # failures are retried by the next real request
+    return failed
+
+
+async def warm_all(destinations, concurrency, translate, shared=True):
+    """Warm destinations with at most `concurrency` in flight. Returns {destination: failed steps}."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(destination):
+        async with semaphore:
+            return destination, await warm(destination, translate, shared)
+
+    try:
+        results = dict(await asyncio.gather(*[one(destination) for destination in destinations]))
+        await alearn_tokens()
+        return results
+    finally:
+        await upstream.aclose_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-populate the geocode, forecast and attractions caches for the destinations "
+        "of itineraries starting soon, so the first request for an upcoming trip is a "
+        "cache hit. Run it on a schedule (e.g. hourly from cron), or with --every to keep "
+        "running. Upstream calls go through the usual per-host rate limits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.PREWARM_WINDOW_DAYS,
+                            help="Warm trips starting between today and this many days ahead.")
+        parser.add_argument("--concurrency", type=int, default=settings.PREWARM_CONCURRENCY,
+                            help="Destinations warmed at the same time.")
+        parser.add_argument("--no-translate", action="store_true",
+                            help="Skip pre-translating attraction names.")
+        parser.add_argument("--every", type=int, default=0, metavar="MINUTES",
+                            help="Repeat every MINUTES minutes instead of running once.")
+
+    def handle(self, *args, **options):
+        shared = shared_cache()
+        if not shared:
+            self.stderr.write(self.style.WARNING(
+                "The default cache is per process (set REDIS_URL), so forecasts and attraction tiles "
+                "fetched here would be lost when this command exits. Only geocodes will be warmed."))
+        warmed = "destinations" if shared else "destinations (geocodes only)"
+        while True:
+            started = time.monotonic()
+            destinations = upcoming_destinations(options["days"])
+            results = async_to_sync(warm_all)(destinations, max(1, options["concurrency"]),
+                                              translate=not options["no_translate"], shared=shared)
+            failures = {destination: steps for destination, steps in results.items() if steps}
+            for (city, state, country), steps in failures.items():
+                place = ", ".join(part for part in (city, state, country) if part)
+                self.stderr.write(f"Could not warm {', '.join(steps)} for {place}.")
+            self.stdout.write(self.style.SUCCESS(
+                f"Warmed {len(destinations) - len(failures)} of {len(destinations)} {warmed} "
+                f"in {time.monotonic() - started:.1f}s."))
+            if not options["every"]:
+                return
+            time.sleep(max(0.0, options["every"] * 60 - (time.monotonic() - started)))
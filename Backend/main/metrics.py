@@ -0,0 +1,192 @@
+import hmac
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Request-scoped stage timings: {stage: seconds}. Set by the Server-Timing
+# middleware; child tasks created during the request share the same dict.
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for label_values, series in sorted(values.items()):
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                names, values_ = (*self.labels, "le"), (*label_values, bound)
+                yield f"{self.name}_bucket{_labels(names, values_)} {count}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {series[-2]}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {series[-1]}"
+
+
+PREFIX = "travelcompanion"
+
+request_seconds = Histogram(f"{PREFIX}_request_seconds", "Time to produce a response, by endpoint.",
+                            ("endpoint", "status"))
+response_bytes = Histogram(f"{PREFIX}_response_bytes", "Response body size as sent, by endpoint.",
+                           ("endpoint",), SIZE_BUCKETS)
+stage_seconds = Histogram(f"{PREFIX}_stage_seconds", "Time spent in each stage of a request pipeline.",
+                          ("endpoint", "stage"))
+upstream_requests = Counter(f"{PREFIX}_upstream_requests_total", "Upstream HTTP attempts, by host and outcome.",
+                            ("upstream", "status"))
+upstream_retries = Counter(f"{PREFIX}_upstream_retries_total", "Upstream attempts that were retried.",
+                           ("upstream",))
+upstream_seconds = Histogram(f"{PREFIX}_upstream_seconds", "Upstream HTTP attempt latency.", ("upstream",))
+upstream_bytes = Histogram(f"{PREFIX}_upstream_response_bytes", "Upstream response body size.",
+                           ("upstream",), SIZE_BUCKETS)
+
+METRICS = [request_seconds, response_bytes, stage_seconds,
+           upstream_requests, upstream_retries, upstream_seconds, upstream_bytes]
+
+
+def begin():
+    """Start collecting stage timings for the current request; returns the dict they go into."""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as one stage of the current request, for its Server-Timing
+    header and the stage histogram. Usable in sync and async code; repeated
+    stages add up. Outside a request the time is recorded as "background".
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = _timings.get()
+        if timings is None:
+            stage_seconds.observe(elapsed, "background", name)
+        else:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def finish(endpoint, status_code, timings, total, size=None):
+    """Record one finished request: its stage totals, duration and (if known) body size."""
+    for name, seconds in timings.items():
+        stage_seconds.observe(seconds, endpoint, name)
+    request_seconds.observe(total, endpoint, status_code)
+    if size is not None:
+        response_bytes.observe(size, endpoint)
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value (durations in milliseconds)."""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _flatten(prefix, stats, part=None):
+    """
+    Samples for a stats() dict: numbers as gauges, strings as a labelled 1.
+    Nested dicts become a `part` label, e.g. {"memory": {"hits": 3}} ->
+    prefix_hits{part="memory"} 3.
+    """
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(prefix, value, key if part is None else f"{part}.{key}")
+            continue
+        names, values = (("part",), (part,)) if part is not None else ((), ())
+        if isinstance(value, str):
+            names, values, value = (*names, "value"), (*values, value), 1
+        elif not isinstance(value, (int, float)):
+            continue
+        yield f"{prefix}_{key}{_labels(names, values)} {int(value) if isinstance(value, bool) else value}"
+
+
+def collectors():
+    """The caches' and clients' own stats(), read at scrape time."""
+    from users import authentication
+    from . import geocoding, middleware, overpass, renderers, singleflight, translation, upstream, weather
+    return {
+        "geocoding": geocoding.stats, "translation": translation.stats, "weather": weather.stats,
+        "overpass": overpass.stats, "singleflight": singleflight.stats, "circuit": upstream.stats,
+        "encoding": renderers.stats, "compression": middleware.stats, "auth_user_cache": authentication.stats,
+    }
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (this process only)."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for name, collect in collectors().items():
+        lines.extend(_flatten(f"{PREFIX}_{name}", collect()))  # untyped samples
+    return "\n".join(lines) + "\n"
+
+
+def allowed(request):
+    """Scrapes need METRICS_TOKEN as a bearer token when it is set, else come from localhost."""
+    token = settings.METRICS_TOKEN
+    if token:
+        return hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}")
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
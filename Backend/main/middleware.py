@@ -0,0 +1,181 @@
+import time
+import zlib
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics
+from .caching import TTLCache
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript")
+
+# Compressed bodies of versioned (ETag-carrying) responses, keyed by content
+# digest and coding: hashing is far cheaper than compressing, so a repeated
+# body is compressed once while it stays cached.
+_compressed = TTLCache(maxsize=settings.COMPRESSION_CACHE_SIZE, ttl=settings.COMPRESSION_CACHE_TTL)
+
+
+def accepted_codings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    codings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[name] = q
+    return codings
+
+
+def choose_coding(header):
+    """The best coding this server offers for an Accept-Encoding header, or None."""
+    codings = accepted_codings(header)
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(offered, key=lambda coding: codings.get(coding, codings.get("*", 0.0)))
+    return best if codings.get(best, codings.get("*", 0.0)) > 0 else None
+
+
+def _compressor(coding):
+    if coding == "br":
+        return brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+
+def compress(data, coding):
+    if coding == "br":
+        return brotli.compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    compressor = _compressor(coding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _flushing(compressor, coding):
+    """(chunk -> bytes, finish) for streams: every chunk is flushed so lines arrive as they are sent."""
+    if coding == "br":
+        return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+    return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Negotiated brotli (when the `brotli` package is installed) or gzip
+    compression. Bodies shorter than COMPRESSION_MIN_SIZE and types that do
+    not compress (anything but text/JSON) are sent as they are. Streamed
+    bodies are compressed chunk by chunk, flushing after each one.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    async def __acall__(self, request):
+        # process_response only touches the response, so under ASGI it runs on
+        # the event loop rather than being handed to a worker thread.
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "").lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        coding = choose_coding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self._compress_stream(response, coding)
+            del response.headers["Content-Length"]
+        else:
+            key = (hashlib.sha1(response.content).digest(), coding) if response.has_header("ETag") else None
+            compressed = _compressed.get(key) if key else None
+            if compressed is None:
+                compressed = compress(response.content, coding)
+                if key:
+                    _compressed.set(key, compressed)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The compressed bytes are a different representation (RFC 9110 8.8.1);
+        # a weak ETag still matches If-None-Match.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = coding
+        return response
+
+    @staticmethod
+    def _compress_stream(response, coding):
+        # Bind the iterator now, in case streaming_content is replaced later.
+        chunks = response.streaming_content
+        process, finish = _flushing(_compressor(coding), coding)
+
+        if response.is_async:
+            async def compressed():
+                async for chunk in chunks:
+                    yield process(chunk)
+                yield finish()
+        else:
+            def compressed():
+                for chunk in chunks:
+                    yield process(chunk)
+                yield finish()
+        return compressed()
+
+
+def _finish_timing(request, response, timings, started):
+    total = time.perf_counter() - started
+    match = request.resolver_match
+    endpoint = match.view_name if match else "unmatched"
+    size = None if response.streaming else len(response.content)
+    metrics.finish(endpoint, response.status_code, timings, total, size)
+    response["Server-Timing"] = metrics.server_timing(timings, total)
+    return response
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    """
+    Collect the stage timings recorded with metrics.stage() during a request,
+    send them as a Server-Timing header and add them, with the request's
+    duration and body size, to the metrics histograms.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            timings = metrics.begin()
+            response = await get_response(request)
+            return _finish_timing(request, response, timings, started)
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            timings = metrics.begin()
+            response = get_response(request)
+            return _finish_timing(request, response, timings, started)
+    return middleware
+
+
+def stats():
+    return {"compressed": _compressed.stats(), "brotli": brotli is not None}
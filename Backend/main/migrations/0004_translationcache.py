@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0003_geocodecache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TranslationCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source_hash", models.CharField(max_length=64)),
+                ("source_text", models.TextField()),
+                ("target_lang", models.CharField(default="en", max_length=16)),
+                ("translated_text", models.TextField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("source_hash", "target_lang")},
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0004_translationcache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestedRegion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("south", models.FloatField()),
+                ("west", models.FloatField()),
+                ("north", models.FloatField()),
+                ("east", models.FloatField()),
+                ("ingested_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PointOfInterest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("osm_type", models.CharField(max_length=10)),
+                ("osm_id", models.BigIntegerField()),
+                ("lat", models.FloatField()),
+                ("lon", models.FloatField()),
+                ("geohash", models.CharField(max_length=12)),
+                ("kind", models.CharField(max_length=50)),
+                ("name", models.CharField(blank=True, max_length=255)),
+                ("tags", models.JSONField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["geohash"], name="main_pointo_geohash_a0ed4d_idx"
+                    ),
+                    models.Index(
+                        fields=["kind", "geohash"], name="main_pointo_kind_4d37ef_idx"
+                    ),
+                ],
+                "unique_together": {("osm_type", "osm_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 20:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_pointofinterest_ingestedregion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="itinerary",
+            index=models.Index(
+                fields=["user", "start_date"], name="main_itiner_user_id_380b4f_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="itinerary",
+            index=models.Index(
+                fields=["user", "end_date"], name="main_itiner_user_id_a9f860_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_itinerary_user_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItineraryEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("client_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("title", models.CharField(max_length=255)),
+                ("category", models.CharField(blank=True, max_length=50)),
+                ("osm_id", models.BigIntegerField(blank=True, null=True)),
+                ("date", models.DateField()),
+                ("start_time", models.DateTimeField(blank=True, null=True)),
+                ("end_time", models.DateTimeField(blank=True, null=True)),
+                ("attraction", models.JSONField(blank=True, null=True)),
+                ("notes", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "itinerary",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="events",
+                        to="main.itinerary",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["itinerary", "start_time"],
+                        name="main_itiner_itinera_d34ac8_idx",
+                    ),
+                    models.Index(
+                        fields=["itinerary", "end_time"],
+                        name="main_itiner_itinera_9e24b5_idx",
+                    ),
+                    models.Index(
+                        fields=["category"], name="main_itiner_categor_556243_idx"
+                    ),
+                ],
+                "unique_together": {("itinerary", "client_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 20:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_itineraryevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itinerary",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_itinerary_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="translationcache",
+            name="source",
+            field=models.CharField(default="network", max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name="translationcache",
+            index=models.Index(
+                fields=["source", "target_lang"], name="main_transl_source_6aa397_idx"
+            ),
+        ),
+    ]
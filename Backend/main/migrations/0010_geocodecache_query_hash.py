@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-19 09:10
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_query_hash(apps, schema_editor):
+    GeocodeCache = apps.get_model("main", "GeocodeCache")
+    for entry in GeocodeCache.objects.only("id", "query").iterator():
+        entry.query_hash = hashlib.sha256(entry.query.encode("utf-8")).hexdigest()
+        entry.save(update_fields=["query_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_translationcache_source"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="geocodecache",
+            name="query_hash",
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_query_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="geocodecache",
+            name="query_hash",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="geocodecache",
+            name="query",
+            field=models.TextField(),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-19 11:40
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def planned_events(itinerary, ItineraryEvent):
+    """ItineraryEvent rows for the timed "planned_*" entries in planning_details."""
+    for key, detail in (itinerary.planning_details or {}).items():
+        if not str(key).startswith("planned_") or not isinstance(detail, dict) or len(key) > 64:
+            continue
+        try:
+            start = datetime.fromisoformat(f"{detail['date']}T{detail['time']}")
+            minutes = int(detail.get("durationHours") or 0) * 60 + int(detail.get("durationMinutes") or 0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        osm_id = detail.get("osm_id")
+        osm_id = int(osm_id) if str(osm_id).isdigit() else None
+        if settings.USE_TZ:
+            # Planner times are the trip's wall clock; the event endpoints read
+            # naive input the same way (in TIME_ZONE, which is UTC).
+            start = start.replace(tzinfo=dt_timezone.utc)
+        yield ItineraryEvent(
+            itinerary_id=itinerary.id,
+            client_id=key,
+            title=(detail.get("attractionName") or itinerary.title)[:255],
+            category=str(detail.get("category") or "")[:50],
+            osm_id=osm_id,
+            date=start.date(),
+            start_time=start,
+            end_time=start + timedelta(minutes=minutes),
+        )
+
+
+def copy_planned_events(apps, schema_editor):
+    Itinerary = apps.get_model("main", "Itinerary")
+    ItineraryEvent = apps.get_model("main", "ItineraryEvent")
+    existing = set(ItineraryEvent.objects.exclude(client_id=None).values_list("itinerary_id", "client_id"))
+    rows = []
+    for itinerary in Itinerary.objects.only("id", "title", "planning_details").iterator(chunk_size=BATCH_SIZE):
+        rows.extend(event for event in planned_events(itinerary, ItineraryEvent)
+                    if (event.itinerary_id, event.client_id) not in existing)
+        if len(rows) >= BATCH_SIZE:
+            ItineraryEvent.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            rows = []
+    ItineraryEvent.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_geocodecache_query_hash"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_planned_events, migrations.RunPython.noop),
+    ]
@@ -11,6 +11,120 @@ class Itinerary(models.Model):
     end_date = models.DateField()
     reason = models.CharField(max_length=255, blank=True)
     planning_details = models.JSONField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)  # version stamp for ETag / Last-Modified
+
+    class Meta:
+        # The list endpoint filters a user's itineraries by date window.
+        indexes = [
+            models.Index(fields=['user', 'start_date']),
+            models.Index(fields=['user', 'end_date']),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.start_date} - {self.end_date})"
+
+
+
+class ItineraryEvent(models.Model):
+    """
+    One planned activity of an itinerary, stored as its own row so moving or
+    editing a single event writes a single row. `client_id` is the id the
+    planner assigned (e.g. "planned_<timestamp>_<random>") and is the key for
+    bulk upserts.
+    """
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='events')
+    client_id = models.CharField(max_length=64, blank=True, null=True)
+    title = models.CharField(max_length=255)
+    category = models.CharField(max_length=50, blank=True)  # tourism/amenity value, e.g. museum
+    osm_id = models.BigIntegerField(blank=True, null=True)
+    date = models.DateField()
+    start_time = models.DateTimeField(blank=True, null=True)
+    end_time = models.DateTimeField(blank=True, null=True)
+    attraction = models.JSONField(blank=True, null=True)  # snapshot of the attraction it was planned from
+    notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('itinerary', 'client_id')
+        indexes = [
+            models.Index(fields=['itinerary', 'start_time']),
+            models.Index(fields=['itinerary', 'end_time']),
+            models.Index(fields=['category']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.date})"
+
+class GeocodeCache(models.Model):
+    """
+    Persistent Nominatim results, shared by every worker process, keyed by a
+    hash of the normalized query. An empty `result` records that nothing
+    matched.
+    """
+    query_hash = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    result = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.query
+
+
+class TranslationCache(models.Model):
+    """Persistent translations keyed by (source text, target language)."""
+    source_hash = models.CharField(max_length=64)
+    source_text = models.TextField()
+    target_lang = models.CharField(max_length=16, default='en')
+    translated_text = models.TextField()
+    # "network" (translation API), "osm" (a name:* tag) or "osm_token" (a word
+    # learned from many OSM names, e.g. 博物館 -> Museum)
+    source = models.CharField(max_length=16, default='network')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('source_hash', 'target_lang')
+        indexes = [
+            models.Index(fields=['source', 'target_lang']),
+        ]
+
+    def __str__(self):
+        return f"{self.source_text[:50]} -> {self.translated_text[:50]}"
+
+
+class PointOfInterest(models.Model):
+    """
+    OSM element ingested from an offline extract (see the ingest_osm command).
+    `geohash` is the spatial index: bbox and radius queries scan a handful of
+    geohash prefixes and then filter on lat/lon.
+    """
+    osm_type = models.CharField(max_length=10)
+    osm_id = models.BigIntegerField()
+    lat = models.FloatField()
+    lon = models.FloatField()
+    geohash = models.CharField(max_length=12)
+    kind = models.CharField(max_length=50)  # tourism/amenity/place value, e.g. museum, restaurant, city
+    name = models.CharField(max_length=255, blank=True)
+    tags = models.JSONField()
+
+    class Meta:
+        unique_together = ('osm_type', 'osm_id')
+        indexes = [
+            models.Index(fields=['geohash']),
+            models.Index(fields=['kind', 'geohash']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.kind})"
+
+
+class IngestedRegion(models.Model):
+    """Bounding box of an ingested extract; queries inside it are answered locally."""
+    name = models.CharField(max_length=255)
+    south = models.FloatField()
+    west = models.FloatField()
+    north = models.FloatField()
+    east = models.FloatField()
+    ingested_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,302 @@
+import math
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import poi_store, singleflight, translation
+from .attractions import METERS_PER_MILE, TOURISM_TAGS, element_coords, haversine_miles
+from .caching import TTLCache
+from .spatial import KDTree
+from .upstream import UpstreamError, arequest_json
+
+# Attraction results are cached per fixed tile, so overlapping searches
+# ("Brooklyn" then "New York") only fetch the tiles they do not share.
+_memory = TTLCache(maxsize=settings.OVERPASS_TILE_CACHE_SIZE, ttl=settings.OVERPASS_TILE_TTL)
+
+
+class OverpassError(Exception):
+    """Raised when Overpass cannot be reached or answers with an error."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def attractions_query(bbox):
+    """Overpass QL for tourism POIs and restaurants inside "south,west,north,east"."""
+    return f"""
+    [out:json][timeout:25];
+    (
+      node["tourism"~"{TOURISM_TAGS}"]({bbox});
+      way["tourism"~"{TOURISM_TAGS}"]({bbox});
+      relation["tourism"~"{TOURISM_TAGS}"]({bbox});
+      node["amenity"="restaurant"]({bbox});
+      way["amenity"="restaurant"]({bbox});
+      relation["amenity"="restaurant"]({bbox});
+    );
+    out center;
+    """
+
+
+def nearby_cities_query(lat, lon, radius_m):
+    return f"""
+    [out:json][timeout:25];
+    (
+      node[place=city](around:{radius_m},{lat},{lon});
+    );
+    out;
+    """
+
+
+async def arun_query(query):
+    """
+    POST a query to Overpass and return its elements. Identical queries in
+    flight at the same time share one request.
+    """
+    key = "overpass:" + hashlib.sha1(query.encode("utf-8")).hexdigest()
+    return await singleflight.ado(key, lambda: _arun_query(query))
+
+
+async def _arun_query(query):
+    try:
+        status_code, data = await arequest_json(
+            "overpass", "POST", "/api/interpreter", data=query.encode('utf-8'))
+    except UpstreamError as e:
+        raise OverpassError(f"Overpass request error: {str(e)}", e.status_code)
+    if status_code != 200 or data is None:
+        raise OverpassError("Error fetching data from Overpass", status_code)
+    elements = data.get("elements", [])
+    translation.queue_index(elements)  # name:* tags feed the local translation index, off the request path
+    return elements
+
+
+def tiles_for_bbox(south, west, north, east, size=None):
+    """Indices (row, col) of the fixed tiles covering a bounding box."""
+    size = size or settings.OVERPASS_TILE_DEGREES
+    rows = range(math.floor(south / size), math.floor(north / size) + 1)
+    cols = range(math.floor(west / size), math.floor(east / size) + 1)
+    return [(row, col) for row in rows for col in cols]
+
+
+def tile_bbox(tile, size=None):
+    size = size or settings.OVERPASS_TILE_DEGREES
+    row, col = tile
+    south, west = round(row * size, 6), round(col * size, 6)
+    return south, west, round(south + size, 6), round(west + size, 6)
+
+
+def coarse_bbox(south, west, north, east, size=None):
+    """A large box snapped outward to the coarse grid, so similar large searches share one entry."""
+    size = size or settings.OVERPASS_COARSE_DEGREES
+    return (round(math.floor(south / size) * size, 6), round(math.floor(west / size) * size, 6),
+            round(math.ceil(north / size) * size, 6), round(math.ceil(east / size) * size, 6))
+
+
+def _tile_key(tile):
+    return f"overpass:tiles:{settings.OVERPASS_TILE_DEGREES}:{tile[0]}:{tile[1]}"
+
+
+def _area_key(bbox):
+    return "overpass:areas:" + ":".join(str(value) for value in bbox)
+
+
+async def _ashared_entry(key):
+    entry = await cache.aget(key)
+    if entry is not None:
+        _memory.set(key, entry)
+    return entry
+
+
+async def _afetch(key, bbox, semaphore):
+    """
+    Fetch the attractions in a tile (or coarse area) and store them in both
+    caches as {"elements", "fetched_at"}. Concurrent requests for the same
+    key (from any request, or any process with SINGLEFLIGHT_LOCK on) share
+    the fetch.
+    """
+    async def fetch():
+        south, west, north, east = bbox
+        async with semaphore:
+            elements = await arun_query(attractions_query(f"{south},{west},{north},{east}"))
+        entry = {"elements": elements, "fetched_at": time.time()}
+        _memory.set(key, entry)
+        await cache.aset(key, entry, settings.OVERPASS_TILE_TTL)
+        return entry
+
+    return await singleflight.ado(key, fetch, shared=lambda: _ashared_entry(key))
+
+
+def _clip(entries, south, west, north, east):
+    """Elements of the entries inside the box, deduplicated by OSM type/id."""
+    merged = {}
+    for entry in entries:
+        for element in entry["elements"]:
+            lat, lon = element_coords(element)
+            if lat is None or lon is None:
+                continue
+            if south <= lat <= north and west <= lon <= east:
+                merged.setdefault((element.get("type"), element.get("id")), element)
+    return list(merged.values())
+
+
+async def aget_attraction_elements(south, west, north, east):
+    """
+    Return (elements, version) for the attractions inside a bounding box.
+    The box is split into fixed tiles; cached tiles are served locally and
+    only the missing ones are fetched (concurrently). Results are merged,
+    deduplicated by OSM type/id and clipped to the box. Boxes of more than
+    OVERPASS_MAX_TILES tiles, or missing more than OVERPASS_MAX_TILE_FETCHES
+    of them, are fetched and cached in one piece, snapped out to the
+    OVERPASS_COARSE_DEGREES grid. Boxes inside an ingested OSM
+    extract are answered from the local store. `version` is a Unix timestamp
+    that changes whenever the underlying data does (newest fetch of the
+    cached pieces, or the extract's ingestion time).
+    """
+    south, west, north, east = map(float, (south, west, north, east))
+    region = await poi_store.acovering_region(south, west, north, east)
+    if region is not None:
+        return await poi_store.aattractions_in_bbox(south, west, north, east), region.ingested_at.timestamp()
+    tiles = tiles_for_bbox(south, west, north, east)
+    cached = {}
+    if len(tiles) <= settings.OVERPASS_MAX_TILES:
+        for tile in tiles:
+            entry = _memory.get(_tile_key(tile))
+            if entry is not None:
+                cached[tile] = entry
+        unresolved = {_tile_key(tile): tile for tile in tiles if tile not in cached}
+        if unresolved:
+            for key, entry in (await cache.aget_many(list(unresolved))).items():
+                _memory.set(key, entry)
+                cached[unresolved[key]] = entry
+
+    missing = [tile for tile in tiles if tile not in cached]
+    if len(tiles) > settings.OVERPASS_MAX_TILES or len(missing) > settings.OVERPASS_MAX_TILE_FETCHES:
+        # One query instead of a fan-out that would queue behind the rate limiter.
+        area = coarse_bbox(south, west, north, east)
+        key = _area_key(area)
+        entry = (_memory.get(key) or await _ashared_entry(key)
+                 or await _afetch(key, area, asyncio.Semaphore(1)))
+        return _clip([entry], south, west, north, east), entry["fetched_at"]
+
+    if missing:
+        semaphore = asyncio.Semaphore(settings.OVERPASS_TILE_CONCURRENCY)
+        results = await asyncio.gather(*[_afetch(_tile_key(tile), tile_bbox(tile), semaphore) for tile in missing])
+        cached.update(zip(missing, results))
+
+    entries = [cached[tile] for tile in tiles]
+    return _clip(entries, south, west, north, east), max(entry["fetched_at"] for entry in entries)
+
+
+def city_name(element):
+    """The name shown for a city: name:en, else name; "" for unnamed places."""
+    tags = element.get("tags", {})
+    name = tags.get("name:en", tags.get("name", "")).strip()
+    return "" if name.lower() == "unnamed" else name
+
+
+class CityIndex:
+    """
+    In-memory k-d tree of known cities: those in the local POI store plus
+    every city Overpass has returned. Each Overpass search area is remembered
+    for CITY_INDEX_TTL seconds; a later search whose circle lies inside a
+    remembered area (or an ingested region) is answered from the tree alone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cities = {}
+        self._tree = KDTree([])
+        self._stale = False  # cities were added since the tree was built
+        self._areas = deque(maxlen=settings.CITY_INDEX_AREAS)
+        self._loaded_at = None
+
+    def _current_tree(self):
+        """The tree, rebuilt first if cities were added since the last search."""
+        if self._stale:
+            with self._lock:
+                if self._stale:
+                    points = []
+                    for element in self._cities.values():
+                        lat, lon = element_coords(element)
+                        if lat is not None and lon is not None:
+                            points.append((lat, lon, element))
+                    self._tree = KDTree(points)
+                    self._stale = False
+        return self._tree
+
+    def add(self, elements):
+        with self._lock:
+            for element in elements:
+                if not city_name(element):
+                    continue  # nothing to show for unnamed places, and they must not use up `k`
+                self._cities[(element.get("type"), element.get("id"))] = element
+                self._stale = True
+
+    async def aload_store(self):
+        """Pull the POI store's cities into the tree, at most every CITY_INDEX_REFRESH seconds."""
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < settings.CITY_INDEX_REFRESH:
+            return
+        self._loaded_at = now
+        self.add(await poi_store.aall_cities())
+
+    def covers(self, lat, lon, miles):
+        now = time.monotonic()
+        for area_lat, area_lon, area_miles, expires in list(self._areas):
+            if expires > now and haversine_miles(lat, lon, area_lat, area_lon) + miles <= area_miles:
+                return True
+        return False
+
+    def learn(self, lat, lon, miles, elements):
+        """Record the result of a complete search of a circle."""
+        self.add(elements)
+        with self._lock:
+            self._areas.append((lat, lon, miles, time.monotonic() + settings.CITY_INDEX_TTL))
+
+    def search(self, lat, lon, miles, k=None):
+        """[(distance_miles, element), ...] within `miles`, nearest first, at most `k`."""
+        tree = self._current_tree()
+        if k is None:
+            return tree.within(lat, lon, miles)
+        return tree.nearest(lat, lon, k, miles)
+
+    def clear(self):
+        with self._lock:
+            self._cities.clear()
+            self._areas.clear()
+            self._tree = KDTree([])
+            self._stale = False
+            self._loaded_at = None
+
+    def stats(self):
+        return {"cities": len(self._cities), "areas": len(self._areas)}
+
+
+city_index = CityIndex()
+
+
+async def aget_nearby_cities(lat, lon, radius_m, k=None):
+    """
+    Return [(distance_miles, element), ...] for place=city nodes within
+    `radius_m` metres of a point, nearest first and at most `k` of them.
+    Overpass is only queried when neither the city index nor an ingested
+    OSM extract already covers the search circle.
+    """
+    lat, lon = float(lat), float(lon)
+    miles = radius_m / METERS_PER_MILE
+    await city_index.aload_store()
+    if not city_index.covers(lat, lon, miles):
+        if await poi_store.acovers(*poi_store.radius_bbox(lat, lon, radius_m)):
+            city_index.learn(lat, lon, miles, await poi_store.acities_within(lat, lon, radius_m))
+        else:
+            city_index.learn(lat, lon, miles, await arun_query(nearby_cities_query(lat, lon, radius_m)))
+    return city_index.search(lat, lon, miles, k)
+
+
+def stats():
+    return {"tiles": _memory.stats(), "cities": city_index.stats()}
@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ItineraryCursorPagination(CursorPagination):
+    """
+    Keyset pagination in date order. Opt-in: the list is only paginated when
+    the client sends `limit` or `cursor`, so existing callers still get a list.
+    """
+    ordering = ('start_date', 'id')
+    page_size = settings.ITINERARIES_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.ITINERARIES_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not ({'limit', 'cursor'} & set(request.query_params)):
+            return None
+        return super().paginate_queryset(queryset, request, view)
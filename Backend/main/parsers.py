@@ -0,0 +1,30 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON (one object per line). Returns a lazy iterator so
+    a large upload is decoded line by line as the view consumes it; a bad
+    line raises ParseError naming its line number.
+    """
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        return self._lines(stream, encoding)
+
+    @staticmethod
+    def _lines(stream, encoding):
+        if stream is None:
+            return
+        for number, raw in enumerate(stream, 1):
+            line = raw.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ParseError(f"Line {number}: invalid JSON ({e}).")
@@ -0,0 +1,137 @@
+import re
+import math
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Q
+
+from . import geohash
+from .attractions import METERS_PER_MILE, TOURISM_TAGS, haversine_miles
+from .models import IngestedRegion, PointOfInterest
+
+GEOHASH_PRECISION = 9
+METERS_PER_DEGREE = 111320.0
+
+_tourism_re = re.compile(TOURISM_TAGS)
+
+
+def poi_kind(tags):
+    """
+    Apply the same tag filters as the Overpass queries used by the attractions
+    and nearby-cities actions. Returns the kind to store, or None to skip.
+    """
+    if tags.get("place") == "city":
+        return "city"
+    tourism = tags.get("tourism")
+    if tourism and _tourism_re.search(tourism):
+        return tourism
+    if tags.get("amenity") == "restaurant":
+        return "restaurant"
+    return None
+
+
+def to_element(poi):
+    """Render a stored POI in the shape Overpass returns (`out center`)."""
+    element = {"type": poi.osm_type, "id": poi.osm_id, "tags": poi.tags}
+    if poi.osm_type == "node":
+        element.update(lat=poi.lat, lon=poi.lon)
+    else:
+        element["center"] = {"lat": poi.lat, "lon": poi.lon}
+    return element
+
+
+def _bbox_q(south, west, north, east):
+    prefixes = geohash.cover(south, west, north, east)
+    by_geohash = reduce(or_, (Q(geohash__startswith=prefix) for prefix in prefixes))
+    return by_geohash & Q(lat__gte=south, lat__lte=north, lon__gte=west, lon__lte=east)
+
+
+def radius_bbox(lat, lon, radius_m):
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+async def acovering_region(south, west, north, east):
+    """The most recently ingested extract covering the whole bounding box, or None."""
+    return await IngestedRegion.objects.filter(
+        south__lte=south, west__lte=west, north__gte=north, east__gte=east
+    ).order_by("-ingested_at").afirst()
+
+
+async def acovers(south, west, north, east):
+    """True if an ingested extract covers the whole bounding box."""
+    return await acovering_region(south, west, north, east) is not None
+
+
+async def aattractions_in_bbox(south, west, north, east):
+    queryset = PointOfInterest.objects.filter(_bbox_q(south, west, north, east)).exclude(kind="city")
+    return [to_element(poi) async for poi in queryset]
+
+
+async def acities_within(lat, lon, radius_m):
+    """Cities within `radius_m` metres of a point, as Overpass-shaped nodes."""
+    lat, lon = float(lat), float(lon)
+    queryset = PointOfInterest.objects.filter(_bbox_q(*radius_bbox(lat, lon, radius_m)), kind="city")
+    radius_miles = radius_m / METERS_PER_MILE
+    return [
+        to_element(poi) async for poi in queryset
+        if haversine_miles(lat, lon, poi.lat, poi.lon) <= radius_miles
+    ]
+
+
+async def aall_cities():
+    return [to_element(poi) async for poi in PointOfInterest.objects.filter(kind="city")]
+
+
+def ingest(elements, batch_size=1000):
+    """
+    Upsert Overpass-shaped elements that pass `poi_kind` into the store.
+    Elements need lat/lon (nodes) or a center. Returns (count, extent) where
+    extent is (south, west, north, east) of what was stored, or None.
+    """
+    update_options = {
+        "update_conflicts": True,
+        "update_fields": ["lat", "lon", "geohash", "kind", "name", "tags"],
+    }
+    if connection.features.supports_update_conflicts_with_target:
+        update_options["unique_fields"] = ["osm_type", "osm_id"]
+
+    count = 0
+    extent = None
+    batch = []
+    for element in elements:
+        tags = element.get("tags") or {}
+        kind = poi_kind(tags)
+        if kind is None:
+            continue
+        if element.get("type") == "node":
+            lat, lon = element.get("lat"), element.get("lon")
+        else:
+            center = element.get("center") or {}
+            lat, lon = center.get("lat"), center.get("lon")
+        if lat is None or lon is None:
+            continue
+        batch.append(PointOfInterest(
+            osm_type=element["type"],
+            osm_id=element["id"],
+            lat=lat,
+            lon=lon,
+            geohash=geohash.encode(lat, lon, GEOHASH_PRECISION),
+            kind=kind,
+            name=(tags.get("name:en") or tags.get("name") or "")[:255],
+            tags=tags,
+        ))
+        if extent is None:
+            extent = [lat, lon, lat, lon]
+        else:
+            extent = [min(extent[0], lat), min(extent[1], lon), max(extent[2], lat), max(extent[3], lon)]
+        if len(batch) >= batch_size:
+            PointOfInterest.objects.bulk_create(batch, **update_options)
+            count += len(batch)
+            batch = []
+    if batch:
+        PointOfInterest.objects.bulk_create(batch, **update_options)
+        count += len(batch)
+    return count, tuple(extent) if extent else None
@@ -0,0 +1,96 @@
+import json
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .caching import TTLCache
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+_encoder = JSONEncoder()  # DRF's fallbacks for dates, decimals, UUIDs, lazy strings, ...
+_encoded = TTLCache(maxsize=settings.ENCODED_RESPONSE_CACHE_SIZE, ttl=settings.ENCODED_RESPONSE_CACHE_TTL)
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes, through orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_encoder.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class PreEncodedJSON(bytes):
+    """A JSON document that is already encoded; the renderers send it as-is."""
+
+
+def encode_cached(key, build):
+    """
+    The encoded body for `key` (an ETag or other version stamp that fully
+    determines the body), building and encoding it only on a miss. Bodies
+    larger than ENCODED_RESPONSE_CACHE_MAX_BYTES are encoded but not kept.
+    """
+    body = _encoded.get(key)
+    if body is None:
+        body = PreEncodedJSON(dumps(build()))
+        if len(body) <= settings.ENCODED_RESPONSE_CACHE_MAX_BYTES:
+            _encoded.set(key, body)
+    return body
+
+
+def with_fields(body, **fields):
+    """Add top-level fields to an encoded JSON object without decoding it."""
+    head = dumps(fields)
+    if body == b"{}":
+        return PreEncodedJSON(head)
+    return PreEncodedJSON(head[:-1] + b"," + body[1:])
+
+
+def stats():
+    return {"encoded": _encoded.stats(), "orjson": orjson is not None}
+
+
+def ndjson_line(data):
+    """One newline-terminated JSON document, encoded like FastJSONRenderer."""
+    return dumps(data) + b"\n"
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson (when installed) for compact output, and
+    passing PreEncodedJSON bodies through untouched. Indented output (the
+    browsable API, `; indent=N`) still goes through DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type or "", renderer_context or {})
+        if isinstance(data, PreEncodedJSON):
+            if not indent:
+                return bytes(data)
+            data = json.loads(data)
+        if indent:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Streaming actions write their own lines; this
+    renderer lets DRF accept `Accept: application/x-ndjson` and renders any
+    ordinary response (e.g. an error) as a single line.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, PreEncodedJSON):
+            return bytes(data) + b"\n"
+        return ndjson_line(data)
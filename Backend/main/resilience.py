@@ -0,0 +1,98 @@
+import time
+import random
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `burst` saved
+    up. `reserve` books the next token and says how long to wait for it, so
+    callers on any thread or event loop share one schedule.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait=None):
+        """
+        Take a token and return the seconds to wait before using it, or None
+        (taking nothing) if that would be longer than `max_wait`.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitOpen(Exception):
+    """Raised by CircuitBreaker.before_call while the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass; `failure_threshold` consecutive failures open it.
+    Open: calls fail fast for `reset_timeout` seconds.
+    Half-open: one probe call is let through; its outcome closes or reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpen()
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                # A probe that never reported back (e.g. cancelled) stops blocking after reset_timeout.
+                if self._probing and time.monotonic() - self._probe_started < self.reset_timeout:
+                    raise CircuitOpen()
+                self._probing = True
+                self._probe_started = time.monotonic()
+
+    def cancel_probe(self):
+        """Give up a half-open probe slot without a result (the call was never made)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self):
+        return {"state": self.state, "failures": self._failures}
+
+
+def backoff(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
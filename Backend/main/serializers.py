@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Itinerary
+from .models import Itinerary, ItineraryEvent
 
 class ItinerarySerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,6 +14,52 @@ class ItinerarySerializer(serializers.ModelSerializer):
             'start_date',
             'end_date',
             'reason',
-            'planning_details'
+            'planning_details',
+            'updated_at'
         ]
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'updated_at']
+
+
+class ItineraryListSerializer(serializers.ModelSerializer):
+    """List representation: everything but the planning_details blob."""
+    class Meta:
+        model = Itinerary
+        fields = [
+            'id',
+            'user',
+            'title',
+            'city',
+            'state',
+            'country',
+            'start_date',
+            'end_date',
+            'reason',
+            'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class ItineraryEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ItineraryEvent
+        fields = [
+            'id',
+            'client_id',
+            'title',
+            'category',
+            'osm_id',
+            'date',
+            'start_time',
+            'end_time',
+            'attraction',
+            'notes',
+            'updated_at'
+        ]
+        read_only_fields = ['id', 'updated_at']
+
+    def validate(self, attrs):
+        start = attrs.get('start_time', getattr(self.instance, 'start_time', None))
+        end = attrs.get('end_time', getattr(self.instance, 'end_time', None))
+        if start and end and end < start:
+            raise serializers.ValidationError({'end_time': 'End time must not be before the start time.'})
+        return attrs
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+from django.conf import settings
+from django.core.cache import cache
+
+# In-flight calls by key. Futures are concurrent.futures ones so callers on
+# different event loops (under WSGI each request runs on its own loop) can
+# still wait on the same call.
+_lock = threading.Lock()
+_inflight = {}
+_counters = {"leaders": 0, "coalesced": 0, "lock_waits": 0, "lock_timeouts": 0}
+
+
+class LeaderGone(Exception):
+    """The call a follower was waiting on was cancelled before finishing."""
+
+
+def claim(key):
+    """
+    Return (future, is_leader). The leader must make the call and `release`
+    the future; everyone else waits on it with `follow`.
+    """
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None:
+            _counters["coalesced"] += 1
+            return future, False
+        future = _inflight[key] = concurrent.futures.Future()
+        _counters["leaders"] += 1
+        return future, True
+
+
+def release(key, future, result=None, error=None):
+    with _lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+async def follow(future):
+    # shield: a cancelled follower must not cancel the shared call.
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def lock_enabled():
+    return settings.SINGLEFLIGHT_LOCK
+
+
+async def alock(key):
+    """Take the cross-process lock for a key; False if another process holds it."""
+    return await cache.aadd(f"singleflight:{key}", 1, settings.SINGLEFLIGHT_LOCK_TIMEOUT)
+
+
+async def aunlock(key):
+    await cache.adelete(f"singleflight:{key}")
+
+
+async def await_shared(lookup):
+    """
+    Poll `lookup()` (which reads the shared cache) until it returns something
+    other than None, or give up after SINGLEFLIGHT_LOCK_WAIT seconds.
+    """
+    _counters["lock_waits"] += 1
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+        result = await lookup()
+        if result is not None:
+            return result
+    _counters["lock_timeouts"] += 1
+    return None
+
+
+async def _arun(key, fn, shared):
+    if shared is None or not lock_enabled():
+        return await fn()
+    if await alock(key):
+        try:
+            return await fn()
+        finally:
+            await aunlock(key)
+    # Another process is making this call and will store the result where
+    # `shared` looks; if it does not show up in time, make the call anyway.
+    result = await await_shared(shared)
+    return result if result is not None else await fn()
+
+
+async def ado(key, fn, shared=None):
+    """
+    Run `await fn()` once for all concurrent callers with the same key in
+    this process; the others get the same result (or exception).
+    With SINGLEFLIGHT_LOCK on and a `shared` lookup given, processes also
+    coordinate through a lock in the shared cache: only the lock holder calls
+    `fn` (which must store its result where `shared` reads it), the rest poll.
+    """
+    future, leader = claim(key)
+    if not leader:
+        try:
+            return await follow(future)
+        except LeaderGone:
+            return await ado(key, fn, shared)
+    try:
+        result = await _arun(key, fn, shared)
+    except asyncio.CancelledError:
+        release(key, future, error=LeaderGone())
+        raise
+    except BaseException as e:
+        release(key, future, error=e)
+        raise
+    release(key, future, result)
+    return result
+
+
+def stats():
+    return {**_counters, "in_flight": len(_inflight)}
@@ -0,0 +1,102 @@
+import math
+import heapq
+
+from .attractions import EARTH_RADIUS_MILES
+
+
+def to_xyz(lat, lon):
+    """Unit vector of a point on the sphere."""
+    lat, lon = math.radians(float(lat)), math.radians(float(lon))
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+def chord_for_miles(miles):
+    """Straight-line distance between unit vectors `miles` apart on the surface."""
+    angle = min(miles / EARTH_RADIUS_MILES, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def miles_for_chord(chord):
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """
+    Static 3-d tree over points on the sphere (stored as unit vectors, so
+    Euclidean chord length orders points exactly like great-circle distance).
+    Supports radius and k-nearest queries; rebuild it to add points.
+    """
+
+    def __init__(self, points):
+        """`points` is an iterable of (lat, lon, item)."""
+        nodes = [(to_xyz(lat, lon), item) for lat, lon, item in points]
+        self._size = len(nodes)
+        self._root = self._build(nodes, 0)
+
+    def __len__(self):
+        return self._size
+
+    def _build(self, nodes, depth):
+        if not nodes:
+            return None
+        axis = depth % 3
+        nodes.sort(key=lambda node: node[0][axis])
+        mid = len(nodes) // 2
+        xyz, item = nodes[mid]
+        return (xyz, item, axis,
+                self._build(nodes[:mid], depth + 1),
+                self._build(nodes[mid + 1:], depth + 1))
+
+    def within(self, lat, lon, miles):
+        """[(distance_miles, item), ...] within `miles` of a point, nearest first."""
+        target = to_xyz(lat, lon)
+        limit = chord_for_miles(miles) ** 2
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            xyz, item, axis, left, right = node
+            d2 = (xyz[0] - target[0]) ** 2 + (xyz[1] - target[1]) ** 2 + (xyz[2] - target[2]) ** 2
+            if d2 <= limit:
+                found.append((d2, item))
+            diff = target[axis] - xyz[axis]
+            stack.append(left if diff < 0 else right)
+            if diff * diff <= limit:
+                stack.append(right if diff < 0 else left)
+        found.sort(key=lambda pair: pair[0])
+        return [(miles_for_chord(math.sqrt(d2)), item) for d2, item in found]
+
+    def nearest(self, lat, lon, k, miles=None):
+        """The `k` items nearest a point (optionally within `miles`), nearest first."""
+        if k <= 0:
+            return []
+        target = to_xyz(lat, lon)
+        bound = chord_for_miles(miles) ** 2 if miles is not None else math.inf
+        heap = []  # max-heap of (-d2, counter, item) holding the best k so far
+        counter = 0
+
+        def visit(node):
+            nonlocal counter
+            if node is None:
+                return
+            xyz, item, axis, left, right = node
+            d2 = (xyz[0] - target[0]) ** 2 + (xyz[1] - target[1]) ** 2 + (xyz[2] - target[2]) ** 2
+            worst = -heap[0][0] if len(heap) == k else bound
+            if d2 <= worst:
+                counter += 1
+                if len(heap) == k:
+                    heapq.heapreplace(heap, (-d2, counter, item))
+                else:
+                    heapq.heappush(heap, (-d2, counter, item))
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            worst = -heap[0][0] if len(heap) == k else bound
+            if diff * diff <= worst:
+                visit(far)
+
+        visit(self._root)
+        return [(miles_for_chord(math.sqrt(-d2)), item) for d2, _, item in sorted(heap, reverse=True)]
@@ -1,3 +1,1021 @@
-from django.test import TestCase
+import sys
+import json
+import math
+import base64
+import queue
+import asyncio
+import importlib
+import tempfile
+import time
+import threading
+import zlib
+from array import array
+from datetime import date, timedelta
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from aiohttp import web
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import geocoding, middleware, overpass, resilience, singleflight, transfer, translation, upstream, views, weather
+from .management.commands import prewarm
+from .models import GeocodeCache, IngestedRegion, Itinerary, ItineraryEvent, PointOfInterest, TranslationCache
+
+
+def upstream_config(base_url, **overrides):
+    """An UPSTREAMS entry for a local test server, with retries and limits out of the way."""
+    return {
+        "base_url": base_url, "max_connections": 10, "connect_timeout": 5, "timeout": 10, "headers": {},
+        "rate": 1000, "burst": 1000, "max_queue_wait": 5, "failure_threshold": 100, "reset_timeout": 30,
+        "retries": 0, "backoff_base": 0.01, "backoff_cap": 0.05, **overrides,
+    }
+
+
+class LocalServer:
+    """An aiohttp app served from its own thread and event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.runner = web.AppRunner(self.app)
+        asyncio.run_coroutine_threadsafe(self.runner.setup(), self.loop).result()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        asyncio.run_coroutine_threadsafe(site.start(), self.loop).result()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class APITestCase(TestCase):
+    """Requests through the full stack, authenticated with a JWT access token."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", password="s3cret-pass")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def get(self, path, **extra):
+        return self.client.get(path, **self.auth, **extra)
+
+    def post(self, path, data, **extra):
+        return self.client.post(path, data, content_type="application/json", **self.auth, **extra)
+
+
+class UpstreamSessionTests(SimpleTestCase):
+    def setUp(self):
+        async def slow(request):
+            await asyncio.sleep(0.05)  # long enough for requests on other loops to overlap
+            return web.json_response({"ok": True})
+
+        app = web.Application()
+        app.router.add_get("/slow", slow)
+        self.server = LocalServer(app).__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_concurrent_loops_keep_their_own_sessions(self):
+        sessions = []
+
+        async def many():
+            sessions.append(await upstream.get_async_session("test"))
+            return await asyncio.gather(*[upstream.arequest_json("test", "GET", "/slow") for _ in range(5)])
+
+        with override_settings(UPSTREAMS={"test": upstream_config(self.server.url)}):
+            # Like WSGI: each thread runs its request on a fresh loop via async_to_sync.
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(lambda _: async_to_sync(many)(), range(16)))
+
+        self.assertEqual(results, [[(200, {"ok": True})] * 5] * 16)
+        self.assertEqual(len({id(session) for session in sessions}), 16)
+        # Each session was closed on its own loop when that loop shut down.
+        self.assertTrue(all(session.closed for session in sessions))
+        self.assertEqual(len(upstream._async_sessions), 0)
+
+    def test_aclose_all_closes_only_the_running_loop(self):
+        async def open_and_close():
+            session = await upstream.get_async_session("test")
+            await upstream.aclose_all()
+            return session
+
+        with override_settings(UPSTREAMS={"test": upstream_config(self.server.url)}):
+            session = asyncio.run(open_and_close())
+        self.assertTrue(session.closed)
+
+    def test_sync_callers_share_one_pool(self):
+        self.addCleanup(upstream.close_all)
+        with override_settings(UPSTREAMS={"test": upstream_config(self.server.url)}):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(lambda _: upstream.request_json("test", "GET", "/slow"), range(8)))
+            session = upstream.get_session("test")
+        self.assertEqual(results, [(200, {"ok": True})] * 8)
+        self.assertIs(upstream.get_session("test"), session)
+        upstream.close_all()
+        self.assertNotIn("test", upstream._sync_sessions)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_probes_and_closes(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        with self.assertRaises(resilience.CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # the probe
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        with self.assertRaises(resilience.CircuitOpen):
+            breaker.before_call()  # one probe at a time
+        breaker.record_success()
+        self.assertEqual(breaker.stats(), {"state": breaker.CLOSED, "failures": 0})
+        breaker.before_call()
+
+    def test_failed_probe_reopens(self):
+        breaker = resilience.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        with self.assertRaises(resilience.CircuitOpen):
+            breaker.before_call()
+
+    def test_open_circuit_fails_fast_without_calling_the_host(self):
+        hits = []
+
+        async def unavailable(request):
+            hits.append(request.path)
+            return web.json_response({}, status=503)
+
+        app = web.Application()
+        app.router.add_get("/", unavailable)
+        self.addCleanup(upstream._breakers.pop, "flaky", None)
+        with LocalServer(app) as server, override_settings(
+                UPSTREAMS={"flaky": upstream_config(server.url, failure_threshold=2, reset_timeout=30)}):
+            for _ in range(2):
+                self.assertEqual(async_to_sync(upstream.arequest_json)("flaky", "GET")[0], 503)
+            with self.assertRaises(upstream.UpstreamError) as raised:
+                async_to_sync(upstream.arequest_json)("flaky", "GET")
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(len(hits), 2)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        geocoding._memory.clear()
+        self.calls = []
+
+    def nominatim(self, results):
+        async def fake(name, method, path="", **kwargs):
+            self.calls.append(kwargs["params"]["q"])
+            return 200, results
+        return mock.patch.object(geocoding, "arequest_json", fake)
+
+    async def test_long_queries_are_stored_by_hash(self):
+        city = "x" * 600
+        with self.nominatim([{"lat": "1", "lon": "2"}]):
+            self.assertEqual(await geocoding.ageocode(city), {"lat": "1", "lon": "2"})
+        geocoding._memory.clear()
+        self.assertEqual(await geocoding.ageocode(city), {"lat": "1", "lon": "2"})  # from the table
+        self.assertEqual(len(self.calls), 1)
+        entry = await GeocodeCache.objects.aget()
+        self.assertEqual(entry.query, city)
+        self.assertEqual(len(entry.query_hash), 64)
+
+    async def test_misses_are_remembered(self):
+        with self.nominatim([]):
+            self.assertIsNone(await geocoding.ageocode("Nowhere"))
+            self.assertIsNone(await geocoding.ageocode("nowhere "))
+            geocoding._memory.clear()
+            self.assertIsNone(await geocoding.ageocode("Nowhere"))
+        self.assertEqual(self.calls, ["nowhere"])
+
+    async def test_remembered_misses_expire(self):
+        with self.nominatim([]), self.settings(GEOCODE_NEGATIVE_TTL=0):
+            await geocoding.ageocode("Nowhere")
+            geocoding._memory.clear()
+            await geocoding.ageocode("Nowhere")
+        self.assertEqual(self.calls, ["nowhere", "nowhere"])
+
+
+class TranslationBatchTests(SimpleTestCase):
+    def test_pack_batches_respects_the_limit(self):
+        units = ["a" * 4, "b" * 3, "c" * 5, "d"]
+        batches = translation.pack_batches(units, max_len=9)
+        self.assertEqual(batches, [["aaaa", "bbb"], ["ccccc", "d"]])
+        self.assertTrue(all(len("\n".join(batch)) <= 9 for batch in batches))
+        self.assertEqual([unit for batch in batches for unit in batch], units)
+
+    def test_split_text(self):
+        self.assertEqual(translation.split_text("abcdefg", max_len=3), ["abc", "def", "g"])
+
+    def test_line_count_mismatch_bisects_concurrently(self):
+        units = [f"unit{i}" for i in range(8)]
+        requests = []
+        in_flight = [0, 0]  # now, max
+
+        async def fake_request(text, dest="en"):
+            requests.append(text)
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            await asyncio.sleep(0.01)
+            in_flight[0] -= 1
+            lines = text.split("\n")
+            if "unit5" in lines and len(lines) > 1:
+                lines.remove("unit5")  # the translator merged a line away
+            return "\n".join(f"EN {line}" for line in lines)
+
+        async def run():
+            return await translation._translate_batch(units, "en", asyncio.Semaphore(2))
+
+        with mock.patch.object(translation, "_request", fake_request):
+            results = asyncio.run(run())
+        self.assertEqual(results, {unit: f"EN {unit}" for unit in units})
+        # 8 -> 4 + 4 -> (4 ok) 2 + 2 -> (2 ok) 1 + 1: 7 requests, not 1 + 8.
+        self.assertEqual(len(requests), 7)
+        self.assertEqual(in_flight[1], 2)
+
+    def test_failed_batch_returns_nothing(self):
+        async def fake_request(text, dest="en"):
+            return None
+
+        with mock.patch.object(translation, "_request", fake_request):
+            results = asyncio.run(translation._translate_batch(["a", "b"], "en", asyncio.Semaphore(1)))
+        self.assertEqual(results, {})
+
+
+class WeatherBatchTests(APITestCase):
+    url = "/api/itineraries/weather/batch/"
+
+    def test_body_must_be_an_object(self):
+        response = self.post(self.url, ["Paris", "Tokyo"])
+        self.assertEqual(response.status_code, 400)
+
+    def test_cities_must_be_names(self):
+        for cities in ("Paris", [{"city": "Paris"}], ["Paris", 3]):
+            with self.subTest(cities=cities):
+                self.assertEqual(self.post(self.url, {"cities": cities}).status_code, 400)
+
+    def test_unknown_cities_are_reported_per_city(self):
+        async def nowhere(city, state="", country=""):
+            return None
+
+        with mock.patch.object(views, "ageocode", nowhere):
+            response = self.post(self.url, {"cities": ["Atlantis", " Atlantis "]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"Atlantis": {"error": "No location found for 'Atlantis'."}})
+
+
+class OverpassCacheTests(TestCase):
+    def setUp(self):
+        overpass._memory.clear()
+        cache.clear()
+        self.queries = []
+
+    async def fake_query(self, query):
+        self.queries.append(query)
+        return [
+            {"type": "node", "id": 1, "lat": 10.2, "lon": 20.2, "tags": {"tourism": "museum", "name": "A"}},
+            {"type": "node", "id": 2, "lat": 10.9, "lon": 20.9, "tags": {"tourism": "museum", "name": "B"}},
+        ]
+
+    async def test_large_boxes_are_cached_with_a_stable_version(self):
+        with mock.patch.object(overpass, "arun_query", self.fake_query):
+            first, first_version = await overpass.aget_attraction_elements(10.0, 20.0, 11.0, 21.0)
+            second, second_version = await overpass.aget_attraction_elements(10.1, 20.1, 10.95, 20.95)
+            overpass._memory.clear()
+            third, third_version = await overpass.aget_attraction_elements(10.0, 20.0, 10.8, 21.0)
+        self.assertEqual(len(self.queries), 1)  # both boxes snap to the same coarse area
+        self.assertIn("(10.0,20.0,11.0,21.0)", self.queries[0])
+        self.assertEqual(first_version, second_version)
+        self.assertEqual(first_version, third_version)  # read back from the shared cache
+        self.assertEqual([element["id"] for element in first], [1, 2])
+        self.assertEqual([element["id"] for element in third], [1])  # clipped to the box
+
+    @override_settings(OVERPASS_TILE_DEGREES=0.25, OVERPASS_MAX_TILES=16, OVERPASS_MAX_TILE_FETCHES=4)
+    async def test_cold_boxes_never_fan_out_past_the_fetch_limit(self):
+        with mock.patch.object(overpass, "arun_query", self.fake_query):
+            await overpass.aget_attraction_elements(10.1, 20.1, 10.3, 20.3)  # 2x2 tiles: fetched as tiles
+            self.assertEqual(len(self.queries), 4)
+            await overpass.aget_attraction_elements(10.1, 20.1, 10.6, 20.6)  # 3x3, 5 of them missing
+        self.assertEqual(len(self.queries), 5)
+        self.assertIn("(10.0,20.0,11.0,21.0)", self.queries[-1])  # one coarse query instead
+
+    def test_city_index_rebuilds_once_per_search(self):
+        index = overpass.CityIndex()
+        builds = []
+        tree_class = overpass.KDTree
+
+        def counting_tree(points):
+            builds.append(len(points))
+            return tree_class(points)
+
+        with mock.patch.object(overpass, "KDTree", counting_tree):
+            for i in range(5):
+                index.add([{"type": "node", "id": i, "lat": 10 + i / 100, "lon": 20, "tags": {"name": f"City {i}"}}])
+            index.add([{"type": "node", "id": 99, "lat": 10, "lon": 20, "tags": {}}])  # unnamed: skipped
+            self.assertEqual(builds, [])
+            nearest = index.search(10, 20, 50, k=2)
+            index.search(10, 20, 50, k=2)
+        self.assertEqual(builds, [5])
+        self.assertEqual([element["id"] for _, element in nearest], [0, 1])
+
+
+class TranslationIndexTests(TestCase):
+    def setUp(self):
+        translation._memory.clear()
+        translation._tokens.clear()
+
+    def test_name_pairs(self):
+        elements = [
+            {"tags": {"name": "東京駅", "name:en": "Tokyo Station", "name:zh": "东京站", "name:ja-Latn": "Tokyo-eki"}},
+            {"tags": {"name": "大英博物館"}},  # no name:en
+        ]
+        self.assertEqual(translation.name_pairs(elements), {"東京駅": "Tokyo Station", "东京站": "Tokyo Station"})
+
+    def test_compose_needs_every_part(self):
+        tokens = {"東京": "Tokyo", "博物館": "Museum"}
+        self.assertEqual(translation.compose("東京博物館", tokens), "Tokyo Museum")
+        self.assertIsNone(translation.compose("東京水族館", tokens))
+
+    async def test_words_are_learned_across_batches(self):
+        await translation.aindex_names({"東京タワー": "Tokyo Tower", "大英博物館": "British Museum"})
+        self.assertEqual(await translation.alearn_tokens(), 0)  # one pair each so far
+        await translation.aindex_names({"東京駅": "Tokyo Station", "国立博物館": "National Museum"})
+        await translation.aindex_names({"東京ドーム": "Tokyo Dome", "科学博物館": "Science Museum"})
+        self.assertEqual(await translation.alearn_tokens(), 2)
+        words = TranslationCache.objects.filter(source=translation.SOURCE_OSM_TOKEN)
+        self.assertEqual({row.source_text: row.translated_text async for row in words},
+                         {"東京": "Tokyo", "博物館": "Museum"})
+
+        async def no_network(*args, **kwargs):
+            raise AssertionError("the index should have answered")
+
+        translation._memory.clear()
+        translation._tokens.clear()
+        with mock.patch.object(translation, "_request", no_network):
+            found = await translation.translate_many(["東京博物館", "東京駅"])
+        self.assertEqual(found, {"東京博物館": "Tokyo Museum", "東京駅": "Tokyo Station"})
+        stats = translation.stats()
+        self.assertGreaterEqual(stats["token_hits"], 1)
+        self.assertGreaterEqual(stats["index_hits"], 1)
+
+    @override_settings(TRANSLATION_LEARN_INTERVAL=0)
+    def test_served_responses_are_indexed_in_the_background(self):
+        async def overpass_answer(*args, **kwargs):
+            return 200, {"elements": [{"tags": {"name": f"{place}博物館", "name:en": f"{english} Museum"}}
+                                      for place, english in (("東京", "Tokyo"), ("大阪", "Osaka"), ("京都", "Kyoto"))]}
+
+        started = []
+        with mock.patch.object(overpass, "arequest_json", overpass_answer), \
+                mock.patch.object(translation, "_start_indexer", lambda: started.append(True)):
+            elements = async_to_sync(overpass._arun_query)("[out:json];")
+        self.assertEqual(len(elements), 3)
+        self.assertEqual(started, [True])
+        self.assertFalse(TranslationCache.objects.exists())  # nothing written while serving
+
+        self.assertEqual(translation.index_pending(), 3)  # what the indexer thread runs
+        self.assertEqual(TranslationCache.objects.filter(source=translation.SOURCE_OSM).count(), 3)
+        self.assertEqual(TranslationCache.objects.get(source=translation.SOURCE_OSM_TOKEN).source_text, "博物館")
+
+    def test_full_queue_drops_responses(self):
+        with mock.patch.object(translation, "_pending", queue.Queue(maxsize=1)), \
+                mock.patch.object(translation, "_start_indexer", lambda: None):
+            before = translation.stats()["index_dropped"]
+            translation.queue_index([])
+            translation.queue_index([])
+            self.assertEqual(translation.stats()["index_dropped"], before + 1)
+
+
+class IngestOSMTests(TestCase):
+    def test_json_dump_is_ingested_in_batches(self):
+        dump = {"elements": [
+            {"type": "node", "id": 1, "lat": 48.86, "lon": 2.33,
+             "tags": {"tourism": "museum", "name": "Musée du Louvre", "name:en": "Louvre Museum"}},
+            {"type": "way", "id": 2, "tags": {"tourism": "attraction", "name": "Tour Eiffel"},
+             "geometry": [{"lat": 48.857, "lon": 2.293}, {"lat": 48.859, "lon": 2.295}]},
+            {"type": "relation", "id": 3, "center": {"lat": 48.85, "lon": 2.35},
+             "tags": {"place": "city", "name": "Paris"}},
+            {"type": "node", "id": 4, "lat": 48.87, "lon": 2.3, "tags": {"shop": "bakery", "name": "Boulangerie"}},
+        ]}
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8") as f:
+            json.dump(dump, f)
+            f.flush()
+            with mock.patch.object(PointOfInterest.objects, "bulk_create",
+                                   wraps=PointOfInterest.objects.bulk_create) as bulk_create:
+                call_command("ingest_osm", f.name, "--name", "paris", "--batch-size", "2", stdout=open("/dev/null", "w"))
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 1])
+        self.assertEqual(sorted(PointOfInterest.objects.values_list("osm_type", "kind")),
+                         [("node", "museum"), ("relation", "city"), ("way", "attraction")])
+        way = PointOfInterest.objects.get(osm_type="way")
+        self.assertAlmostEqual(way.lat, 48.858)
+        region = IngestedRegion.objects.get()
+        self.assertEqual((region.name, region.south, region.north), ("paris", 48.85, 48.86))
+        self.assertEqual(TranslationCache.objects.get(source=translation.SOURCE_OSM).translated_text, "Louvre Museum")
+
+
+class NearbyCitiesTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        overpass.city_index.clear()
+        self.addCleanup(overpass.city_index.clear)
+
+    def test_unnamed_places_do_not_use_up_the_limit(self):
+        async def paris(city, state="", country=""):
+            return {"lat": "48.85", "lon": "2.35"}
+
+        async def cities(query):
+            return [
+                {"type": "node", "id": 1, "lat": 48.851, "lon": 2.35, "tags": {"place": "city"}},
+                {"type": "node", "id": 2, "lat": 48.852, "lon": 2.35, "tags": {"place": "city", "name": "Unnamed"}},
+                {"type": "node", "id": 3, "lat": 48.853, "lon": 2.35, "tags": {"place": "city", "name:en": " "}},
+                {"type": "node", "id": 4, "lat": 48.95, "lon": 2.35, "tags": {"place": "city", "name": "Saint-Denis"}},
+                {"type": "node", "id": 5, "lat": 49.05, "lon": 2.35, "tags": {"place": "city", "name": "Chantilly"}},
+                {"type": "node", "id": 6, "lat": 49.25, "lon": 2.35, "tags": {"place": "city", "name": "Compiègne"}},
+            ]
+
+        with mock.patch.object(views, "ageocode", paris), mock.patch.object(overpass, "arun_query", cities):
+            response = self.get("/api/itineraries/nearby-cities/", data={"city": "Paris", "radius": 50, "limit": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([city["name"] for city in response.json()], ["Saint-Denis", "Chantilly"])
+
+
+class ItineraryEventTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.itinerary = Itinerary.objects.create(
+            user=self.user, title="Paris", city="Paris", country="France",
+            start_date="2026-11-02", end_date="2026-11-04",
+            planning_details={
+                "planned_1": {"date": "2026-11-02", "time": "09:30", "durationHours": 2, "durationMinutes": 15,
+                              "attractionName": "Louvre", "category": "museum", "osm_id": 42},
+                "planned_2": {"date": "2026-11-03", "time": "14:00", "durationHours": 1, "durationMinutes": 0},
+                "planned_3": {"date": "2026-11-03"},  # untimed: nothing to place on the calendar
+                "notes": "bring a coat",
+            },
+        )
+
+    def test_migration_copies_planned_entries(self):
+        ItineraryEvent.objects.create(itinerary=self.itinerary, client_id="planned_2", title="Moved",
+                                      date="2026-11-04")
+        migration = importlib.import_module("main.migrations.0011_copy_planned_events")
+        migration.copy_planned_events(apps, None)
+
+        events = {event.client_id: event for event in self.itinerary.events.all()}
+        self.assertEqual(set(events), {"planned_1", "planned_2"})
+        louvre = events["planned_1"]
+        self.assertEqual((louvre.title, louvre.category, louvre.osm_id), ("Louvre", "museum", 42))
+        self.assertEqual(louvre.end_time - louvre.start_time, timedelta(hours=2, minutes=15))
+        self.assertEqual(events["planned_2"].title, "Moved")  # rows already there are left alone
+
+    def test_bulk_upsert_moves_one_event(self):
+        path = f"/api/itineraries/{self.itinerary.id}/events/bulk/"
+        moved = {"client_id": "planned_1", "title": "Louvre", "date": "2026-11-03",
+                 "start_time": "2026-11-03T10:00:00", "end_time": "2026-11-03T12:00:00"}
+        self.assertEqual(self.post(path, {"events": [moved]}).status_code, 200)
+        moved["start_time"] = "2026-11-03T11:00:00"
+        self.assertEqual(self.post(path, {"events": [moved]}).status_code, 200)
+
+        event = self.itinerary.events.get()
+        self.assertEqual((event.client_id, event.start_time.hour), ("planned_1", 11))
+
+    def test_malformed_ids_are_not_found(self):
+        self.assertEqual(self.get("/api/itineraries/abc/events/1/").status_code, 404)
+        other = User.objects.create_user("someone-else", password="s3cret-pass")
+        event = ItineraryEvent.objects.create(itinerary=Itinerary.objects.create(
+            user=other, title="Theirs", city="Oslo", country="Norway", start_date="2026-11-02",
+            end_date="2026-11-03"), title="Private", date="2026-11-02")
+        self.assertEqual(self.get(f"/api/itineraries/{event.itinerary_id}/events/{event.id}/").status_code, 404)
+
+    def test_bulk_rejects_malformed_bodies(self):
+        path = f"/api/itineraries/{self.itinerary.id}/events/bulk/"
+        for body in (["x"], {"events": {}}, {"delete": [{"x": 1}]}, {"delete": [1]}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(path, body).status_code, 400)
+
+
+@override_settings(ITINERARY_IMPORT_BATCH_SIZE=2)
+class ImportExportTests(APITestCase):
+    def record(self, title, **extra):
+        return {"title": title, "city": "Lyon", "country": "France",
+                "start_date": "2026-12-01", "end_date": "2026-12-03", **extra}
+
+    def test_one_invalid_record_rolls_back_the_import(self):
+        records = [self.record("One"), self.record("Two"), self.record("Three", end_date="not a date")]
+        response = self.post("/api/itineraries/import/", records)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [3])
+        self.assertFalse(Itinerary.objects.exists())  # the first batch was written, then rolled back
+
+    def test_batches_after_an_error_are_only_validated(self):
+        records = [self.record("One", end_date="not a date"), self.record("Two"),
+                   self.record("Three"), self.record("Four", start_date="nope")]
+        with mock.patch.object(transfer, "_write_batch", wraps=transfer._write_batch) as write:
+            response = self.post("/api/itineraries/import/", records)
+        write.assert_not_called()
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [1, 4])
+
+    def test_duplicate_client_id_is_a_record_error(self):
+        event = {"client_id": "planned_1", "title": "Museum", "date": "2026-12-02"}
+        records = [self.record("One"), self.record("Two", events=[event, {**event, "title": "Again"}])]
+        response = self.post("/api/itineraries/import/", records)
+        self.assertEqual(response.status_code, 400)
+        [error] = response.json()["errors"]
+        self.assertEqual(error["index"], 2)
+        self.assertEqual(error["errors"]["events"][1], {"client_id": ["Duplicate client_id in this itinerary."]})
+        self.assertFalse(Itinerary.objects.exists())
+
+    def test_ical_lines_fold_between_characters(self):
+        line = "SUMMARY:" + "Café Élysée 東京 " * 12
+        folded = transfer._ical_line(line)
+        parts = folded[:-2].split(b"\r\n ")
+        self.assertTrue(all(len(part) <= 75 for part in parts))
+        self.assertTrue(all(len(part) <= 74 for part in parts[1:]))  # plus the leading space
+        for part in parts:
+            part.decode("utf-8")  # every fold lands on a character boundary
+        self.assertEqual(b"".join(parts).decode("utf-8"), line)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"forecast": "sunny"}' * 100
+
+    def request(self):
+        return RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+
+    def test_async_chain_stays_on_the_event_loop(self):
+        async def view(request):
+            return HttpResponse(self.body, content_type="application/json")
+
+        compression = middleware.CompressionMiddleware(view)
+        self.assertTrue(iscoroutinefunction(compression))
+        with mock.patch("django.utils.deprecation.sync_to_async") as hop:
+            response = async_to_sync(compression)(self.request())
+        hop.assert_not_called()
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+    def test_async_streams_are_compressed_per_chunk(self):
+        async def lines():
+            for _ in range(3):
+                yield b'{"line": 1}\n'
+
+        async def view(request):
+            return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+        response = async_to_sync(middleware.CompressionMiddleware(view))(self.request())
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(zlib.decompress(async_to_sync(read)(), 31), b'{"line": 1}\n' * 3)
+
+    def test_sync_chain(self):
+        def view(request):
+            return HttpResponse(self.body, content_type="application/json")
+
+        compression = middleware.CompressionMiddleware(view)
+        self.assertFalse(iscoroutinefunction(compression))
+        response = compression(self.request())
+        self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+
+class PrewarmTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("traveller", password="s3cret-pass")
+        start = date.today() + timedelta(days=1)
+        Itinerary.objects.create(user=user, title="Kyoto", city="Kyoto", country="Japan",
+                                 start_date=start, end_date=start + timedelta(days=2))
+        self.calls = []
+
+        async def geocode(city, state="", country=""):
+            self.calls.append("geocode")
+            return {"lat": "35.0", "lon": "135.7", "boundingbox": ["34.9", "35.1", "135.6", "135.8"]}
+
+        async def forecast(points):
+            self.calls.append("forecast")
+
+        async def attractions(south, west, north, east):
+            self.calls.append("attractions")
+            return [], 0
+
+        for name, fake in (("ageocode", geocode), ("aget_entries", forecast),
+                           ("aget_attraction_elements", attractions)):
+            patcher = mock.patch.object(prewarm, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_prewarm(self):
+        out, err = StringIO(), StringIO()
+        call_command("prewarm", "--days", "3", "--no-translate", stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_per_process_cache_warms_only_geocodes(self):
+        out, err = self.run_prewarm()
+        self.assertEqual(sorted(set(self.calls)), ["geocode"])
+        self.assertIn("Only geocodes will be warmed", err)
+        self.assertIn("Warmed 1 of 1 destinations (geocodes only)", out)
+
+    def test_shared_cache_warms_every_stage(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory,
+        }}):
+            out, err = self.run_prewarm()
+        self.assertEqual(sorted(set(self.calls)), ["attractions", "forecast", "geocode"])
+        self.assertEqual(err, "")
+        self.assertIn("Warmed 1 of 1 destinations in", out)
+
+
+class ItineraryListTests(APITestCase):
+    def add(self, title, start):
+        start = date(2027, 1, 1) + timedelta(days=start)
+        return Itinerary.objects.create(user=self.user, title=title, city="Rome", country="Italy",
+                                        start_date=start, end_date=start + timedelta(days=1))
+
+    def titles(self, response):
+        return [itinerary["title"] for itinerary in response.json()["results"]]
+
+    def test_cursor_pages_stay_stable_across_inserts(self):
+        for day in range(6):
+            self.add(f"Trip {day}", day * 2)
+        first = self.get("/api/itineraries/", data={"limit": 2})
+        self.assertEqual(self.titles(first), ["Trip 0", "Trip 1"])
+
+        self.add("Earlier", 1)  # sorts before the cursor: must not shift the next page
+        self.add("Later", 5)    # sorts after it: shows up in its place
+        second = self.get(first.json()["next"])
+        self.assertEqual(self.titles(second), ["Trip 2", "Later"])
+        third = self.get(second.json()["next"])
+        self.assertEqual(self.titles(third), ["Trip 3", "Trip 4"])
+
+    def test_date_window(self):
+        for day in range(4):
+            self.add(f"Trip {day}", day * 3)
+        response = self.get("/api/itineraries/", data={"start": "2027-01-04", "end": "2027-01-07"})
+        self.assertEqual([itinerary["title"] for itinerary in response.json()], ["Trip 1", "Trip 2"])
+
+
+class ConditionalRequestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.itinerary = Itinerary.objects.create(
+            user=self.user, title="Oslo", city="Oslo", country="Norway", start_date="2027-02-01",
+            end_date="2027-02-03",
+        )
+        self.path = f"/api/itineraries/{self.itinerary.id}/"
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_matching_if_none_match_is_not_modified(self):
+        first = self.get(self.path, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+        self.assertTrue(etag.startswith('W/"'))  # weakened by compression, still matches below
+
+        second = self.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"].removeprefix("W/"), etag.removeprefix("W/"))
+
+    def test_malformed_or_missing_pk_is_not_found(self):
+        self.assertEqual(self.get("/api/itineraries/abc/").status_code, 404)
+        self.assertEqual(self.get(f"/api/itineraries/{self.itinerary.id + 1}/").status_code, 404)
+
+    def test_changes_produce_a_new_etag(self):
+        etag = self.get(self.path)["ETag"]
+        self.itinerary.title = "Oslo and Bergen"
+        self.itinerary.save()
+        response = self.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_is_not_modified_until_an_itinerary_is_added(self):
+        etag = self.get("/api/itineraries/")["ETag"]
+        self.assertEqual(self.get("/api/itineraries/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Itinerary.objects.create(user=self.user, title="Bergen", city="Bergen", country="Norway",
+                                 start_date="2027-02-03", end_date="2027-02-04")
+        self.assertEqual(self.get("/api/itineraries/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def forecast(lat, lon, hours=3):
+    """An Open-Meteo style answer for one location."""
+    return {
+        "latitude": lat, "longitude": lon, "timezone": "UTC",
+        "hourly": {"time": [f"2027-03-01T{hour:02d}:00" for hour in range(hours)],
+                   "temperature_2m": [50.0 + hour for hour in range(hours)]},
+        "daily": {"time": ["2027-03-01"], "temperature_2m_max": [55.0], "sunrise": ["2027-03-01T06:40"]},
+    }
+
+
+class FakeOpenMeteo:
+    """Stands in for weather.arequest_json and records the Open-Meteo calls."""
+
+    def __init__(self, delay=0):
+        self.calls = []
+        self.delay = delay
+
+    async def __call__(self, name, method, path="", params=None, **kwargs):
+        self.calls.append(params)
+        await asyncio.sleep(self.delay)
+        lats, lons = params["latitude"].split(","), params["longitude"].split(",")
+        answers = [forecast(float(lat), float(lon)) for lat, lon in zip(lats, lons)]
+        return 200, answers if len(answers) > 1 else answers[0]
+
+
+class WeatherTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        weather._memory.clear()
+        cache.clear()
+        self.open_meteo = FakeOpenMeteo()
+        for target, name, fake in ((weather, "arequest_json", self.open_meteo), (views, "ageocode", self.geocode)):
+            patcher = mock.patch.object(target, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def geocode(self, city, state="", country=""):
+        return {"Paris": {"lat": "48.8566", "lon": "2.3522"}, "Versailles": {"lat": "48.8049", "lon": "2.1204"},
+                "Louvre": {"lat": "48.8606", "lon": "2.3376"}}.get(city)
+
+    def test_points_in_one_grid_cell_share_a_forecast(self):
+        points = [(48.8566, 2.3522), (48.86, 2.36), (48.8049, 2.1204)]  # the first two share a 0.1 degree cell
+        entries = async_to_sync(weather.aget_entries)(points)
+        self.assertIs(entries[0], entries[1])
+        self.assertEqual(len(self.open_meteo.calls), 1)  # both cells in one batched call
+        self.assertEqual(self.open_meteo.calls[0]["latitude"], "48.9,48.8")
+        async_to_sync(weather.aget_entries)([(48.87, 2.37)])
+        self.assertEqual(len(self.open_meteo.calls), 1)
+
+    @override_settings(WEATHER_UPDATE_INTERVAL=3600, WEATHER_UPDATE_OFFSET=600)
+    def test_entries_live_until_the_next_model_run(self):
+        boundary = 1_800_000_000 - 1_800_000_000 % 3600
+        self.assertEqual(weather.seconds_until_refresh(boundary + 600), 3600)  # a run just landed
+        self.assertEqual(weather.seconds_until_refresh(boundary + 3599), 601)
+        self.assertEqual(weather.seconds_until_refresh(boundary + 599), 1)
+
+        with mock.patch.object(weather, "seconds_until_refresh", lambda now=None: 1):
+            async_to_sync(weather.aget_entries)([(48.8566, 2.3522)])
+            async_to_sync(weather.aget_entries)([(48.8566, 2.3522)])
+            self.assertEqual(len(self.open_meteo.calls), 1)
+            time.sleep(1.1)
+            async_to_sync(weather.aget_entries)([(48.8566, 2.3522)])
+        self.assertEqual(len(self.open_meteo.calls), 2)
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.get("/api/itineraries/weather/", data={"city": "Paris"})
+        self.assertEqual(first.status_code, 200)
+        second = self.get("/api/itineraries/weather/", data={"city": "Paris"})
+        self.assertEqual(second.json()["hourly"], first.json()["hourly"])
+        self.assertIn("cache_age", second.json())
+        self.assertEqual(len(self.open_meteo.calls), 1)
+        revalidated = self.get("/api/itineraries/weather/", data={"city": "Paris"},
+                               HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_compact_encoding_packs_columns(self):
+        data = forecast(48.9, 2.4)
+        data["hourly"]["temperature_2m"][1] = None
+        encoded = weather.compact(data)
+        self.assertEqual(encoded["encoding"], "columnar-f32le-base64")
+        self.assertEqual(encoded["latitude"], 48.9)
+        hourly = encoded["hourly"]
+        self.assertEqual((hourly["start"], hourly["step"], hourly["count"]), ("2027-03-01T00:00", 3600, 3))
+        values = array("f", base64.b64decode(hourly["values"]["temperature_2m"]))
+        if sys.byteorder == "big":
+            values.byteswap()
+        self.assertEqual(values[0], 50.0)
+        self.assertTrue(math.isnan(values[1]))  # missing values travel as NaN
+        self.assertEqual(values[2], 52.0)
+        self.assertEqual(encoded["daily"]["text"]["sunrise"], ["2027-03-01T06:40"])  # not numeric: kept as-is
+
+    def test_projection_is_pushed_upstream(self):
+        response = self.get("/api/itineraries/weather/",
+                            data={"city": "Paris", "hourly": "temperature_2m", "daily": "", "days": 2,
+                                  "encoding": "compact"})
+        self.assertEqual(response.status_code, 200)
+        params = self.open_meteo.calls[0]
+        self.assertEqual((params["hourly"], params["forecast_days"]), ("temperature_2m", 2))
+        self.assertNotIn("daily", params)
+        self.assertEqual(response.json()["encoding"], "columnar-f32le-base64")
+
+        plain = self.get("/api/itineraries/weather/", data={"city": "Paris"})
+        self.assertIn("daily", plain.json())
+        self.assertEqual(len(self.open_meteo.calls), 2)  # another projection is another cache entry
+
+    def test_bad_projections_are_rejected(self):
+        for query in ({"hourly": "snowfall_depth"}, {"days": 17}, {"days": "two"}, {"days": 1, "hours": 25}):
+            with self.subTest(query=query):
+                response = self.get("/api/itineraries/weather/", data={"city": "Paris", **query})
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.open_meteo.calls, [])
+
+    def test_concurrent_misses_for_one_cell_make_one_call(self):
+        self.open_meteo.delay = 0.05
+
+        async def together():
+            return await asyncio.gather(weather.aget_entries([(48.8566, 2.3522)]),
+                                        weather.aget_entries([(48.86, 2.36)]))
+
+        first, second = async_to_sync(together)()
+        self.assertEqual(len(self.open_meteo.calls), 1)
+        self.assertEqual(first, second)
+
+    def test_stage_timings_reach_the_header_and_the_metrics(self):
+        def forecast_stages():
+            sample = 'travelcompanion_stage_seconds_count{endpoint="itinerary-data-get-weather",stage="forecast"} '
+            lines = self.client.get("/api/metrics/").content.decode().splitlines()
+            return next((int(line[len(sample):]) for line in lines if line.startswith(sample)), 0)
+
+        before = forecast_stages()
+        response = self.get("/api/itineraries/weather/", data={"city": "Paris"})
+        stages = [entry.split(";dur=")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(stages[-1], "total")
+        self.assertTrue({"geocode", "forecast", "encode"} <= set(stages))
+        self.assertEqual(forecast_stages(), before + 1)
+
+
+def place(osm_id, name, lat, lon, **tags):
+    return {"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": {"name": name, **tags}}
+
+
+class AttractionsTests(APITestCase):
+    elements = [
+        place(1, "Louvre", 48.8606, 2.3376, tourism="museum"),
+        place(2, "Eiffel Tower", 48.8584, 2.2945, tourism="attraction"),
+        place(3, "Cafe de Flore", 48.8541, 2.3326, amenity="cafe"),
+        place(4, "unnamed", 48.8500, 2.3500, tourism="artwork"),
+        {"type": "way", "id": 5, "center": {"lat": 48.8738, "lon": 2.2950},
+         "tags": {"name": "Arc de Triomphe", "tourism": "attraction"}},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.geocoded = []
+        for name, fake in (("ageocode", self.geocode), ("aget_attraction_elements", self.attraction_elements)):
+            patcher = mock.patch.object(views, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def geocode(self, city, state="", country=""):
+        self.geocoded.append(city)
+        return {"lat": "48.8566", "lon": "2.3522", "boundingbox": ["48.81", "48.91", "2.22", "2.47"],
+                "address": {"state": "Ile-de-France", "country": "France"}}
+
+    async def attraction_elements(self, south, west, north, east):
+        return self.elements, 1_800_000_000
+
+    def names(self, **params):
+        response = self.get("/api/itineraries/attractions/", data={"city": "Paris", **params})
+        self.assertEqual(response.status_code, 200)
+        return [record["name"] for record in response.json()]
+
+    def test_categories_match_tag_values_and_groups(self):
+        self.assertEqual(self.names(), ["Louvre", "Eiffel Tower", "Cafe de Flore", "Arc de Triomphe"])
+        self.assertEqual(self.names(category="museum,cafe"), ["Louvre", "Cafe de Flore"])
+        self.assertEqual(self.names(category="amenity"), ["Cafe de Flore"])
+        self.assertEqual(self.names(category="zoo"), [])
+
+    def test_sort_by_name_and_distance(self):
+        self.assertEqual(self.names(sort="name"), ["Arc de Triomphe", "Cafe de Flore", "Eiffel Tower", "Louvre"])
+        self.assertEqual(self.names(sortBy="-name"), ["Louvre", "Eiffel Tower", "Cafe de Flore", "Arc de Triomphe"])
+        response = self.get("/api/itineraries/attractions/", data={"city": "Paris", "sort": "distance"})
+        distances = [record["distance"] for record in response.json()]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(response.json()[0]["name"], "Louvre")
+        self.assertEqual(self.names(sort="-distance")[0], "Arc de Triomphe")
+
+    def test_fields_project_each_record(self):
+        response = self.get("/api/itineraries/attractions/",
+                            data={"city": "Paris", "fields": "name,distance", "category": "museum"})
+        self.assertEqual(response.json(), [{"name": "Louvre", "distance": 0.72}])
+        record = self.get("/api/itineraries/attractions/", data={"city": "Paris"}).json()[0]
+        self.assertEqual(record["country"], "France")  # filled in from the geocoder's address
+        self.assertNotIn("distance", record)
+
+    def test_cursor_pages_through_one_query(self):
+        first = self.get("/api/itineraries/attractions/", data={"city": "Paris", "sort": "name", "limit": 3}).json()
+        self.assertEqual(first["count"], 4)
+        self.assertEqual([record["name"] for record in first["results"]],
+                         ["Arc de Triomphe", "Cafe de Flore", "Eiffel Tower"])
+        second = self.get("/api/itineraries/attractions/",
+                          data={"city": "Paris", "sort": "name", "limit": 3, "cursor": first["next"]}).json()
+        self.assertEqual([record["name"] for record in second["results"]], ["Louvre"])
+        self.assertIsNone(second["next"])
+
+        other_query = self.get("/api/itineraries/attractions/",
+                               data={"city": "Paris", "sort": "-name", "cursor": first["next"]})
+        self.assertEqual(other_query.status_code, 400)
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ({"sort": "rating"}, {"fields": "name,price"}, {"limit": 0}, {"limit": "ten"},
+                      {"limit": 201}, {"cursor": "not-a-cursor"}, {"city": ""}):
+            with self.subTest(query=query):
+                response = self.get("/api/itineraries/attractions/", data={"city": "Paris", **query})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+        self.assertEqual(self.geocoded, [])  # rejected before any upstream call
+
+    def stream(self, **extra):
+        response = self.get("/api/itineraries/attractions/", **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        return response, [json.loads(line) for line in async_to_sync(read)().splitlines()]
+
+    def test_streams_ready_names_before_translations(self):
+        self.elements = [*AttractionsTests.elements, place(6, "Musée d'Orsay", 48.86, 2.3266, tourism="museum")]
+
+        async def translate_iter(texts):
+            self.assertEqual(texts, ["Musée d'Orsay"])  # only names that need it
+            await asyncio.sleep(0.01)
+            yield {"Musée d'Orsay": "Orsay Museum"}
+
+        with mock.patch.object(views, "translate_iter", translate_iter):
+            _, records = self.stream(data={"city": "Paris", "sort": "name", "stream": 1})
+        self.assertEqual([record["name"] for record in records],
+                         ["Arc de Triomphe", "Cafe de Flore", "Eiffel Tower", "Louvre", "Orsay Museum"])
+        self.assertEqual(records[-1]["osm_id"], 6)
+
+    def test_ndjson_accept_header_pages_in_headers(self):
+        response, records = self.stream(data={"city": "Paris", "sort": "name", "limit": 3, "fields": "name"},
+                                        HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(records, [{"name": "Arc de Triomphe"}, {"name": "Cafe de Flore"}, {"name": "Eiffel Tower"}])
+        self.assertEqual(response["X-Total-Count"], "4")
+        second = self.get("/api/itineraries/attractions/",
+                          data={"city": "Paris", "sort": "name", "limit": 3, "cursor": response["X-Next-Cursor"]})
+        self.assertEqual([record["name"] for record in second.json()["results"]], ["Louvre"])
+
+
+class SingleflightTests(SimpleTestCase):
+    async def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return {"answer": 42}
+
+        before = singleflight.stats()
+        results = await asyncio.gather(*[singleflight.ado("test:answer", fetch) for _ in range(5)])
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        after = singleflight.stats()
+        self.assertEqual(after["coalesced"] - before["coalesced"], 4)
+        self.assertEqual(after["in_flight"], 0)
+
+        await singleflight.ado("test:answer", fetch)  # finished calls are not reused
+        self.assertEqual(len(calls), 2)
+
+    async def test_followers_get_the_leaders_error(self):
+        async def fail():
+            await asyncio.sleep(0.02)
+            raise overpass.OverpassError("Overpass is down.", status_code=503)
+
+        results = await asyncio.gather(*[singleflight.ado("test:error", fail) for _ in range(3)],
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, overpass.OverpassError) for result in results))
+        self.assertEqual(singleflight.stats()["in_flight"], 0)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_localhost_can_scrape(self):
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn("# TYPE travelcompanion_request_seconds histogram", body)
+        self.assertIn("# TYPE travelcompanion_upstream_requests_total counter", body)
+        self.assertIn("travelcompanion_singleflight_in_flight", body)  # collector stats, read at scrape time
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"])
+    def test_other_addresses_are_refused(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="10.0.0.5").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_token_replaces_the_address_check(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.assertEqual(self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        response = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer scrape-me", REMOTE_ADDR="10.0.0.9")
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,252 @@
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from .models import Itinerary, ItineraryEvent
+from .serializers import ItineraryEventSerializer, ItinerarySerializer
+
+MAX_REPORTED_ERRORS = 100
+
+
+# --- Export ---
+
+def iter_itineraries(queryset, chunk_size):
+    """
+    Yield itineraries (with their events prefetched) in keyset-paginated
+    chunks: each chunk is one `id > last` query, so memory stays flat on any
+    backend (MySQL drivers buffer whole result sets, even for .iterator()).
+    """
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by("id").prefetch_related("events")[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1].id
+
+
+def export_record(itinerary):
+    record = ItinerarySerializer(itinerary).data
+    record["events"] = ItineraryEventSerializer(itinerary.events.all(), many=True).data
+    return record
+
+
+def jsonl_stream(queryset, chunk_size):
+    for itinerary in iter_itineraries(queryset, chunk_size):
+        yield (json.dumps(export_record(itinerary), ensure_ascii=False, separators=(",", ":"), default=str)
+               + "\n").encode("utf-8")
+
+
+def _ical_text(value):
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ical_line(line):
+    """Fold a content line at 75 octets (RFC 5545 section 3.1), CRLF-terminated."""
+    data = line.encode("utf-8")
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:  # never split a UTF-8 sequence
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def _ical_stamp(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ") if value.tzinfo \
+        else value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _local(value):
+    return value.strftime("%Y%m%dT%H%M%S")  # floating time: the trip's local clock
+
+
+def _planned_details(planning_details):
+    """(key, start, end, title) for the timed "planned_*" entries the planner saves."""
+    for key, detail in (planning_details or {}).items():
+        if not str(key).startswith("planned_") or not isinstance(detail, dict):
+            continue
+        try:
+            start = datetime.fromisoformat(f"{detail['date']}T{detail['time']}")
+            minutes = int(detail.get("durationHours") or 0) * 60 + int(detail.get("durationMinutes") or 0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        yield key, start, start + timedelta(minutes=minutes), detail.get("attractionName") or ""
+
+
+def ical_events(itinerary):
+    """VEVENT property lists for one itinerary: the trip itself plus its planned activities."""
+    stamp = _ical_stamp(itinerary.updated_at)
+    place = ", ".join(part for part in (itinerary.city, itinerary.state, itinerary.country) if part)
+    yield [
+        f"UID:itinerary-{itinerary.id}@travelcompanion",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{itinerary.start_date:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{itinerary.end_date + timedelta(days=1):%Y%m%d}",  # DTEND is exclusive
+        f"SUMMARY:{_ical_text(itinerary.title)}",
+        f"LOCATION:{_ical_text(place)}",
+        *([f"DESCRIPTION:{_ical_text(itinerary.reason)}"] if itinerary.reason else []),
+    ]
+
+    seen = set()
+    for event in itinerary.events.all():
+        seen.add(event.client_id)
+        props = [
+            f"UID:itinerary-{itinerary.id}-event-{event.id}@travelcompanion",
+            f"DTSTAMP:{_ical_stamp(event.updated_at)}",
+            f"SUMMARY:{_ical_text(event.title)}",
+        ]
+        if event.start_time:
+            props.append(f"DTSTART:{_ical_stamp(event.start_time)}")
+            if event.end_time:
+                props.append(f"DTEND:{_ical_stamp(event.end_time)}")
+        else:
+            props.append(f"DTSTART;VALUE=DATE:{event.date:%Y%m%d}")
+        if event.category:
+            props.append(f"CATEGORIES:{_ical_text(event.category)}")
+        if event.notes:
+            props.append(f"DESCRIPTION:{_ical_text(event.notes)}")
+        yield props
+
+    # Activities only saved inside planning_details (older clients).
+    for key, start, end, title in _planned_details(itinerary.planning_details):
+        if key in seen:
+            continue
+        yield [
+            f"UID:itinerary-{itinerary.id}-{_ical_text(key)}@travelcompanion",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_local(start)}",
+            f"DTEND:{_local(end)}",
+            f"SUMMARY:{_ical_text(title or itinerary.title)}",
+        ]
+
+
+def ical_stream(queryset, chunk_size):
+    yield _ical_line("BEGIN:VCALENDAR")
+    yield _ical_line("VERSION:2.0")
+    yield _ical_line("PRODID:-//Travel Companion//Itineraries//EN")
+    yield _ical_line("CALSCALE:GREGORIAN")
+    for itinerary in iter_itineraries(queryset, chunk_size):
+        lines = []
+        for props in ical_events(itinerary):
+            lines.append(_ical_line("BEGIN:VEVENT"))
+            lines.extend(_ical_line(prop) for prop in props)
+            lines.append(_ical_line("END:VEVENT"))
+        yield b"".join(lines)
+    yield _ical_line("END:VCALENDAR")
+
+
+# --- Import ---
+
+def _duplicate_client_ids(events):
+    """Positions of events repeating an earlier event's client_id (unique per itinerary)."""
+    seen, duplicates = set(), set()
+    for i, event in enumerate(events):
+        client_id = event.get("client_id")
+        if client_id is None:
+            continue
+        if client_id in seen:
+            duplicates.add(i)
+        seen.add(client_id)
+    return duplicates
+
+
+def _validate_batch(batch, errors):
+    """
+    Validate one batch of (index, record). Returns [(validated itinerary,
+    [validated events])], or None if any record in the batch is invalid
+    (its errors are appended to `errors`).
+    """
+    serializer = ItinerarySerializer(data=[record for _, record in batch], many=True)
+    valid = serializer.is_valid()
+    item_errors = [{}] * len(batch)
+    if not valid:
+        # ListSerializer.errors is a list, or an {index: errors} dict on newer DRF.
+        errors_by_item = serializer.errors
+        if isinstance(errors_by_item, dict):
+            errors_by_item = [errors_by_item.get(i, {}) for i in range(len(batch))]
+        item_errors = errors_by_item
+    item_data = serializer.validated_data if valid else [None] * len(batch)
+    validated = []
+    for (index, record), item_error, data in zip(batch, item_errors, item_data):
+        problems = dict(item_error)
+        events = record.get("events") if isinstance(record, dict) else None
+        event_data = []
+        if events:
+            event_serializer = ItineraryEventSerializer(data=events, many=True)
+            if event_serializer.is_valid():
+                event_data = event_serializer.validated_data
+                duplicates = _duplicate_client_ids(event_data)
+                if duplicates:
+                    problems["events"] = [
+                        {"client_id": ["Duplicate client_id in this itinerary."]} if i in duplicates else {}
+                        for i in range(len(event_data))
+                    ]
+            else:
+                problems["events"] = event_serializer.errors
+        if problems:
+            valid = False
+            errors.append({"index": index, "errors": problems})
+        validated.append((data, event_data))
+    return validated if valid else None
+
+
+def _write_batch(user, validated, batch_size):
+    itineraries = [Itinerary(user=user, **data) for data, _ in validated]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Itinerary.objects.bulk_create(itineraries, batch_size=batch_size)
+    else:
+        # Without RETURNING (MySQL) bulk_create leaves pks unset, so itineraries
+        # that carry events are saved one by one to link them.
+        Itinerary.objects.bulk_create([it for it, (_, events) in zip(itineraries, validated) if not events],
+                                      batch_size=batch_size)
+        for itinerary, (_, events) in zip(itineraries, validated):
+            if events:
+                itinerary.save()
+    ItineraryEvent.objects.bulk_create(
+        [ItineraryEvent(itinerary=itinerary, **event)
+         for itinerary, (_, events) in zip(itineraries, validated) for event in events],
+        batch_size=batch_size,
+    )
+    return len(itineraries)
+
+
+def import_itineraries(user, records, batch_size, limit):
+    """
+    Validate records (ItinerarySerializer fields plus an optional "events"
+    list) in batches of `batch_size` and write each valid batch with
+    bulk_create. All or nothing: once a record is invalid nothing more is
+    written (the rest are only validated, for the report) and what was
+    already written is rolled back.
+    Returns (created, errors); errors are {"index": n, "errors": {...}} with
+    1-based record indexes, at most MAX_REPORTED_ERRORS of them.
+    Raises ValueError when there are more than `limit` records.
+    """
+    errors = []
+    created = 0
+    with transaction.atomic():
+        batch = []
+        for index, record in enumerate(records, 1):
+            if index > limit:
+                raise ValueError(f"At most {limit} itineraries per import.")
+            batch.append((index, record))
+            if len(batch) == batch_size:
+                validated = _validate_batch(batch, errors)
+                if validated is not None and not errors:
+                    created += _write_batch(user, validated, batch_size)
+                batch = []
+                if len(errors) >= MAX_REPORTED_ERRORS:
+                    break
+        if batch and len(errors) < MAX_REPORTED_ERRORS:
+            validated = _validate_batch(batch, errors)
+            if validated is not None and not errors:
+                created += _write_batch(user, validated, batch_size)
+        if errors:
+            transaction.set_rollback(True)
+            return 0, errors[:MAX_REPORTED_ERRORS]
+    return created, errors
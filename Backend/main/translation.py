@@ -0,0 +1,478 @@
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .caching import TTLCache
+from .models import TranslationCache
+from .upstream import UpstreamError, arequest_json
+
+logger = logging.getLogger(__name__)
+
+SAFE_LEN = 5000  # max characters sent in one translate request
+
+# Where a TranslationCache row came from.
+SOURCE_NETWORK = "network"
+SOURCE_OSM = "osm"  # a native name and the name:en tag of the same element
+SOURCE_OSM_TOKEN = "osm_token"  # a word learned from many such pairs
+
+INDEX_LANG = "en"  # the index learns name:en only
+TOKEN_MAX_CHARS = 4  # longest word learned from names written without spaces
+
+# Bounded in-process LRU in front of the shared TranslationCache table,
+# holding (translation, source).
+_memory = TTLCache(maxsize=settings.TRANSLATION_CACHE_SIZE, ttl=settings.TRANSLATION_CACHE_TTL)
+_tokens = TTLCache(maxsize=16, ttl=settings.TRANSLATION_TOKEN_RELOAD)  # dest -> {word: translation}
+_counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "failures": 0,
+             "index_hits": 0, "token_hits": 0, "indexed_names": 0, "indexed_tokens": 0, "index_dropped": 0}
+
+# Overpass responses waiting for the indexer thread, so serving a request
+# never writes to the index itself.
+_pending = queue.Queue(maxsize=settings.TRANSLATION_INDEX_QUEUE_SIZE)
+_indexer = None
+_indexer_lock = threading.Lock()
+_last_learned = 0.0
+
+
+def source_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def aget_cached(texts, dest="en"):
+    """
+    Look up many texts at once. Returns {text: translation} for the ones
+    already known, checking memory first, then one query on the table, then
+    whether the text is made up entirely of words learned from OSM names.
+    """
+    found = {}
+    missing = {}
+    for text in set(texts):
+        entry = _memory.get((text, dest))
+        if entry is not None:
+            _counters["memory_hits"] += 1
+            _counters["index_hits"] += entry[1] != SOURCE_NETWORK
+            found[text] = entry[0]
+        else:
+            missing[source_hash(text)] = text
+
+    if missing:
+        rows = TranslationCache.objects.filter(
+            source_hash__in=list(missing), target_lang=dest
+        ).values_list("source_hash", "translated_text", "source")
+        async for digest, translated, source in rows:
+            text = missing.pop(digest)
+            _counters["db_hits"] += 1
+            _counters["index_hits"] += source != SOURCE_NETWORK
+            _memory.set((text, dest), (translated, source))
+            found[text] = translated
+
+    if missing:
+        tokens = await _atokens(dest)
+        for digest, text in list(missing.items()):
+            translated = compose(text, tokens)
+            if translated is not None:
+                del missing[digest]
+                _counters["token_hits"] += 1
+                _memory.set((text, dest), (translated, SOURCE_OSM_TOKEN))
+                found[text] = translated
+    _counters["misses"] += len(missing)
+    return found
+
+
+async def astore_many(translations, dest="en", source=SOURCE_NETWORK):
+    """Store {text: translation} pairs in memory and in bulk inserts."""
+    if not translations:
+        return
+    for text, translated in translations.items():
+        _memory.set((text, dest), (translated, source))
+    await TranslationCache.objects.abulk_create(
+        [
+            TranslationCache(
+                source_hash=source_hash(text),
+                source_text=text,
+                target_lang=dest,
+                translated_text=translated,
+                source=source,
+            )
+            for text, translated in translations.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+async def _atokens(dest):
+    """Words learned from OSM names, {word: translation}, re-read every TRANSLATION_TOKEN_RELOAD seconds."""
+    tokens = _tokens.get(dest)
+    if tokens is None:
+        rows = TranslationCache.objects.filter(
+            source=SOURCE_OSM_TOKEN, target_lang=dest
+        ).values_list("source_text", "translated_text")
+        tokens = {text: translated async for text, translated in rows}
+        _tokens.set(dest, tokens)
+    return tokens
+
+
+def _segment(word, tokens):
+    """Split a word written without spaces into known tokens, longest first."""
+    parts = []
+    i = 0
+    while i < len(word):
+        for size in range(min(TOKEN_MAX_CHARS, len(word) - i), 0, -1):
+            translated = tokens.get(word[i:i + size])
+            if translated:
+                break
+        else:
+            return None
+        parts.append(translated)
+        i += size
+    return parts
+
+
+def compose(text, tokens):
+    """
+    The translation of `text` built from learned words, in the original
+    order, or None unless every part of it is a known word.
+    """
+    if not tokens:
+        return None
+    parts = []
+    for word in text.split():
+        translated = tokens.get(word)
+        if translated:
+            parts.append(translated)
+            continue
+        segments = _segment(word, tokens)
+        if segments is None:
+            return None
+        parts.extend(segments)
+    return " ".join(parts) or None
+
+
+def name_pairs(elements):
+    """
+    {native name: English name} from OSM elements that carry name:en: the
+    `name` tag and every other name:* variant that is not plain ASCII.
+    """
+    pairs = {}
+    for element in elements:
+        tags = element.get("tags") or {}
+        english = tags.get("name:en", "").strip()
+        if not english:
+            continue
+        for key, value in tags.items():
+            if key != "name" and not (key.startswith("name:") and not key.startswith("name:en")):
+                continue
+            value = value.strip()
+            if value and value != english and not value.isascii():
+                pairs.setdefault(value, english)
+    return pairs
+
+
+def _aligned_words(native, english):
+    """
+    (side, native word, English word) candidates: the first and last word of
+    each name, or for names written without spaces (Chinese, Japanese) their
+    first and last few characters.
+    """
+    english_words = english.split()
+    if len(english_words) < 2:
+        return
+    native_words = native.split()
+    if len(native_words) > 1:
+        yield "prefix", native_words[0], english_words[0]
+        yield "suffix", native_words[-1], english_words[-1]
+        return
+    for size in range(2, min(TOKEN_MAX_CHARS, len(native) - 1) + 1):
+        yield "prefix", native[:size], english_words[0]
+        yield "suffix", native[-size:], english_words[-1]
+
+
+def learn_tokens(pairs, min_support=None):
+    """
+    Words that line up with the same English word in at least `min_support`
+    name pairs, e.g. 博物館 -> Museum from 国立博物館 / National Museum,
+    大英博物館 / British Museum, ... A shorter piece that only ever appears
+    inside a longer learned one (物館 in 博物館) is dropped.
+    """
+    min_support = min_support or settings.TRANSLATION_TOKEN_MIN_SUPPORT
+    counts = Counter()
+    for native, english in pairs.items():
+        counts.update(set(_aligned_words(native, english)))
+    totals = Counter()
+    for (side, word, _), count in counts.items():
+        totals[side, word] += count
+
+    learned = {}
+    for (side, word, translated), count in counts.most_common():
+        if count < min_support or count < 0.8 * totals[side, word] or word in learned:
+            continue
+        learned[word] = (side, translated, count)
+    return {
+        word: translated for word, (side, translated, count) in learned.items()
+        if not any(len(other) > len(word) and other_side == side and other_translated == translated
+                   and other_count == count and (other.endswith(word) if side == "suffix" else other.startswith(word))
+                   for other, (other_side, other_translated, other_count) in learned.items())
+    }
+
+
+async def aindex_names(pairs):
+    """
+    Add {native name: English name} pairs (see `name_pairs`) to the local
+    index. Names already in memory are not written again. Returns how many
+    were written.
+    """
+    fresh = {text: translated for text, translated in pairs.items() if _memory.get((text, INDEX_LANG)) is None}
+    await astore_many(fresh, INDEX_LANG, source=SOURCE_OSM)
+    _counters["indexed_names"] += len(fresh)
+    return len(fresh)
+
+
+async def alearn_tokens():
+    """
+    Learn the index's words from every name pair stored so far, replacing
+    the previous set. Run after indexing a batch of names (ingest_osm,
+    prewarm and the background indexer do), not per request. Returns the
+    number of words learned.
+    """
+    rows = TranslationCache.objects.filter(
+        source=SOURCE_OSM, target_lang=INDEX_LANG
+    ).values_list("source_text", "translated_text")
+    tokens = learn_tokens({text: translated async for text, translated in rows})
+
+    # A learned word may already be stored as a name; it becomes a word row.
+    update_options = {"update_conflicts": True, "update_fields": ["translated_text", "source"]}
+    if connection.features.supports_update_conflicts_with_target:
+        update_options["unique_fields"] = ["source_hash", "target_lang"]
+    await TranslationCache.objects.filter(source=SOURCE_OSM_TOKEN, target_lang=INDEX_LANG).adelete()
+    await TranslationCache.objects.abulk_create(
+        [
+            TranslationCache(source_hash=source_hash(word), source_text=word, target_lang=INDEX_LANG,
+                             translated_text=translated, source=SOURCE_OSM_TOKEN)
+            for word, translated in tokens.items()
+        ],
+        batch_size=500,
+        **update_options,
+    )
+    _tokens.set(INDEX_LANG, tokens)
+    _counters["indexed_tokens"] = len(tokens)
+    return len(tokens)
+
+
+def queue_index(elements):
+    """
+    Hand an Overpass response to the background indexer. Never blocks: when
+    the queue is full the response is skipped (counted in `index_dropped`).
+    """
+    try:
+        _pending.put_nowait(elements)
+    except queue.Full:
+        _counters["index_dropped"] += 1
+        return
+    _start_indexer()
+
+
+def _start_indexer():
+    global _indexer
+    with _indexer_lock:
+        if _indexer is None or not _indexer.is_alive():
+            _indexer = threading.Thread(target=_index_forever, name="translation-indexer", daemon=True)
+            _indexer.start()
+
+
+def index_pending(first=None):
+    """
+    Index the name pairs of every queued response (plus `first`) in one
+    write, and re-learn the words when new names were written and
+    TRANSLATION_LEARN_INTERVAL seconds have passed since the last time.
+    Returns the number of names written.
+    """
+    global _last_learned
+    pairs = name_pairs(first or [])
+    while True:
+        try:
+            pairs.update(name_pairs(_pending.get_nowait()))
+        except queue.Empty:
+            break
+    written = async_to_sync(aindex_names)(pairs) if pairs else 0
+    if written and time.monotonic() - _last_learned >= settings.TRANSLATION_LEARN_INTERVAL:
+        _last_learned = time.monotonic()
+        async_to_sync(alearn_tokens)()
+    return written
+
+
+def _index_forever():
+    while True:
+        elements = _pending.get()
+        try:
+            index_pending(elements)
+        except Exception:
+            logger.exception("Error indexing Overpass names")
+        finally:
+            close_old_connections()
+
+
+def split_text(text, max_len=SAFE_LEN):
+    """Split text into chunks no longer than `max_len`."""
+    return [text[i:i+max_len] for i in range(0, len(text), max_len)]
+
+
+def pack_batches(units, max_len=SAFE_LEN):
+    """
+    Greedily pack units into newline-joined batches of at most `max_len`
+    characters. Every unit must already be no longer than `max_len`.
+    """
+    batches = []
+    current = []
+    size = 0
+    for unit in units:
+        added = len(unit) + (1 if current else 0)
+        if current and size + added > max_len:
+            batches.append(current)
+            current, size = [], 0
+            added = len(unit)
+        current.append(unit)
+        size += added
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _request(text, dest="en"):
+    """
+    One upstream call (retried with backoff inside main/upstream.py).
+    Returns the translated text, or None on failure.
+    """
+    params = {
+        "client": "gtx",
+        "sl": "auto",
+        "tl": dest,
+        "dt": "t",
+        "q": text,
+    }
+    try:
+        _, data = await arequest_json("translate", "GET", "/translate_a/single", params=params)
+    except UpstreamError as e:
+        logger.warning("Error translating %r: %s", text[:50], e)
+        return None
+    if data and isinstance(data, list) and data[0]:
+        # Long input comes back as several segments; stitch them together.
+        translated_text = "".join(seg[0] for seg in data[0] if seg and seg[0])
+        if translated_text:
+            return translated_text
+    return None
+
+
+async def _translate_batch(units, dest, semaphore):
+    """
+    Translate a packed batch with a single request and map the lines back to
+    their units. If the line count does not match (the translator merged or
+    split lines), the two halves are retried concurrently, down to single
+    units. The semaphore is held only while a request is in flight.
+    """
+    async with semaphore:
+        translated = await _request("\n".join(units), dest)
+    if translated is None:
+        return {}
+    if len(units) == 1:
+        return {units[0]: translated.strip()}
+    lines = [line.strip() for line in translated.split("\n")]
+    if len(lines) == len(units):
+        return dict(zip(units, lines))
+    middle = len(units) // 2
+    first, second = await asyncio.gather(_translate_batch(units[:middle], dest, semaphore),
+                                         _translate_batch(units[middle:], dest, semaphore))
+    return {**first, **second}
+
+
+async def translate_iter(texts, dest="en", concurrency=None):
+    """
+    Translate many texts, yielding {text: translation} dicts as results become
+    available: cached translations first, then each text as soon as the
+    batches holding its parts have come back. Texts that could not be
+    translated map to themselves but are not cached.
+    """
+    texts = list(dict.fromkeys(texts))
+    found = await aget_cached(texts, dest)
+    if found:
+        yield found
+    pending = [text for text in texts if text not in found]
+    if not pending:
+        return
+
+    # Each text becomes one or more single-line units no longer than SAFE_LEN.
+    chunks = {
+        text: split_text(" ".join(text.split()), max_len=SAFE_LEN)
+        for text in pending
+    }
+    needed_by = {}
+    for text, parts in chunks.items():
+        for part in parts:
+            needed_by.setdefault(part, set()).add(text)
+    remaining = {text: set(parts) for text, parts in chunks.items()}
+    semaphore = asyncio.Semaphore(concurrency or settings.TRANSLATION_CONCURRENCY)
+
+    async def run(batch):
+        return batch, await _translate_batch(batch, dest, semaphore)
+
+    tasks = [asyncio.ensure_future(run(batch)) for batch in pack_batches(list(needed_by))]
+    translated_units = {}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            batch, batch_result = await next_done
+            translated_units.update(batch_result)
+            ready = set()
+            for unit in batch:
+                for text in needed_by[unit]:
+                    remaining[text].discard(unit)
+                    if not remaining[text]:
+                        ready.add(text)
+            results, fresh = {}, {}
+            for text in ready:
+                parts = chunks[text]
+                if all(translated_units.get(part) for part in parts):
+                    fresh[text] = results[text] = " ".join(translated_units[part] for part in parts)
+                else:
+                    _counters["failures"] += 1
+                    results[text] = text
+            await astore_many(fresh, dest)
+            if results:
+                yield results
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def translate_many(texts, dest="en", concurrency=None):
+    """
+    Translate many texts with as few upstream requests as possible.
+    Returns {text: translation}; texts that could not be translated map to
+    themselves but are not cached, so a later request tries again.
+    """
+    found = {}
+    async for results in translate_iter(texts, dest=dest, concurrency=concurrency):
+        found.update(results)
+    return found
+
+
+async def atranslate(text, dest="en"):
+    """Translate a single text; see `translate_many`."""
+    return (await translate_many([text], dest=dest))[text]
+
+
+def stats():
+    """
+    Hit/miss counters for the translation store. `index_hit_rate` is the
+    share of lookups answered by the OSM index (names or learned words).
+    """
+    lookups = _counters["memory_hits"] + _counters["db_hits"] + _counters["token_hits"] + _counters["misses"]
+    index_hits = _counters["index_hits"] + _counters["token_hits"]
+    return {**_counters, "index_hit_rate": round(index_hits / lookups, 4) if lookups else 0.0,
+            "memory": _memory.stats()}
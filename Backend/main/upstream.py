@@ -0,0 +1,287 @@
+import json
+import time
+import asyncio
+import weakref
+import threading
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import metrics
+from .resilience import CircuitBreaker, CircuitOpen, TokenBucket, backoff
+
+# Long-lived, per-host connection pools. Sync callers share one
+# requests.Session per host. An aiohttp session belongs to the event loop that
+# made it, so every loop gets its own set (under ASGI that is one loop per
+# worker; under WSGI, async_to_sync runs each request on its own loop) and the
+# set is closed on that loop when it shuts down.
+_sync_sessions = {}
+_async_sessions = weakref.WeakKeyDictionary()  # event loop -> ({name: ClientSession}, closer)
+_lock = threading.Lock()
+
+# Per-host rate limiters and circuit breakers, shared by sync callers and every loop.
+_limiters = {}
+_breakers = {}
+
+# Statuses worth retrying; they also count as failures for the circuit breaker.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 10  # seconds; longer Retry-After values are not waited out
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream host cannot be reached or times out."""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_config(name):
+    try:
+        return settings.UPSTREAMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown upstream '{name}'")
+
+
+def build_url(name, path=""):
+    return get_config(name)["base_url"].rstrip("/") + path
+
+
+def get_session(name):
+    """Return the process-wide requests.Session for an upstream host."""
+    session = _sync_sessions.get(name)
+    if session is not None:
+        return session
+    with _lock:
+        if name not in _sync_sessions:
+            config = get_config(name)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["max_connections"])
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(config.get("headers", {}))
+            _sync_sessions[name] = session
+        return _sync_sessions[name]
+
+
+async def _close_at_shutdown(sessions):
+    """
+    An async generator held open for the life of a loop: asyncio.run (and so
+    async_to_sync) finalizes it at shutdown, which closes the loop's sessions
+    on that same loop.
+    """
+    try:
+        yield
+    finally:
+        with _lock:
+            _async_sessions.pop(asyncio.get_running_loop(), None)
+        for session in list(sessions.values()):
+            await session.close()
+        sessions.clear()
+
+
+async def get_async_session(name):
+    """Return the aiohttp.ClientSession for an upstream host on the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _async_sessions.get(loop)
+    if entry is None:
+        with _lock:
+            # Loops closed without finalizing their generators cannot have
+            # requests in flight; just forget their sessions.
+            for closed in [other for other in _async_sessions if other.is_closed()]:
+                del _async_sessions[closed]
+        sessions = {}
+        entry = (sessions, _close_at_shutdown(sessions))
+        await entry[1].__anext__()  # starts it without suspending, so no other task gets in between
+        with _lock:
+            _async_sessions[loop] = entry
+    sessions = entry[0]
+    session = sessions.get(name)
+    if session is None or session.closed:
+        config = get_config(name)
+        connector = aiohttp.TCPConnector(limit=config["max_connections"], keepalive_timeout=60)
+        session = sessions[name] = aiohttp.ClientSession(
+            connector=connector,
+            headers=config.get("headers", {}),
+            timeout=aiohttp.ClientTimeout(total=config["timeout"], connect=config["connect_timeout"]),
+        )
+    return session
+
+
+def get_limiter(name):
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _lock:
+            if name not in _limiters:
+                config = get_config(name)
+                _limiters[name] = TokenBucket(config["rate"], config.get("burst", 1))
+            limiter = _limiters[name]
+    return limiter
+
+
+def get_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            if name not in _breakers:
+                config = get_config(name)
+                _breakers[name] = CircuitBreaker(config["failure_threshold"], config["reset_timeout"])
+            breaker = _breakers[name]
+    return breaker
+
+
+def _admit(name):
+    """
+    Check the circuit breaker and book a rate-limit token for one attempt.
+    Returns the seconds to wait before sending; raises UpstreamError (503)
+    when the host is failing fast or the wait would exceed `max_queue_wait`.
+    """
+    config = get_config(name)
+    breaker = get_breaker(name)
+    try:
+        breaker.before_call()
+    except CircuitOpen:
+        raise UpstreamError(f"{name} is unavailable (circuit open)", status_code=503)
+    wait = get_limiter(name).reserve(max_wait=config["max_queue_wait"])
+    if wait is None:
+        breaker.cancel_probe()  # nothing was sent, so nothing was learned about the host
+        raise UpstreamError(f"{name} rate limit exceeded", status_code=503)
+    return wait
+
+
+def _retry_delay(config, attempt, retry_after=None):
+    delay = backoff(attempt, config["backoff_base"], config["backoff_cap"])
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), MAX_RETRY_AFTER))
+        except ValueError:
+            pass  # HTTP-date form; fall back to the jittered delay
+    return delay
+
+
+def _observe(name, outcome, started, size=None):
+    metrics.upstream_requests.inc(name, outcome)
+    metrics.upstream_seconds.observe(time.perf_counter() - started, name)
+    if size is not None:
+        metrics.upstream_bytes.observe(size, name)
+
+
+def _parse_json(resp):
+    try:
+        return resp.json()
+    except ValueError:
+        return None
+
+
+def request_json(name, method, path="", **kwargs):
+    """
+    Blocking counterpart of `arequest_json` for sync callers (management
+    commands, sync views): the same rate limit, circuit breaker and retries,
+    over the host's pooled requests.Session.
+    Returns (status_code, parsed JSON body or None if the body is not JSON).
+    """
+    config = get_config(name)
+    kwargs.setdefault("timeout", (config["connect_timeout"], config["timeout"]))
+    breaker = get_breaker(name)
+    attempts = 1 + config["retries"]
+    for attempt in range(attempts):
+        time.sleep(_admit(name))
+        started = time.perf_counter()
+        try:
+            resp = get_session(name).request(method, build_url(name, path), **kwargs)
+        except requests.RequestException as e:
+            _observe(name, "timeout" if isinstance(e, requests.Timeout) else "error", started)
+            breaker.record_failure()
+            if attempt + 1 == attempts:
+                if isinstance(e, requests.Timeout):
+                    raise UpstreamError(f"{name} timed out", status_code=504)
+                raise UpstreamError(f"{name} request error: {e}")
+            metrics.upstream_retries.inc(name)
+            time.sleep(_retry_delay(config, attempt))
+            continue
+        _observe(name, resp.status_code, started, len(resp.content))
+        if resp.status_code not in RETRY_STATUSES:
+            breaker.record_success()
+            return resp.status_code, _parse_json(resp)
+        breaker.record_failure()
+        if attempt + 1 == attempts:
+            return resp.status_code, _parse_json(resp)
+        metrics.upstream_retries.inc(name)
+        time.sleep(_retry_delay(config, attempt, resp.headers.get("Retry-After")))
+
+
+async def _asend(name, method, path, **kwargs):
+    session = await get_async_session(name)
+    started = time.perf_counter()
+    try:
+        async with session.request(method, build_url(name, path), **kwargs) as resp:
+            body = await resp.read()
+            _observe(name, resp.status, started, len(body))
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                data = None
+            return resp.status, data, resp.headers.get("Retry-After")
+    except asyncio.TimeoutError:
+        _observe(name, "timeout", started)
+        raise UpstreamError(f"{name} timed out", status_code=504)
+    except aiohttp.ClientError as e:
+        _observe(name, "error", started)
+        raise UpstreamError(f"{name} request error: {e}")
+
+
+async def arequest_json(name, method, path="", **kwargs):
+    """
+    Make a request to an upstream host over its pooled session, within the
+    host's rate limit and circuit breaker. Connection errors, timeouts and
+    RETRY_STATUSES are retried up to `retries` times with jittered backoff.
+    Returns (status_code, parsed JSON body or None if the body is not JSON).
+    """
+    config = get_config(name)
+    breaker = get_breaker(name)
+    attempts = 1 + config["retries"]
+    for attempt in range(attempts):
+        await asyncio.sleep(_admit(name))
+        try:
+            status, data, retry_after = await _asend(name, method, path, **kwargs)
+        except UpstreamError:
+            breaker.record_failure()
+            if attempt + 1 == attempts:
+                raise
+            metrics.upstream_retries.inc(name)
+            await asyncio.sleep(_retry_delay(config, attempt))
+            continue
+        if status not in RETRY_STATUSES:
+            breaker.record_success()
+            return status, data
+        breaker.record_failure()
+        if attempt + 1 == attempts:
+            return status, data
+        metrics.upstream_retries.inc(name)
+        await asyncio.sleep(_retry_delay(config, attempt, retry_after))
+
+
+def stats():
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+async def aclose_all():
+    """Close the pools owned by the running loop now (e.g. at the end of a command)."""
+    with _lock:
+        entry = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        sessions, closer = entry
+        for session in list(sessions.values()):
+            await session.close()
+        sessions.clear()
+        await closer.aclose()
+
+
+def close_all():
+    """Close the sync pools (the async ones close with their loops, or via aclose_all)."""
+    with _lock:
+        for session in _sync_sessions.values():
+            session.close()
+        _sync_sessions.clear()
@@ -1,10 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ItineraryViewSet
+from .views import ItineraryViewSet, ItineraryDataViewSet, metrics_view
 
 router = DefaultRouter()
+# Registered first so /itineraries/weather/ etc. are matched before the detail route.
+router.register('itineraries', ItineraryDataViewSet, basename='itinerary-data')
 router.register('itineraries', ItineraryViewSet, basename='itinerary')
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
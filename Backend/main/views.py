@@ -1,278 +1,618 @@
 import re
 import asyncio
-import httpx
-import requests
-import aiohttp
 import time
-from asgiref.sync import async_to_sync
-from rest_framework import viewsets, status
+from datetime import date
+from adrf.viewsets import ViewSet as AsyncViewSet
+from rest_framework import generics, viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework import viewsets, status
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .conditional import make_etag, not_modified, with_validators
+from .models import Itinerary, ItineraryEvent
+from .pagination import ItineraryCursorPagination
+from .parsers import NDJSONParser
+from .serializers import ItineraryEventSerializer, ItineraryListSerializer, ItinerarySerializer
+from .attractions import (
+    METERS_PER_MILE, InvalidQuery, decode_cursor, element_coords, encode_cursor, haversine_miles,
+    matches_category, parse_categories, parse_fields, parse_sort, project, query_fingerprint,
+)
+from .geocoding import GeocodingError, ageocode, normalize_query
+from . import metrics
+from .metrics import stage
+from .overpass import OverpassError, aget_attraction_elements, aget_nearby_cities, city_name
+from .renderers import NDJSONRenderer, encode_cached, ndjson_line, with_fields
+from .transfer import ical_stream, import_itineraries, jsonl_stream
+from .translation import translate_iter, translate_many
+from .weather import (
+    DEFAULT_PARAMS as DEFAULT_FORECAST_PARAMS, ForecastError, aget_entries as aget_forecast_entries,
+    aget_forecasts, snap as snap_forecast_cell,
+    build_params as build_forecast_params, compact as compact_forecast,
+)
+
+
+def forecast_options(query_params):
+    """
+    Read the weather projection from the query string:
+    ?hourly=a,b&daily=c&days=N&hours=N&encoding=compact
+    Returns (Open-Meteo params, compact flag); raises ValueError when invalid.
+    """
+    params = build_forecast_params(
+        hourly=query_params.get("hourly"),
+        daily=query_params.get("daily"),
+        days=query_params.get("days"),
+        hours=query_params.get("hours"),
+    )
+    return params, query_params.get("encoding") == "compact"
+
+
+def present_forecast(meteo_data, age, params=DEFAULT_FORECAST_PARAMS, compact=False):
+    """
+    Add the cache age to a cached forecast (unless `age` is None), cap the
+    daily series and encode it.
+    """
+    meteo_data = {**meteo_data, "cache_age": age} if age is not None else dict(meteo_data)
+    days = params.get("forecast_days", 10)
+    daily = meteo_data.get("daily")
+    if daily and len(daily.get("time", [])) > days:
+        meteo_data["daily"] = {key: values[:days] for key, values in daily.items()}
+    return compact_forecast(meteo_data) if compact else meteo_data
+
 
-from .models import Itinerary
-from .serializers import ItinerarySerializer
+async def stream_records(items, untranslated, build_record):
+    """
+    NDJSON body for a streamed result list: items whose names need no
+    translation are sent at once, the rest as their translations arrive.
+    """
+    waiting = {}
+    for item in items:
+        if item["name"] in untranslated:
+            waiting.setdefault(item["name"], []).append(item)
+        else:
+            yield ndjson_line(build_record(item))
+    async for translations in translate_iter(list(waiting)):
+        for name, translated in translations.items():
+            for item in waiting.pop(name, []):
+                item["name"] = translated
+                yield ndjson_line(build_record(item))
+
+
+def parse_date_param(query_params, name):
+    value = query_params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({"error": f"'{name}' must be a date (YYYY-MM-DD)."})
 
-# Simple in-memory cache for translations.
-translation_cache = {}
 
 class ItineraryViewSet(viewsets.ModelViewSet):
+    """
+    CRUD for the user's itineraries. The list accepts:
+      start=YYYY-MM-DD / end=YYYY-MM-DD  only itineraries overlapping that window
+      limit=N / cursor=...               cursor pagination in date order; the
+                                         response becomes {"next", "previous", "results"}
+      details=1                          include planning_details (left out of lists
+                                         by default)
+    Export takes the same start/end window.
+    """
     serializer_class = ItinerarySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ItineraryCursorPagination
+
+    def wants_details(self):
+        return self.request.query_params.get("details", "").lower() in ("1", "true")
 
     def get_queryset(self):
-        return Itinerary.objects.filter(user=self.request.user)
+        queryset = Itinerary.objects.filter(user=self.request.user)
+        if self.action in ("events", "bulk_events"):
+            return queryset.only("id", "user")  # event actions never need the itinerary's own columns
+        if self.action not in ("list", "export"):
+            return queryset
+        start = parse_date_param(self.request.query_params, "start")
+        end = parse_date_param(self.request.query_params, "end")
+        if start and end and start > end:
+            raise ValidationError({"error": "'start' must not be after 'end'."})
+        if start:
+            queryset = queryset.filter(end_date__gte=start)
+        if end:
+            queryset = queryset.filter(start_date__lte=end)
+        if self.action == "list" and not self.wants_details():
+            queryset = queryset.defer("planning_details")
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "list" and not self.wants_details():
+            return ItineraryListSerializer
+        return ItinerarySerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        # Check the version stamp first, so a 304 never loads planning_details.
+        # DRF's get_object_or_404 also turns a malformed pk into a 404.
+        updated_at = generics.get_object_or_404(self.get_queryset().values_list("updated_at", flat=True),
+                                                pk=kwargs["pk"])
+        etag = make_etag("itinerary", kwargs["pk"], updated_at)
+        last_modified = updated_at.timestamp()
+        return (not_modified(request, etag, last_modified)
+                or with_validators(super().retrieve(request, *args, **kwargs), etag, last_modified))
+
+    def list(self, request, *args, **kwargs):
+        # One aggregate over the filtered rows: any create, update or delete changes it.
+        version = self.filter_queryset(self.get_queryset()).aggregate(count=Count("id"), latest=Max("updated_at"))
+        etag = make_etag("itineraries", request.user.pk, sorted(request.query_params.lists()),
+                         version["count"], version["latest"])
+        last_modified = version["latest"].timestamp() if version["latest"] else None
+        return (not_modified(request, etag, last_modified)
+                or with_validators(super().list(request, *args, **kwargs), etag, last_modified))
+
+    @action(detail=True, methods=['get', 'post'], url_path='events')
+    def events(self, request, pk=None):
+        """
+        GET  /api/itineraries/<id>/events/  the itinerary's events in time order
+        POST /api/itineraries/<id>/events/  add one event
+        """
+        itinerary = self.get_object()
+        if request.method == 'GET':
+            events = itinerary.events.order_by('date', 'start_time', 'id')
+            return Response(ItineraryEventSerializer(events, many=True).data)
+        serializer = ItineraryEventSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save(itinerary=itinerary)
+        except IntegrityError:
+            return Response({"error": "An event with this client_id already exists."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get', 'patch', 'delete'], url_path=r'events/(?P<event_id>\d+)')
+    def event_detail(self, request, pk=None, event_id=None):
+        """
+        GET/PATCH/DELETE /api/itineraries/<id>/events/<event_id>/
+        Moving or editing one event touches only that row.
+        """
+        event = generics.get_object_or_404(ItineraryEvent, pk=event_id, itinerary_id=pk,
+                                           itinerary__user=request.user)
+        if request.method == 'DELETE':
+            event.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.method == 'GET':
+            return Response(ItineraryEventSerializer(event).data)
+        serializer = ItineraryEventSerializer(event, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save()
+        except IntegrityError:
+            return Response({"error": "An event with this client_id already exists."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['post'], url_path='events/bulk')
+    def bulk_events(self, request, pk=None):
+        """
+        POST /api/itineraries/<id>/events/bulk/
+        {"events": [{"client_id": ..., ...}, ...], "delete": ["<client_id>", ...]}
+
+        Upserts events by client_id (bulk_create for new ones, bulk_update for
+        the rest, touching only the fields sent) and deletes the listed ones,
+        in one transaction.
+        """
+        itinerary = self.get_object()
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+        items = request.data.get("events", [])
+        deletes = request.data.get("delete", [])
+        if not isinstance(items, list) or not isinstance(deletes, list):
+            return Response({"error": "'events' and 'delete' must be lists."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(client_id, str) for client_id in deletes):
+            return Response({"error": "'delete' must list client_id strings."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(items) + len(deletes) > settings.ITINERARY_EVENTS_BULK_MAX:
+            return Response({"error": f"At most {settings.ITINERARY_EVENTS_BULK_MAX} events per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ItineraryEventSerializer(data=items, many=True)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+        client_ids = [row.get("client_id") for row in rows]
+        if not all(client_ids):
+            return Response({"error": "Every event needs a client_id."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(set(client_ids)) != len(client_ids):
+            return Response({"error": "Duplicate client_id in request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        existing = {event.client_id: event for event in itinerary.events.filter(client_id__in=client_ids)}
+        to_create, to_update, update_fields = [], [], {"updated_at"}
+        now = timezone.now()
+        for row in rows:
+            event = existing.get(row["client_id"])
+            if event is None:
+                to_create.append(ItineraryEvent(itinerary=itinerary, **row))
+                continue
+            for field, value in row.items():
+                setattr(event, field, value)
+            update_fields.update(row)
+            event.updated_at = now
+            to_update.append(event)
+
+        batch_size = settings.ITINERARY_EVENTS_BATCH_SIZE
+        with transaction.atomic():
+            deleted = itinerary.events.filter(client_id__in=deletes).delete()[0] if deletes else 0
+            ItineraryEvent.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                ItineraryEvent.objects.bulk_update(to_update, sorted(update_fields), batch_size=batch_size)
+
+        saved = itinerary.events.filter(client_id__in=client_ids).order_by('date', 'start_time', 'id')
+        return Response({
+            "created": len(to_create),
+            "updated": len(to_update),
+            "deleted": deleted,
+            "events": ItineraryEventSerializer(saved, many=True).data,
+        })
+
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[JSONParser, NDJSONParser])
+    def import_itineraries(self, request):
+        """
+        POST /api/itineraries/import/
+        A JSON list, or JSON Lines (Content-Type: application/x-ndjson), of
+        itineraries in the export format (optionally with "events"). Records
+        are validated and inserted in batches; nothing is saved unless all
+        of them are valid.
+        """
+        records = request.data
+        if isinstance(records, (dict, str)):
+            return Response({"error": "Expected a list of itineraries or JSON Lines."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            created, errors = import_itineraries(request.user, records, settings.ITINERARY_IMPORT_BATCH_SIZE,
+                                                 settings.ITINERARY_IMPORT_MAX)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if errors:
+            return Response({"error": "Some itineraries are invalid; nothing was imported.", "errors": errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"created": created}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<export_format>jsonl|ics)')
+    def export(self, request, export_format=None):
+        """
+        GET /api/itineraries/export/jsonl/  one itinerary (with its events) per line
+        GET /api/itineraries/export/ics/    an iCalendar feed of trips and planned activities
+        Both are streamed, reading the itineraries in chunks.
+        """
+        queryset = self.get_queryset()
+        chunk_size = settings.ITINERARY_EXPORT_CHUNK_SIZE
+        if export_format == "ics":
+            response = StreamingHttpResponse(ical_stream(queryset, chunk_size),
+                                             content_type="text/calendar; charset=utf-8")
+        else:
+            response = StreamingHttpResponse(jsonl_stream(queryset, chunk_size),
+                                             content_type=NDJSONRenderer.media_type)
+        response["Content-Disposition"] = f'attachment; filename="itineraries.{export_format}"'
+        return response
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+
+class ItineraryDataViewSet(AsyncViewSet):
+    """
+    External-data actions served under /itineraries/ (weather, attractions,
+    nearby cities). The handlers are native coroutines, so when the project
+    is served through travelcompanion/asgi.py a single worker can keep many
+    upstream requests in flight. CRUD stays on the sync ItineraryViewSet.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
     @action(detail=False, methods=['get'], url_path='weather')
-    def get_weather(self, request):
+    async def get_weather(self, request):
         """
         Example endpoint: /api/itineraries/weather/?city=LosAngeles
         Uses Nominatim to get coordinates for the given city and then fetches
         hourly and daily forecast data from the free Open-Meteo API.
+        The response carries `cache_age` (and an `Age` header) in seconds.
+        The ETag / Last-Modified come from the cached forecast's fetch time, so
+        polling with If-None-Match gets a 304 until the next model update. The
+        ETag is weak because `cache_age` in the body keeps counting.
+
+        Optional projection, pushed upstream: hourly=<vars>, daily=<vars>,
+        days=<1-16>, hours=<n>; encoding=compact returns packed columns.
         """
         city = request.query_params.get('city')
         if not city:
             return Response({"error": "City parameter is required"},
                             status=status.HTTP_400_BAD_REQUEST)
         try:
-            # Get latitude and longitude via Nominatim
-            nominatim_url = "https://nominatim.openstreetmap.org/search"
-            geo_params = {
-                "q": city,
-                "format": "json",
-                "limit": 1
-            }
-            headers = {"User-Agent": "YourAppName/1.0"}
-            geo_resp = requests.get(nominatim_url, params=geo_params, headers=headers)
-            geo_data = geo_resp.json()
-            if not geo_data:
-                return Response({"error": f"No location found for '{city}'."},
-                                status=status.HTTP_404_NOT_FOUND)
-            lat = geo_data[0]["lat"]
-            lon = geo_data[0]["lon"]
-        except Exception as e:
+            params, compact = forecast_options(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Get latitude and longitude via the shared geocoding cache
+            with stage("geocode"):
+                location = await ageocode(city)
+        except GeocodingError as e:
             return Response({"error": f"Geocoding error: {str(e)}"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                            status=e.status_code)
+        if not location:
+            return Response({"error": f"No location found for '{city}'."},
+                            status=status.HTTP_404_NOT_FOUND)
+        lat = location["lat"]
+        lon = location["lon"]
 
         try:
-            # Build the Open-Meteo API request URL and parameters.
-            meteo_url = "https://api.open-meteo.com/v1/forecast"
-            meteo_params = {
-                "latitude": lat,
-                "longitude": lon,
-                "hourly": "temperature_2m,precipitation,relativehumidity_2m,windspeed_10m,winddirection_10m,weathercode",
-                "daily": "temperature_2m_max,temperature_2m_min,uv_index_max,sunrise,sunset,weathercode",
-                "timezone": "auto",
-                "temperature_unit": "fahrenheit",
-                "forecast_days": 10
-            }
-            meteo_resp = requests.get(meteo_url, params=meteo_params)
-            meteo_data = meteo_resp.json()
-            if meteo_resp.status_code == 200:
-                # Optionally limit the daily forecast to 7 days if more are returned
-                if "daily" in meteo_data and "time" in meteo_data["daily"]:
-                    num_days = len(meteo_data["daily"]["time"])
-                    if num_days > 10:
-                        for key in meteo_data["daily"]:
-                            meteo_data["daily"][key] = meteo_data["daily"][key][:10]
-                return Response(meteo_data, status=status.HTTP_200_OK)
+            # Forecasts are shared per grid cell until the next model update.
+            with stage("forecast"):
+                entry = (await aget_forecast_entries([(lat, lon)], params))[0]
+        except ForecastError as e:
+            return Response({"error": f"Forecast error: {str(e)}"}, status=e.status_code)
+
+        fetched_at = entry["fetched_at"]
+        etag = make_etag("forecast", snap_forecast_cell(lat, lon), params, compact, fetched_at, weak=True)
+        cached = not_modified(request, etag, fetched_at)
+        if cached:
+            return cached
+        age = int(time.time() - fetched_at)
+        # The forecast is encoded once per model update; only cache_age is added per request.
+        with stage("encode"):
+            body = encode_cached(etag, lambda: present_forecast(entry["data"], None, params, compact))
+        response = Response(with_fields(body, cache_age=age), status=status.HTTP_200_OK,
+                            headers={"Age": str(age)})
+        return with_validators(response, etag, fetched_at)
+
+    @action(detail=False, methods=['get', 'post'], url_path='weather/batch')
+    async def get_weather_batch(self, request):
+        """
+        GET  /api/itineraries/weather/batch/?city=Paris&city=Tokyo
+        POST /api/itineraries/weather/batch/  {"cities": ["Paris", "Tokyo"]}
+
+        Geocodes every city concurrently and fetches all missing forecasts in
+        as few Open-Meteo calls as possible. Returns one object keyed by city;
+        cities that fail carry an "error" entry instead of a forecast.
+        Accepts the same projection/encoding query parameters as /weather/.
+        """
+        try:
+            params, compact = forecast_options(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'POST':
+            if not isinstance(request.data, dict):
+                return Response({"error": "Expected a JSON object with a 'cities' list."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            cities = request.data.get("cities", [])
+        else:
+            cities = request.query_params.getlist("city")
+        if not isinstance(cities, list) or not all(isinstance(city, str) for city in cities):
+            return Response({"error": "'cities' must be a list of city names."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cities = list(dict.fromkeys(city.strip() for city in cities if city.strip()))
+        if not cities:
+            return Response({"error": "At least one city is required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(cities) > settings.WEATHER_BATCH_MAX_CITIES:
+            return Response({"error": f"At most {settings.WEATHER_BATCH_MAX_CITIES} cities per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with stage("geocode"):
+            locations = await asyncio.gather(*[ageocode(city) for city in cities], return_exceptions=True)
+        results = {}
+        located = []
+        for city, location in zip(cities, locations):
+            if isinstance(location, GeocodingError):
+                results[city] = {"error": f"Geocoding error: {str(location)}"}
+            elif isinstance(location, Exception):
+                raise location
+            elif not location:
+                results[city] = {"error": f"No location found for '{city}'."}
             else:
-                return Response({"error": meteo_data.get("error", "Error fetching forecast")},
-                                status=meteo_resp.status_code)
-        except Exception as e:
-            return Response({"error": f"Forecast error: {str(e)}"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-    @action(detail=False, methods=['get'], url_path='attractions')
-    def get_attractions(self, request):
-        # Synchronously call the async implementation.
-        return async_to_sync(self._async_get_attractions)(request)
+                located.append((city, location))
 
-    async def _async_get_attractions(self, request):
+        if located:
+            try:
+                with stage("forecast"):
+                    forecasts = await aget_forecasts(
+                        [(location["lat"], location["lon"]) for _, location in located], params)
+            except ForecastError as e:
+                return Response({"error": f"Forecast error: {str(e)}"}, status=e.status_code)
+            for (city, _), (meteo_data, age) in zip(located, forecasts):
+                results[city] = present_forecast(meteo_data, age, params, compact)
+
+        return Response({city: results[city] for city in cities}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='attractions')
+    async def get_attractions(self, request):
         """
         Asynchronous attractions endpoint.
-        Uses aiohttp for all external calls with high concurrency and HTTP/2 enabled.
+        Uses the pooled upstream clients (main/upstream.py) for all external calls.
         Skips translation for names that are already English (using isascii()).
+
+        Optional parameters:
+          category=museum,amenity  tag values, or "tourism"/"amenity" for a whole group
+          sort (or sortBy)=name|-name|distance|-distance  distance is from the city centre
+          fields=name,lat,lon      only return these keys
+          limit=N / cursor=...     cursor pagination; the response becomes
+                                   {"count", "next", "results"}. Without them the
+                                   full list is returned as before.
+          stream=1 (or Accept: application/x-ndjson)
+                                   stream one JSON record per line: names that need
+                                   no translation right away, the others as their
+                                   translations finish (so not in `sort` order).
+                                   Pagination goes in the X-Total-Count and
+                                   X-Next-Cursor headers.
+        Only the names on the returned page are translated.
         """
-        # Set up a connector with high concurrency and HTTP/2 (experimental).
-        connector = aiohttp.TCPConnector(limit=300, force_close=False)
-        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=15)) as session:
-            # Helper: split text into chunks if too long.
-            def split_text(text, max_len=4900):
-                return [text[i:i+max_len] for i in range(0, len(text), max_len)]
-            
-            # --- Geocoding using aiohttp ---
-            city = request.query_params.get("city", "").strip()
-            state = request.query_params.get("state", "").strip()
-            country = request.query_params.get("country", "").strip()
-            if not city:
-                return Response({"error": "City parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            nominatim_url = "https://nominatim.openstreetmap.org/search"
-            search_query = city
-            if state:
-                search_query += f", {state}"
-            if country:
-                search_query += f", {country}"
-            search_params = {
-                "q": search_query,
-                "format": "json",
-                "addressdetails": 1,
-                "limit": 1
-            }
-            try:
-                async with session.get(nominatim_url, params=search_params, headers={"User-Agent": "YourAppName/1.0 (https://example.com)"}) as resp:
-                    if resp.status != 200:
-                        return Response({"error": "Error fetching location from Nominatim"}, status=resp.status)
-                    results = await resp.json()
-                    if not results:
-                        return Response({"error": f"No results found for '{search_query}'."}, status=404)
-                    address = results[0].get("address", {})
-                    state = state or address.get("state", "")
-                    country = country or address.get("country", "")
-                    bounding_box = results[0].get("boundingbox", [])
-                    if len(bounding_box) < 4:
-                        return Response({"error": "Could not retrieve bounding box for the specified location."}, status=404)
-                    south, north, west, east = bounding_box
-            except Exception as e:
-                return Response({"error": f"Nominatim request error: {str(e)}"}, status=500)
-            
-            # --- Overpass Query using aiohttp ---
-            overpass_bbox = f"{south},{west},{north},{east}"
-            tourism_tags = (
-                "museum|gallery|zoo|theme_park|viewpoint|attraction|aquarium|information|"
-                "artwork|camp_site|caravan_site|guest_house|hostel|motel|picnic_site|hotel|"
-            )
-            overpass_url = "https://overpass-api.de/api/interpreter"
-            overpass_query = f"""
-            [out:json][timeout:25];
-            (
-              node["tourism"~"{tourism_tags}"]({overpass_bbox});
-              way["tourism"~"{tourism_tags}"]({overpass_bbox});
-              relation["tourism"~"{tourism_tags}"]({overpass_bbox});
-              node["amenity"="restaurant"]({overpass_bbox});
-              way["amenity"="restaurant"]({overpass_bbox});
-              relation["amenity"="restaurant"]({overpass_bbox});
-            );
-            out center;
-            """
-            try:
-                async with session.post(overpass_url, data=overpass_query.encode('utf-8')) as resp:
-                    if resp.status != 200:
-                        return Response({"error": "Error fetching attractions from Overpass"}, status=resp.status)
-                    overpass_data = await resp.json()
-            except Exception as e:
-                return Response({"error": f"Overpass request error: {str(e)}"}, status=500)
-            
-            # --- Prepare attractions for translation ---
-            processed_attractions = []
-            SAFE_LEN = 5000
-            names_to_translate = []  # each item: a string or list of chunks
-            indices_to_translate = []  # indices in processed_attractions needing translation
-            
-            for element in overpass_data.get("elements", []):
+        # --- Geocoding (shared cache, Nominatim on a miss) ---
+        city = request.query_params.get("city", "").strip()
+        state = request.query_params.get("state", "").strip()
+        country = request.query_params.get("country", "").strip()
+        if not city:
+            return Response({"error": "City parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            categories = parse_categories(request.query_params.get("category"))
+            sort = parse_sort(request.query_params.get("sort") or request.query_params.get("sortBy"))
+            fields = parse_fields(request.query_params.get("fields"))
+            stream = (request.query_params.get("stream", "").lower() in ("1", "true")
+                      or request.accepted_renderer.format == NDJSONRenderer.format)
+            limit = request.query_params.get("limit")
+            cursor = request.query_params.get("cursor")
+            paginate = bool(limit or cursor)
+            if paginate:
+                limit = int(limit) if limit else settings.ATTRACTIONS_PAGE_SIZE
+                if not 1 <= limit <= settings.ATTRACTIONS_MAX_PAGE_SIZE:
+                    raise InvalidQuery(f"'limit' must be between 1 and {settings.ATTRACTIONS_MAX_PAGE_SIZE}.")
+                fingerprint = query_fingerprint(normalize_query(city, state, country), sorted(categories), sort)
+                offset = decode_cursor(cursor, fingerprint) if cursor else 0
+        except (InvalidQuery, ValueError) as e:
+            message = str(e) if isinstance(e, InvalidQuery) else "'limit' must be a whole number."
+            return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+        
+        search_query = ", ".join(part for part in (city, state, country) if part)
+        try:
+            with stage("geocode"):
+                location = await ageocode(city, state, country)
+        except GeocodingError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        if not location:
+            return Response({"error": f"No results found for '{search_query}'."}, status=404)
+        address = location.get("address", {})
+        state = state or address.get("state", "")
+        country = country or address.get("country", "")
+        bounding_box = location.get("boundingbox", [])
+        if len(bounding_box) < 4:
+            return Response({"error": "Could not retrieve bounding box for the specified location."}, status=404)
+        south, north, west, east = bounding_box
+        
+        # --- Overpass Query (tile cache, only missing tiles are fetched) ---
+        try:
+            with stage("overpass"):
+                elements, data_version = await aget_attraction_elements(south, west, north, east)
+        except OverpassError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        
+        # --- Filter and sort before translating ---
+        with stage("filter"):
+            candidates = []
+            for element in elements:
                 tags = element.get("tags", {})
                 name = tags.get("name:en", tags.get("name", "")).strip()
                 if not name or name.lower() == "unnamed":
                     continue
-                # Only mark for translation if no explicit English name and not clearly English.
-                if "name:en" not in tags and not name.isascii():
-                    if len(name) > SAFE_LEN:
-                        chunks = split_text(name, max_len=SAFE_LEN)
-                        names_to_translate.append(chunks)
-                    else:
-                        names_to_translate.append(name)
-                    indices_to_translate.append(len(processed_attractions))
-                processed_attractions.append({
-                    "element": element,
-                    "name": name  # might be updated
-                })
-            
-            # --- Asynchronous translation using aiohttp with caching and retries ---
-            async def async_translate_text(text, dest='en', retries=5, delay=0.3, session=None):
-                if text in translation_cache:
-                    return translation_cache[text]
-                url = "https://translate.google.com/translate_a/single"
-                params = {
-                    "client": "gtx",
-                    "sl": "auto",
-                    "tl": dest,
-                    "dt": "t",
-                    "q": text,
-                }
-                for attempt in range(retries):
-                    try:
-                        async with session.get(url, params=params) as response:
-                            data = await response.json()
-                            if data and isinstance(data, list) and data[0]:
-                                translated_text = data[0][0][0]
-                                if translated_text:
-                                    translation_cache[text] = translated_text
-                                    return translated_text
-                    except Exception as e:
-                        print(f"Error translating '{text}': {e}, attempt {attempt+1}")
-                        await asyncio.sleep(delay * (2 ** attempt))
-                translation_cache[text] = text
-                return text
-
-            async def process_translation(item, session):
-                if isinstance(item, list):
-                    tasks = [async_translate_text(chunk, session=session) for chunk in item]
-                    translated_chunks = await asyncio.gather(*tasks)
-                    return " ".join(translated_chunks)
-                else:
-                    return await async_translate_text(item, session=session)
-            
-            if names_to_translate:
-                tasks = [process_translation(item, session) for item in names_to_translate]
-                translated_texts = await asyncio.gather(*tasks)
-                for idx, translated in zip(indices_to_translate, translated_texts):
-                    processed_attractions[idx]["name"] = translated
-            
-            # --- Build final attractions list ---
-            attractions = []
-            for item in processed_attractions:
-                element = item["element"]
-                tags = element.get("tags", {})
-                if element["type"] == "node":
-                    lat = element.get("lat")
-                    lon = element.get("lon")
-                else:
-                    center = element.get("center", {})
-                    lat = center.get("lat")
-                    lon = center.get("lon")
-                attractions.append({
-                    "osm_id": element.get("id"),
-                    "type": element["type"],
-                    "name": item["name"],
-                    "tourism": tags.get("tourism") or tags.get("amenity"),
-                    "city": city,
-                    "state": state,
-                    "country": country,
-                    "lat": lat,
-                    "lon": lon,
-                    "tags": tags,
-                })
-            
-            return Response(attractions, status=status.HTTP_200_OK)
+                if not matches_category(tags, categories):
+                    continue
+                lat, lon = element_coords(element)
+                candidates.append({"element": element, "name": name, "lat": lat, "lon": lon})
+
+            with_distance = sort.endswith("distance") or (fields is not None and "distance" in fields)
+            if with_distance:
+                for item in candidates:
+                    item["distance"] = (
+                        round(haversine_miles(location["lat"], location["lon"], item["lat"], item["lon"]), 2)
+                        if item["lat"] is not None else None
+                    )
+            if sort.endswith("name"):
+                # Sorted by the best name OSM has; translation happens after paging.
+                candidates.sort(key=lambda item: (item["name"].casefold(), item["element"].get("id", 0)),
+                                reverse=sort.startswith("-"))
+            elif sort == "distance":
+                candidates.sort(key=lambda item: (item["distance"] is None, item["distance"] or 0))
+            elif sort == "-distance":
+                candidates.sort(key=lambda item: (item["distance"] is None, -(item["distance"] or 0)))
+
+            # --- Page ---
+            total = len(candidates)
+            if paginate:
+                page = candidates[offset:offset + limit]
+                next_cursor = encode_cursor(offset + limit, fingerprint) if offset + limit < total else None
+            else:
+                page = candidates
+
+        # --- Translation of the names on this page only ---
+        # Only translate if no explicit English name and not clearly English.
+        names_to_translate = {
+            item["name"] for item in page
+            if "name:en" not in item["element"].get("tags", {}) and not item["name"].isascii()
+        }
+
+        def build_record(item):
+            element = item["element"]
+            tags = element.get("tags", {})
+            record = {
+                "osm_id": element.get("id"),
+                "type": element["type"],
+                "name": item["name"],
+                "tourism": tags.get("tourism") or tags.get("amenity"),
+                "city": city,
+                "state": state,
+                "country": country,
+                "lat": item["lat"],
+                "lon": item["lon"],
+                "tags": tags,
+            }
+            if with_distance:
+                record["distance"] = item["distance"]
+            return project(record, fields)
+
+        if stream:
+            response = StreamingHttpResponse(stream_records(page, names_to_translate, build_record),
+                                             content_type=NDJSONRenderer.media_type)
+            response["X-Accel-Buffering"] = "no"  # let proxies pass lines through as they come
+            if paginate:
+                response["X-Total-Count"] = str(total)
+                if next_cursor:
+                    response["X-Next-Cursor"] = next_cursor
+            return response
+
+        if names_to_translate:
+            with stage("translate"):
+                translations = await translate_many(names_to_translate)
+            for item in page:
+                item["name"] = translations.get(item["name"], item["name"])
+
+        # Validators from the query, the tile data version and the final names,
+        # checked before any record is built or rendered.
+        etag = make_etag("attractions", sorted(request.query_params.lists()), state, country,
+                         bounding_box, data_version, [item["name"] for item in page])
+        cached = not_modified(request, etag, data_version)
+        if cached:
+            return cached
+
+        def build_body():
+            attractions = [build_record(item) for item in page]
+            return {"count": total, "next": next_cursor, "results": attractions} if paginate else attractions
+
+        # The ETag pins the body, so a repeat of this query reuses the encoded bytes.
+        with stage("encode"):
+            response = Response(encode_cached(etag, build_body), status=status.HTTP_200_OK)
+        return with_validators(response, etag, data_version)
     
     @action(detail=False, methods=['get'], url_path='nearby-cities')
-    def nearby_cities(self, request):
+    async def nearby_cities(self, request):
         """
-        GET /api/itineraries/nearby-cities/?city=LosAngeles&radius=20
+        GET /api/itineraries/nearby-cities/?city=LosAngeles&radius=20&limit=10
 
         This method:
           1) Uses Nominatim to get the latitude and longitude of the given city.
-          2) Uses the Overpass API to find nearby cities (nodes with place=city)
-             within the given radius (converted from miles to meters).
+          2) Finds nearby cities (nodes with place=city) within the given radius
+             (converted from miles to meters) in the in-memory city index, which
+             is filled from the local POI store and, for areas it has not seen
+             yet, from Overpass.
+          3) Returns them nearest first with their great-circle distance in
+             miles; `limit` (or `k`) keeps only the k nearest.
         """
         city = request.query_params.get("city", "").strip()
         radius = request.query_params.get("radius", "").strip()
+        k = request.query_params.get("limit") or request.query_params.get("k")
 
         if not city or not radius:
             return Response({"error": "Both 'city' and 'radius' parameters are required."},
@@ -283,61 +623,58 @@ class ItineraryViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({"error": "'radius' must be a valid number."},
                             status=status.HTTP_400_BAD_REQUEST)
-
-        nominatim_url = "https://nominatim.openstreetmap.org/search"
-        headers = {"User-Agent": "YourAppName/1.0 (https://example.com)"}
-        search_params = {
-            "q": city,
-            "format": "json",
-            "limit": 1
-        }
+        if not 0 < radius < float("inf"):
+            return Response({"error": "'radius' must be a positive number."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if k is not None:
+            try:
+                k = int(k)
+            except ValueError:
+                k = 0
+            if not 1 <= k <= settings.NEARBY_CITIES_MAX_K:
+                return Response({"error": f"'limit' must be between 1 and {settings.NEARBY_CITIES_MAX_K}."},
+                                status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            search_response = requests.get(nominatim_url, params=search_params, headers=headers)
-            if search_response.status_code != 200:
-                return Response({"error": "Error fetching city coordinates from Nominatim"},
-                                status=search_response.status_code)
-            results = search_response.json()
-            if not results:
-                return Response({"error": f"No results found for '{city}'."},
-                                status=status.HTTP_404_NOT_FOUND)
-            lat = results[0].get("lat")
-            lon = results[0].get("lon")
-        except requests.RequestException as e:
-            return Response({"error": f"Nominatim request error: {str(e)}"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        radius_m = radius * 1609.34  # Convert miles to meters.
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        overpass_query = f"""
-        [out:json][timeout:25];
-        (
-          node[place=city](around:{radius_m},{lat},{lon});
-        );
-        out;
-        """
+            with stage("geocode"):
+                location = await ageocode(city)
+        except GeocodingError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        if not location:
+            return Response({"error": f"No results found for '{city}'."},
+                            status=status.HTTP_404_NOT_FOUND)
+        lat = location.get("lat")
+        lon = location.get("lon")
+
+        radius_m = radius * METERS_PER_MILE  # Convert miles to meters.
         try:
-            overpass_response = requests.post(overpass_url, data=overpass_query.encode('utf-8'))
-            if overpass_response.status_code != 200:
-                return Response({"error": "Error fetching nearby cities from Overpass"},
-                                status=overpass_response.status_code)
-            overpass_data = overpass_response.json()
-        except requests.RequestException as e:
-            return Response({"error": f"Overpass request error: {str(e)}"},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            with stage("cities"):
+                matches = await aget_nearby_cities(lat, lon, radius_m, k)
+        except OverpassError as e:
+            return Response({"error": str(e)}, status=e.status_code)
 
         nearby = []
-        for element in overpass_data.get("elements", []):
-            tags = element.get("tags", {})
-            name = tags.get("name:en", tags.get("name", "")).strip()
-            if not name or name.lower() == "unnamed":
-                continue
+        for distance, element in matches:
             nearby.append({
                 "osm_id": element.get("id"),
-                "name": name,
+                "name": city_name(element),
                 "lat": element.get("lat"),
                 "lon": element.get("lon"),
-                "distance": round(radius_m / 1609.34, 2)  # Echo the search radius in miles.
+                "distance": round(distance, 2),  # Great-circle distance in miles.
             })
 
-        return Response(nearby, status=status.HTTP_200_OK)
\ No newline at end of file
+        # The result set is small, so its ids and distances are the version stamp
+        # (the city index itself differs between worker processes).
+        etag = make_etag("nearby-cities", [(city["osm_id"], city["name"], city["distance"]) for city in nearby])
+        return (not_modified(request, etag)
+                or with_validators(Response(nearby, status=status.HTTP_200_OK), etag))
+
+
+def metrics_view(request):
+    """
+    GET /api/metrics/  Prometheus text format: request, stage and upstream
+    histograms and counters, plus the caches' hit/miss stats, for this process.
+    """
+    if not metrics.allowed(request):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
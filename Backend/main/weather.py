@@ -0,0 +1,328 @@
+import sys
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from array import array
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import singleflight
+from .caching import TTLCache
+from .upstream import UpstreamError, arequest_json
+
+# Forecasts are cached per grid cell, so every request for the same area
+# (and the same variable set) shares one upstream fetch until the next
+# model update lands.
+_memory = TTLCache(maxsize=settings.WEATHER_CACHE_SIZE, ttl=settings.WEATHER_UPDATE_INTERVAL)
+
+DEFAULT_PARAMS = {
+    "hourly": "temperature_2m,precipitation,relativehumidity_2m,windspeed_10m,winddirection_10m,weathercode",
+    "daily": "temperature_2m_max,temperature_2m_min,uv_index_max,sunrise,sunset,weathercode",
+    "timezone": "auto",
+    "temperature_unit": "fahrenheit",
+    "forecast_days": 10
+}
+
+# Variables a client may project onto; anything else is rejected so the
+# cache key space stays small.
+HOURLY_VARIABLES = (
+    "temperature_2m", "apparent_temperature", "precipitation", "precipitation_probability",
+    "relativehumidity_2m", "cloudcover", "windspeed_10m", "winddirection_10m", "weathercode",
+)
+DAILY_VARIABLES = (
+    "temperature_2m_max", "temperature_2m_min", "uv_index_max", "sunrise", "sunset",
+    "weathercode", "precipitation_sum", "precipitation_probability_max",
+)
+MAX_FORECAST_DAYS = 16
+
+
+class ForecastError(Exception):
+    """Raised when Open-Meteo cannot be reached or answers with an error."""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def snap(lat, lon, grid=None):
+    """Round coordinates to the centre of their forecast grid cell."""
+    grid = grid or settings.WEATHER_GRID_DEGREES
+    snapped_lat = round(round(float(lat) / grid) * grid, 4)
+    snapped_lon = round(round(float(lon) / grid) * grid, 4)
+    return snapped_lat, snapped_lon
+
+
+def _whole_number(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a whole number.")
+
+
+def build_params(hourly=None, daily=None, days=None, hours=None):
+    """
+    Build the Open-Meteo parameters for a client projection, so only the
+    requested variables and time span are fetched (and cached).
+    `hourly`/`daily` are comma-separated variable lists ("" drops the section),
+    `days` is the number of forecast days, `hours` the number of hourly steps.
+    Raises ValueError for unknown variables or out-of-range numbers.
+    """
+    params = dict(DEFAULT_PARAMS)
+    for section, value, allowed in (("hourly", hourly, HOURLY_VARIABLES),
+                                    ("daily", daily, DAILY_VARIABLES)):
+        if value is None:
+            continue
+        variables = sorted({name.strip() for name in value.split(",") if name.strip()})
+        unknown = [name for name in variables if name not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown {section} variable(s): {', '.join(unknown)}")
+        if variables:
+            params[section] = ",".join(variables)
+        else:
+            params.pop(section)
+
+    if days is not None:
+        days = _whole_number(days, "days")
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            raise ValueError(f"'days' must be between 1 and {MAX_FORECAST_DAYS}.")
+        params["forecast_days"] = days
+    if hours is not None:
+        hours = _whole_number(hours, "hours")
+        if not 1 <= hours <= params["forecast_days"] * 24:
+            raise ValueError("'hours' must be between 1 and 24 * days.")
+        params["forecast_hours"] = hours
+    return params
+
+
+def seconds_until_refresh(now=None):
+    """
+    Seconds until the next Open-Meteo model update is expected to be served.
+    Updates land every WEATHER_UPDATE_INTERVAL seconds, WEATHER_UPDATE_OFFSET
+    seconds after the interval boundary.
+    """
+    now = time.time() if now is None else now
+    interval = settings.WEATHER_UPDATE_INTERVAL
+    offset = settings.WEATHER_UPDATE_OFFSET
+    remaining = interval - ((now - offset) % interval)
+    return max(int(remaining), 1)
+
+
+def cache_key(lat, lon, params):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"forecast:{lat}:{lon}:{digest}"
+
+
+async def _afetch(cells, params):
+    """
+    Fetch forecasts for several grid cells with one Open-Meteo call (the API
+    takes comma-separated coordinate lists). Returns one forecast per cell.
+    """
+    try:
+        status_code, data = await arequest_json(
+            "open_meteo", "GET", "/v1/forecast",
+            params={
+                "latitude": ",".join(str(lat) for lat, _ in cells),
+                "longitude": ",".join(str(lon) for _, lon in cells),
+                **params,
+            })
+    except UpstreamError as e:
+        raise ForecastError(str(e), e.status_code)
+    if status_code != 200 or data is None:
+        reason = data.get("reason") if isinstance(data, dict) else None
+        raise ForecastError(reason or "Error fetching forecast", status_code)
+    # A single location comes back as an object, several as a list.
+    return data if isinstance(data, list) else [data]
+
+
+async def _afetch_entries(cells, keys, params):
+    """Fetch cells in as few upstream calls as possible and store them in both caches."""
+    batch_size = settings.WEATHER_BATCH_SIZE
+    batches = [cells[i:i+batch_size] for i in range(0, len(cells), batch_size)]
+    results = await asyncio.gather(*[_afetch(batch, params) for batch in batches])
+    ttl = seconds_until_refresh()
+    fetched_at = time.time()
+    fresh = {}
+    for batch, forecasts in zip(batches, results):
+        for cell, data in zip(batch, forecasts):
+            fresh[cell] = {"data": data, "fetched_at": fetched_at}
+            _memory.set(keys[cell], fresh[cell], ttl=ttl)
+    if fresh:
+        await cache.aset_many({keys[cell]: entry for cell, entry in fresh.items()}, ttl)
+    return fresh
+
+
+async def _ashared_entries(cells, keys):
+    """Entries another process has stored for all of `cells`, or None until it has."""
+    found = await cache.aget_many([keys[cell] for cell in cells])
+    if len(found) < len(cells):
+        return None
+    ttl = seconds_until_refresh()
+    for key, entry in found.items():
+        _memory.set(key, entry, ttl=ttl)
+    return {cell: found[keys[cell]] for cell in cells}
+
+
+async def _alead(cells, keys, params):
+    """
+    Fetch the cells this process leads. With SINGLEFLIGHT_LOCK on, cells
+    another process is already fetching are read from the shared cache once
+    it has stored them (or fetched here if that takes too long).
+    """
+    if not singleflight.lock_enabled():
+        return await _afetch_entries(cells, keys, params)
+    locked = await asyncio.gather(*[singleflight.alock(keys[cell]) for cell in cells])
+    ours = [cell for cell, acquired in zip(cells, locked) if acquired]
+    theirs = [cell for cell, acquired in zip(cells, locked) if not acquired]
+    try:
+        entries = await _afetch_entries(ours, keys, params) if ours else {}
+    finally:
+        for cell in ours:
+            await singleflight.aunlock(keys[cell])
+    if theirs:
+        shared = await singleflight.await_shared(lambda: _ashared_entries(theirs, keys))
+        entries.update(shared or await _afetch_entries(theirs, keys, params))
+    return entries
+
+
+async def _afill(cells, keys, params):
+    """
+    Resolve cache misses. Each cell is claimed in the single-flight table:
+    cells already being fetched by another request are waited on, the rest
+    are fetched here (batched) and handed to anyone waiting on them.
+    """
+    claims = {cell: singleflight.claim(keys[cell]) for cell in cells}
+    leading = [cell for cell in cells if claims[cell][1]]
+
+    async def lead():
+        if not leading:
+            return {}
+        try:
+            entries = await _alead(leading, keys, params)
+        except asyncio.CancelledError:
+            for cell in leading:
+                singleflight.release(keys[cell], claims[cell][0], error=singleflight.LeaderGone())
+            raise
+        except BaseException as e:
+            for cell in leading:
+                singleflight.release(keys[cell], claims[cell][0], error=e)
+            raise
+        for cell in leading:
+            singleflight.release(keys[cell], claims[cell][0], entries.get(cell))
+        return entries
+
+    async def follow(cell):
+        try:
+            entry = await singleflight.follow(claims[cell][0])
+        except singleflight.LeaderGone:
+            entry = None
+        if entry is None:
+            entry = (await _afetch_entries([cell], keys, params))[cell]
+        return {cell: entry}
+
+    entries = {}
+    for found in await asyncio.gather(lead(), *[follow(cell) for cell in cells if not claims[cell][1]]):
+        entries.update(found)
+    return entries
+
+
+async def aget_entries(points, params=None):
+    """
+    Return the cache entries ({"data": forecast, "fetched_at": timestamp}) for
+    a list of (lat, lon) points. Points in the same grid cell share an entry; cells missing from the
+    memory and shared caches are fetched in as few upstream calls as possible,
+    and a cell another request is already fetching is waited on, not refetched.
+    """
+    params = dict(params or DEFAULT_PARAMS)
+    cells = [snap(lat, lon) for lat, lon in points]
+    keys = {cell: cache_key(*cell, params) for cell in dict.fromkeys(cells)}
+    entries = {}
+    for cell, key in keys.items():
+        entry = _memory.get(key)
+        if entry is not None:
+            entries[cell] = entry
+
+    unresolved = {keys[cell]: cell for cell in keys if cell not in entries}
+    if unresolved:
+        ttl = seconds_until_refresh()
+        for key, entry in (await cache.aget_many(list(unresolved))).items():
+            _memory.set(key, entry, ttl=ttl)
+            entries[unresolved[key]] = entry
+
+    missing = [cell for cell in keys if cell not in entries]
+    if missing:
+        entries.update(await _afill(missing, keys, params))
+
+    return [entries[cell] for cell in cells]
+
+
+async def aget_forecasts(points, params=None):
+    """Return [(forecast, age_in_seconds), ...] for a list of (lat, lon) points; see `aget_entries`."""
+    entries = await aget_entries(points, params)
+    now = time.time()
+    return [(entry["data"], int(now - entry["fetched_at"])) for entry in entries]
+
+
+async def aget_forecast(lat, lon, params=None):
+    """
+    Return (forecast, age_in_seconds) for the grid cell containing lat/lon.
+    Checks the in-process cache, then the shared Django cache, then Open-Meteo.
+    """
+    return (await aget_forecasts([(lat, lon)], params))[0]
+
+
+def _pack(values):
+    """Pack numbers as base64 little-endian float32; missing values become NaN."""
+    packed = array("f", (float("nan") if value is None else float(value) for value in values))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+def _columnar(section):
+    """
+    Encode one Open-Meteo section ({"time": [...], var: [...]}) as a shared
+    time base (start, step in seconds, count) plus packed numeric columns.
+    Non-numeric columns (e.g. sunrise) are kept as plain lists.
+    """
+    times = section.get("time", [])
+    block = {"start": times[0] if times else None, "step": None, "count": len(times),
+             "values": {}, "text": {}}
+    if len(times) > 1:
+        try:
+            parsed = [datetime.fromisoformat(t) for t in times]
+            steps = {int((b - a).total_seconds()) for a, b in zip(parsed, parsed[1:])}
+        except (TypeError, ValueError):
+            steps = set()
+        if len(steps) == 1:
+            block["step"] = steps.pop()
+        else:
+            block["time"] = times  # irregular or unparseable series: keep explicit timestamps
+    for name, values in section.items():
+        if name == "time":
+            continue
+        if all(value is None or isinstance(value, (int, float)) for value in values):
+            block["values"][name] = _pack(values)
+        else:
+            block["text"][name] = values
+    return block
+
+
+def compact(forecast):
+    """
+    Compact columnar encoding of a forecast: metadata as-is, each of hourly
+    and daily as a shared time base with float32 columns (see `_columnar`).
+    """
+    encoded = {key: value for key, value in forecast.items() if key not in ("hourly", "daily")}
+    encoded["encoding"] = "columnar-f32le-base64"
+    for section in ("hourly", "daily"):
+        if section in forecast:
+            encoded[section] = _columnar(forecast[section])
+    return encoded
+
+
+def stats():
+    return {"memory": _memory.stats()}
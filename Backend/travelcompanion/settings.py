@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'main',
     'users',
@@ -28,6 +29,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.server_timing_middleware',  # outermost of ours: times compression too
+    'main.middleware.CompressionMiddleware',  # before anything that reads or changes the body
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -38,6 +41,7 @@ MIDDLEWARE = [
 
 # Configure CORS (allow frontend app’s origin)
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['Server-Timing', 'X-Total-Count', 'X-Next-Cursor']
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # or 8080, or your actual frontend domain
 ]
@@ -61,6 +65,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'travelcompanion.wsgi.application'
+ASGI_APPLICATION = 'travelcompanion.asgi.application'  # preferred: the external-data views are async
 
 DATABASES = {
     'default': {
@@ -102,13 +107,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework & JWT Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'main.renderers.FastJSONRenderer',  # orjson when installed, else the stdlib encoder
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Response encoding: encoded bodies kept by version stamp (ETag) so repeat
+# responses skip building and serializing, and negotiated br/gzip compression.
+ENCODED_RESPONSE_CACHE_SIZE = int(os.getenv('ENCODED_RESPONSE_CACHE_SIZE', 64))
+ENCODED_RESPONSE_CACHE_TTL = int(os.getenv('ENCODED_RESPONSE_CACHE_TTL', 60 * 10))  # seconds
+ENCODED_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('ENCODED_RESPONSE_CACHE_MAX_BYTES', 2 * 1024 * 1024))
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # bytes; smaller bodies are sent as-is
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSION_CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', 64))
+COMPRESSION_CACHE_TTL = int(os.getenv('COMPRESSION_CACHE_TTL', 60 * 10))  # seconds
+
+# Prometheus-format metrics at /api/metrics/ (per process). With METRICS_TOKEN
+# set, scrapers send it as a bearer token; otherwise only these addresses may scrape.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
 # Add SimpleJWT settings:
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
@@ -117,4 +142,162 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,  # Optional: Blacklists old refresh tokens after rotation
 }
 
+# Authenticated users are cached (users/authentication.py) for at most the
+# access token's lifetime; saving or deleting a user drops its entry. Without
+# REDIS_URL the cache is per process and that only reaches one worker, so
+# entries then live at most AUTH_USER_LOCAL_CACHE_TTL seconds (0 turns it off).
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds()))
+AUTH_USER_LOCAL_CACHE_TTL = int(os.getenv('AUTH_USER_LOCAL_CACHE_TTL', 5))
+
+# Geocoding cache: in-process LRU in front of the GeocodeCache table.
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', 2048))
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 60 * 60 * 24))  # seconds in memory
+GEOCODE_DB_TTL = int(os.getenv('GEOCODE_DB_TTL', 60 * 60 * 24 * 30))  # seconds in the database
+GEOCODE_NEGATIVE_TTL = int(os.getenv('GEOCODE_NEGATIVE_TTL', 60 * 60))  # seconds a query with no match is remembered
+
+# Translation cache: bounded in-process LRU in front of the TranslationCache table.
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', 10000))
+TRANSLATION_CACHE_TTL = int(os.getenv('TRANSLATION_CACHE_TTL', 60 * 60 * 24))  # seconds in memory
+TRANSLATION_CONCURRENCY = int(os.getenv('TRANSLATION_CONCURRENCY', 4))  # batch requests in flight per API request
+# Local translation index: OSM name:* tags from ingested extracts and from every
+# Overpass response (indexed by a background thread, not the request) map native
+# names, and words seen in at least TRANSLATION_TOKEN_MIN_SUPPORT of them, to
+# English before the API is asked.
+TRANSLATION_TOKEN_MIN_SUPPORT = int(os.getenv('TRANSLATION_TOKEN_MIN_SUPPORT', 3))
+TRANSLATION_TOKEN_RELOAD = int(os.getenv('TRANSLATION_TOKEN_RELOAD', 5 * 60))  # seconds before learned words are re-read
+TRANSLATION_INDEX_QUEUE_SIZE = int(os.getenv('TRANSLATION_INDEX_QUEUE_SIZE', 256))  # responses waiting to be indexed
+TRANSLATION_LEARN_INTERVAL = int(os.getenv('TRANSLATION_LEARN_INTERVAL', 10 * 60))  # min seconds between re-learning words
+
+# Upstream hosts: each gets its own keep-alive connection pool (see main/upstream.py).
+# Timeouts are in seconds; base URLs can be pointed at mirrors or local stand-ins.
+# rate/burst: token bucket per process (requests per second / saved-up requests);
+# max_queue_wait: longest a call waits for a token before failing fast with 503.
+# failure_threshold/reset_timeout: consecutive failures that open the circuit, and
+# seconds it stays open. retries: extra attempts for timeouts, connection errors,
+# 429 and 5xx, spaced by full-jitter backoff between 0 and min(backoff_cap, backoff_base * 2**n).
+UPSTREAM_USER_AGENT = os.getenv('UPSTREAM_USER_AGENT', 'YourAppName/1.0 (https://example.com)')
+UPSTREAMS = {
+    'nominatim': {
+        'base_url': os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org'),
+        'max_connections': int(os.getenv('NOMINATIM_MAX_CONNECTIONS', 2)),
+        'connect_timeout': 5,
+        'timeout': 10,
+        'headers': {'User-Agent': UPSTREAM_USER_AGENT},
+        'rate': float(os.getenv('NOMINATIM_RATE', 1)),  # usage policy: max 1 request per second
+        'burst': 1,
+        'max_queue_wait': 5,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+        'retries': 1,
+        'backoff_base': 0.5,
+        'backoff_cap': 4,
+    },
+    'overpass': {
+        'base_url': os.getenv('OVERPASS_URL', 'https://overpass-api.de'),
+        'max_connections': int(os.getenv('OVERPASS_MAX_CONNECTIONS', 4)),
+        'connect_timeout': 5,
+        'timeout': 30,
+        'headers': {'User-Agent': UPSTREAM_USER_AGENT},
+        'rate': float(os.getenv('OVERPASS_RATE', 2)),
+        'burst': 4,
+        'max_queue_wait': 10,
+        'failure_threshold': 5,
+        'reset_timeout': 60,
+        'retries': 1,
+        'backoff_base': 1,
+        'backoff_cap': 8,
+    },
+    'open_meteo': {
+        'base_url': os.getenv('OPEN_METEO_URL', 'https://api.open-meteo.com'),
+        'max_connections': int(os.getenv('OPEN_METEO_MAX_CONNECTIONS', 20)),
+        'connect_timeout': 5,
+        'timeout': 10,
+        'headers': {'User-Agent': UPSTREAM_USER_AGENT},
+        'rate': float(os.getenv('OPEN_METEO_RATE', 10)),
+        'burst': 20,
+        'max_queue_wait': 5,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+        'retries': 2,
+        'backoff_base': 0.3,
+        'backoff_cap': 3,
+    },
+    'translate': {
+        'base_url': os.getenv('TRANSLATE_URL', 'https://translate.google.com'),
+        'max_connections': int(os.getenv('TRANSLATE_MAX_CONNECTIONS', 20)),
+        'connect_timeout': 5,
+        'timeout': 15,
+        'headers': {},
+        'rate': float(os.getenv('TRANSLATE_RATE', 10)),
+        'burst': 20,
+        'max_queue_wait': 10,
+        'failure_threshold': 10,
+        'reset_timeout': 30,
+        'retries': 2,
+        'backoff_base': 0.3,
+        'backoff_cap': 3,
+    },
+}
+
+# Shared cache for short-lived upstream data (forecasts, etc.). Set REDIS_URL so
+# every worker process shares it; without it each process keeps its own copy.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+# Request coalescing (main/singleflight.py): identical concurrent upstream calls in a
+# process always share one request. With SINGLEFLIGHT_LOCK, processes also take a
+# lock in the shared cache so only one of them fetches; it defaults on with Redis.
+SINGLEFLIGHT_LOCK = os.getenv('SINGLEFLIGHT_LOCK', '1' if os.getenv('REDIS_URL') else '0') == '1'
+SINGLEFLIGHT_LOCK_TIMEOUT = int(os.getenv('SINGLEFLIGHT_LOCK_TIMEOUT', 30))  # seconds before a lock expires
+SINGLEFLIGHT_LOCK_WAIT = float(os.getenv('SINGLEFLIGHT_LOCK_WAIT', 10))  # seconds to wait for another process
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv('SINGLEFLIGHT_POLL_INTERVAL', 0.1))
+
+# Weather cache: forecasts are keyed by grid cell and expire when Open-Meteo
+# publishes the next model run.
+WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', 4096))
+WEATHER_GRID_DEGREES = float(os.getenv('WEATHER_GRID_DEGREES', 0.1))  # ~11 km, close to the model grid
+WEATHER_UPDATE_INTERVAL = int(os.getenv('WEATHER_UPDATE_INTERVAL', 60 * 60))  # seconds between model updates
+WEATHER_UPDATE_OFFSET = int(os.getenv('WEATHER_UPDATE_OFFSET', 10 * 60))  # seconds after the boundary new data is served
+WEATHER_BATCH_SIZE = int(os.getenv('WEATHER_BATCH_SIZE', 50))  # coordinates per Open-Meteo call
+WEATHER_BATCH_MAX_CITIES = int(os.getenv('WEATHER_BATCH_MAX_CITIES', 50))  # cities per /weather/batch/ request
+
+# Itinerary list pagination (only used when the client sends limit/cursor).
+ITINERARIES_PAGE_SIZE = int(os.getenv('ITINERARIES_PAGE_SIZE', 50))
+ITINERARIES_MAX_PAGE_SIZE = int(os.getenv('ITINERARIES_MAX_PAGE_SIZE', 200))
+
+# Itinerary events bulk endpoint.
+ITINERARY_EVENTS_BULK_MAX = int(os.getenv('ITINERARY_EVENTS_BULK_MAX', 1000))  # events per request
+ITINERARY_EVENTS_BATCH_SIZE = int(os.getenv('ITINERARY_EVENTS_BATCH_SIZE', 200))  # rows per INSERT/UPDATE
+
+# `manage.py prewarm`: destinations of trips starting within this many days.
+PREWARM_WINDOW_DAYS = int(os.getenv('PREWARM_WINDOW_DAYS', 3))
+PREWARM_CONCURRENCY = int(os.getenv('PREWARM_CONCURRENCY', 4))  # destinations warmed at once
+
+# Itinerary import/export.
+ITINERARY_IMPORT_MAX = int(os.getenv('ITINERARY_IMPORT_MAX', 10000))  # itineraries per import
+ITINERARY_IMPORT_BATCH_SIZE = int(os.getenv('ITINERARY_IMPORT_BATCH_SIZE', 500))  # validated/inserted together
+ITINERARY_EXPORT_CHUNK_SIZE = int(os.getenv('ITINERARY_EXPORT_CHUNK_SIZE', 500))  # rows read per query
+
+# Attractions pagination (only used when the client sends limit/cursor).
+ATTRACTIONS_PAGE_SIZE = int(os.getenv('ATTRACTIONS_PAGE_SIZE', 50))
+ATTRACTIONS_MAX_PAGE_SIZE = int(os.getenv('ATTRACTIONS_MAX_PAGE_SIZE', 200))
+
+# Overpass tile cache for attraction searches.
+OVERPASS_TILE_DEGREES = float(os.getenv('OVERPASS_TILE_DEGREES', 0.25))
+OVERPASS_TILE_TTL = int(os.getenv('OVERPASS_TILE_TTL', 60 * 60 * 24))  # seconds
+OVERPASS_TILE_CACHE_SIZE = int(os.getenv('OVERPASS_TILE_CACHE_SIZE', 1024))  # tiles kept in memory
+OVERPASS_TILE_CONCURRENCY = int(os.getenv('OVERPASS_TILE_CONCURRENCY', 4))  # tile queries in flight
+OVERPASS_MAX_TILES = int(os.getenv('OVERPASS_MAX_TILES', 16))  # larger boxes are fetched in one piece, snapped to the coarse grid
+OVERPASS_MAX_TILE_FETCHES = int(os.getenv('OVERPASS_MAX_TILE_FETCHES', 4))  # so are boxes missing more tiles (the Overpass burst)
+OVERPASS_COARSE_DEGREES = float(os.getenv('OVERPASS_COARSE_DEGREES', 0.5))  # grid for those boxes' cache keys
 
+# In-memory city index for nearby-city searches (k-d tree over known cities).
+CITY_INDEX_AREAS = int(os.getenv('CITY_INDEX_AREAS', 256))  # searched areas remembered as fully known
+CITY_INDEX_TTL = int(os.getenv('CITY_INDEX_TTL', 60 * 60 * 24))  # seconds an area stays known
+CITY_INDEX_REFRESH = int(os.getenv('CITY_INDEX_REFRESH', 60 * 60))  # seconds between reloads from the POI store
+NEARBY_CITIES_MAX_K = int(os.getenv('NEARBY_CITIES_MAX_K', 500))
@@ -0,0 +1,81 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from main.caching import shared_cache
+
+_counters = {"hits": 0, "misses": 0}
+
+
+def cache_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def invalidate(user_id):
+    """Drop a cached user, so the next request reloads it from the database."""
+    cache.delete(cache_key(user_id))
+
+
+def cache_ttl():
+    """
+    Seconds a user may stay cached. Invalidation only reaches the process
+    that saved the user unless the cache is shared, so a per-process cache
+    keeps entries for at most AUTH_USER_LOCAL_CACHE_TTL (0 disables it).
+    """
+    if shared_cache():
+        return settings.AUTH_USER_CACHE_TTL
+    return min(settings.AUTH_USER_CACHE_TTL, settings.AUTH_USER_LOCAL_CACHE_TTL)
+
+
+def stats():
+    """Hit/miss counters for the authenticated-user cache."""
+    return dict(_counters)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the resolved user in the Django cache for at
+    most the access token's remaining lifetime, instead of loading the User
+    row on every request. Saving or deleting a user drops its entry (see
+    users.signals). With a shared cache (Redis) that reaches every worker, so
+    deactivation and password changes apply immediately; with a per-process
+    cache other workers may serve the old copy for up to
+    AUTH_USER_LOCAL_CACHE_TTL seconds. The active and revoked-password checks
+    still run against every token.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = cache_key(user_id)
+        max_ttl = cache_ttl()
+        user = cache.get(key) if max_ttl > 0 else None
+        if user is None:
+            _counters["misses"] += 1
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            ttl = min(max_ttl, int(validated_token.get("exp", 0) - time.time()))
+            if ttl > 0:
+                cache.set(key, user, ttl)
+        else:
+            _counters["hits"] += 1
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
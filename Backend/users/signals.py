@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import invalidate
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    # Any save may change is_active or the password hash, which the cached copy
+    # would otherwise keep serving until it expires. QuerySet.update() sends no
+    # signal: call users.authentication.invalidate() after bulk updates.
+    invalidate(getattr(instance, api_settings.USER_ID_FIELD))
@@ -1,3 +1,57 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication
+from .authentication import CachedJWTAuthentication
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", password="s3cret-pass")
+        self.token = AccessToken.for_user(self.user)
+        self.auth = CachedJWTAuthentication()
+
+    def shared_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name,
+        }})
+
+    def test_shared_cache_serves_repeat_requests(self):
+        with self.shared_cache():
+            self.auth.get_user(self.token)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.auth.get_user(self.token), self.user)
+            self.assertEqual(authentication.cache_ttl(), settings.AUTH_USER_CACHE_TTL)
+
+    def test_deactivation_applies_to_the_next_request(self):
+        with self.shared_cache():
+            self.auth.get_user(self.token)
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNone(cache.get(authentication.cache_key(self.user.id)))
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.get_user(self.token)
+
+    @override_settings(CACHES=LOCAL_CACHE, AUTH_USER_LOCAL_CACHE_TTL=5)
+    def test_per_process_cache_keeps_users_briefly(self):
+        self.assertEqual(authentication.cache_ttl(), 5)
+        self.auth.get_user(self.token)
+        with self.assertNumQueries(0):
+            self.auth.get_user(self.token)
+
+    @override_settings(CACHES=LOCAL_CACHE, AUTH_USER_LOCAL_CACHE_TTL=0)
+    def test_per_process_cache_can_be_turned_off(self):
+        self.auth.get_user(self.token)
+        with self.assertNumQueries(1):
+            self.auth.get_user(self.token)
+        self.assertIsNone(cache.get(authentication.cache_key(self.user.id)))